@@ -17,16 +17,16 @@ import weakref
 import datetime
 import logging
 import warnings
-import collections
 from .core import _BaseKeyword, _BaseService
 from ..exc import CauldronWarning
 from ..utils.callbacks import Callbacks
 from ..utils.helpers import api_not_required, api_not_implemented, api_required, api_override
+from ..logger import TRACE
+from ..config import get_configuration
+from .history import KeywordHistory, HistorySlice
 
 __all__ = ['Keyword', 'Service', 'HistorySlice']
 
-HistorySlice = collections.namedtuple("HistorySlice", ["time", "binary", "ascii", "name"])
-
 class Keyword(_BaseKeyword):
     """A client-side KTL keyword object.
     
@@ -66,7 +66,7 @@ class Keyword(_BaseKeyword):
     def __init__(self, service, name, type=None):
         super(Keyword, self).__init__(service, name, type)
         self._callbacks = Callbacks()
-        self.history = collections.deque(maxlen=5)
+        self._history = None
         self._units = None
         self._prepare()
         
@@ -113,6 +113,14 @@ class Keyword(_BaseKeyword):
         """Get the units for this keyword."""
         pass
         
+    def _receive_units(self, units):
+        """Store the units for this keyword, once they arrive from the dispatcher.
+        
+        Keyword types which use the units to carry other information (e.g. enumerators) override this method
+        to process that information once, instead of on every access.
+        """
+        self._units = units
+        
     def _ktl_binary(self):
         """Return the binary value (Native python type.)"""
         return self.cast(self._ktl_value())
@@ -222,13 +230,22 @@ class Keyword(_BaseKeyword):
         """
         pass # pragma: no cover
     
+    @property
+    def history(self):
+        """Recent values of this keyword, as a :class:`~Cauldron.base.history.KeywordHistory`."""
+        if self._history is None:
+            self._history = KeywordHistory(self.service._config.getint("history", "client"),
+                getattr(self, 'KTL_TYPE', None), self.name)
+        return self._history
+    
     def _update(self, value):
         """An internal callback to handle value updates."""
-        self._last_read = datetime.datetime.now()
+        now = time.time()
+        self._last_read = datetime.datetime.fromtimestamp(now)
         if self._last_value != value:
-            self.log.trace("{0}._update({1!r})".format(self.full_name, value))
+            self.log.lazy(TRACE, "{0}._update({1!r})", self.full_name, value)
             self._last_value = value
-            self.history.append(HistorySlice(self._last_read.time(), self._ktl_binary(), self._ktl_ascii(), self.name))
+            self.history.append(now, self._ktl_ascii(), self._ktl_binary())
             self.propagate()
         
 
@@ -253,6 +270,7 @@ class Service(_BaseService):
     
     def __init__(self, name, populate=False):
         super(Service, self).__init__(name=name)
+        self._config = get_configuration()
         self._keywords = {}
         self.log = logging.getLogger("ktl.Service.{0}".format(self.name))
         self._prepare()
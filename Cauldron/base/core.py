@@ -18,7 +18,7 @@ from ..utils.callbacks import WeakMethod
 from ..utils.referencecompat import ReferenceError
 from ..utils.helpers import _inherited_docstring
 from ..exc import TimeoutError
-from ..logger import KeywordMessageFilter
+from ..logger import KeywordLogger, TRACE
 
 from astropy.utils.misc import InheritDocstrings
 
@@ -125,11 +125,10 @@ class _BaseKeyword(object):
     
     _ALLOWED_KEYS = None
     
-    service = None
-    """The parent :class:`Service` object for this keyword."""
-    
-    _name = "?name?"
-    """Default name for this class."""
+    # Attributes used by every keyword are kept in slots. Other attributes still work,
+    # and are stored in an instance dictionary which is only created when it is used.
+    # ``service`` is the parent :class:`Service` object for this keyword.
+    __slots__ = ('service', '_name', '_last_value', '_last_read', '_reading', '_acting', '_log', '__dict__', '__weakref__')
     
     def __init__(self, service, name, type=None):
         super(_BaseKeyword, self).__init__()
@@ -140,12 +139,23 @@ class _BaseKeyword(object):
         self._last_read = None
         self._reading = False
         self._acting = False
+        self._log = None
         if type is not None:
             self._type = type
-        self.log = self.service.log.getChild(name)
-        self.log.addFilter(KeywordMessageFilter(self))
         
-            
+    @property
+    def log(self):
+        """The logger for this keyword, which adds keyword context to the service's logger, and is created when it is first used."""
+        if self._log is None:
+            self._log = KeywordLogger(self.service.log, self)
+        return self._log
+    
+    @log.setter
+    def log(self, value):
+        """Set the logger for this keyword."""
+        self._log = value
+        
+    
     def _type(self, value):
         """When in doubt, just stringify."""
         return str(value)
@@ -199,9 +209,10 @@ class _BaseKeyword(object):
     
     def _current_value(self, both=False, binary=False):
         """Respond with the current value."""
-        self.service.log.trace("{0!r}._current_value(both={1},binary={2}) = {3!r}".format(
-            self, both, binary, self._ktl_value()
-        ))
+        if self.service.log.isEnabledFor(TRACE):
+            self.service.log.trace("{0!r}._current_value(both={1},binary={2}) = {3!r}".format(
+                self, both, binary, self._ktl_value()
+            ))
         if both:
             return (self._ktl_binary(), self._ktl_ascii())
         if binary:
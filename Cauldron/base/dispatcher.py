@@ -11,7 +11,6 @@ import six
 import weakref
 import logging
 import warnings
-import collections
 import time
 import threading
 
@@ -22,11 +21,15 @@ from ..config import read_configuration
 from ..exc import CauldronAPINotImplemented, NoWriteNecessary, WrongDispatcher, CauldronWarning
 from ..utils.helpers import api_not_required, api_not_implemented, api_required, api_override
 from ..utils.callbacks import Callbacks
+from .history import KeywordHistory
+from .. import metrics
 from ..api import STRICT_KTL_XML
 from .. import registry
 
 __all__ = ['Keyword', 'Service']
 
+# Guards the lazy creation of keyword locks, so that two threads can't create different locks for one keyword.
+_lock_creation = threading.Lock()
 
 
 class Keyword(_BaseKeyword):
@@ -34,15 +37,20 @@ class Keyword(_BaseKeyword):
     
     _ALLOWED_KEYS = set(['value', 'name', 'readonly', 'writeonly'])
     
+    # The lock, callbacks and history are only created when they are first used. The first value
+    # is kept in _history_first, and only moves into a history buffer when a second value is set.
+    __slots__ = ('_rlock', '_callback_list', '_history_buffer', '_history_first', 'writeonly', 'readonly', '_period', '_units', 'initial')
+    
     def __init__(self, name, service, initial=None, period=None):
         name = str(name).upper()
         super(Keyword, self).__init__(name=name, service=service)
         if service.get(name, None) is not None:
             raise ValueError("keyword named '%s' already exists." % name)
         self._acting = False
-        self._lock = threading.RLock()
-        self._callbacks = Callbacks()
-        self._history = collections.deque(maxlen=100)
+        self._rlock = None
+        self._callback_list = None
+        self._history_buffer = None
+        self._history_first = None
         self.writeonly = False
         self.readonly = False
         self._period = None
@@ -61,6 +69,46 @@ class Keyword(_BaseKeyword):
         
         service[self.name] = self
     
+    @property
+    def _lock(self):
+        """A re-entrant lock for this keyword."""
+        if self._rlock is None:
+            with _lock_creation:
+                if self._rlock is None:
+                    self._rlock = threading.RLock()
+        return self._rlock
+    
+    @property
+    def _callbacks(self):
+        """Functions to call when this keyword is set."""
+        if self._callback_list is None:
+            self._callback_list = Callbacks()
+        return self._callback_list
+    
+    @property
+    def history(self):
+        """Recent values of this keyword, as a :class:`~Cauldron.base.history.KeywordHistory`."""
+        if self._history_buffer is None:
+            with _lock_creation:
+                if self._history_buffer is None:
+                    history = KeywordHistory(self.service._config.getint("history", "dispatcher"),
+                        getattr(self, 'KTL_TYPE', None), self.name)
+                    if self._history_first is not None:
+                        history.append(*self._history_first)
+                        self._history_first = None
+                    self._history_buffer = history
+        return self._history_buffer
+    
+    def _record(self, value):
+        """Record a new value in the history of this keyword."""
+        now = time.time()
+        if self._history_buffer is None:
+            with _lock_creation:
+                if self._history_buffer is None and self._history_first is None:
+                    self._history_first = (now, value)
+                    return
+        self.history.append(now, value)
+    
     def __contains__(self, value):
         
         if self.value == None:
@@ -83,6 +131,8 @@ class Keyword(_BaseKeyword):
         """Register a function to be called whenever this keyword is
         set to a new value."""
         if remove:
+            if self._callback_list is None:
+                return
             return self._callbacks.discard(function)
         self._callbacks.add(function)
         
@@ -121,7 +171,7 @@ class Keyword(_BaseKeyword):
         
         self.check(value)
         
-        self._history.append((value, time.time()))
+        self._record(value)
         self.value = value
         
         if value != None:
@@ -188,10 +238,10 @@ class Keyword(_BaseKeyword):
     
     def _propogate(self):
         """Propagate the change to any waiting callbacks."""
-        if not self._acting:
+        if not self._acting and self._callback_list is not None:
             try:
                 self._acting = True
-                self._callbacks(self)
+                self._callback_list(self)
             finally:
                 self._acting = False
         
@@ -335,6 +385,9 @@ class Service(_BaseService):
         
         self._begin()
         
+        if self._config.getboolean("metrics", "enable") and self.name.upper() != self._config.get("metrics", "service").upper():
+            metrics.publish("{0}_{1}".format(self.name, self.dispatcher), self._config)
+        
     @abc.abstractmethod
     def _begin(self):
         """Implementation-dependent startup tasks should be handled here. This method is called
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Keyword history, kept in a ring buffer of NumPy arrays, one for each column.
+
+Each entry records the time a keyword value was set, its ascii value (as an index into a table of interned strings) and, for numeric keyword types, its binary value. Windows of the history are selected by time, and can be downsampled or summarized without iterating over entries in Python.
+"""
+from __future__ import absolute_import
+
+import time
+import datetime
+import threading
+import collections
+
+import numpy as np
+
+__all__ = ['KeywordHistory', 'HistoryWindow', 'HistorySlice']
+
+HistorySlice = collections.namedtuple("HistorySlice", ["time", "binary", "ascii", "name"])
+
+HISTORY_DTYPES = {
+    'boolean' : np.bool_,
+    'integer' : np.int64,
+    'enumerated' : np.int64,
+    'double' : np.float64,
+    'float' : np.float64,
+}
+"""NumPy types used to store binary values, by KTL type. Other keyword types only store ascii values."""
+
+_CASTS = {
+    np.bool_ : lambda value : value == '1',
+    np.int64 : lambda value : int(float(value)),
+    np.float64 : float,
+}
+
+#: Entries allocated when a history is first used. The buffer doubles in size until it reaches its full size.
+INITIAL_ENTRIES = 4
+
+def _timestamp(value):
+    """Convert a time to seconds since the epoch."""
+    if isinstance(value, datetime.datetime):
+        return time.mktime(value.timetuple()) + value.microsecond * 1e-6
+    return float(value)
+
+class HistoryWindow(object):
+    """A copy of the entries of a keyword history, in time order."""
+
+    def __init__(self, time, codes, strings, binary, valid=None):
+        super(HistoryWindow, self).__init__()
+        self.time = time
+        self.binary = binary
+        self.valid = valid
+        self._codes = codes
+        self._strings = strings
+
+    def __repr__(self):
+        return "<{0} entries={1:d}>".format(self.__class__.__name__, len(self))
+
+    def __len__(self):
+        return len(self.time)
+
+    @property
+    def ascii(self):
+        """The ascii values in this window."""
+        if self._codes is None:
+            raise ValueError("Downsampled numeric values don't have ascii values.")
+        return [self._strings[code] for code in self._codes.tolist()]
+
+    def _numeric(self):
+        """The times and binary values of entries with a numeric value."""
+        if self.binary is None or self.binary.dtype.kind == 'O':
+            raise TypeError("Only numeric keyword histories can be summarized.")
+        if self.valid is None or self.valid.all():
+            return self.time, self.binary
+        return self.time[self.valid], self.binary[self.valid]
+
+    def min(self):
+        """The smallest binary value."""
+        return self._numeric()[1].min()
+
+    def max(self):
+        """The largest binary value."""
+        return self._numeric()[1].max()
+
+    def mean(self):
+        """The mean binary value."""
+        return self._numeric()[1].mean()
+
+    def downsample(self, interval, how='mean'):
+        """Reduce this window to one entry for every `interval` seconds, timed at the start of each interval.
+
+        `how` is one of 'mean', 'min', 'max' or 'last'. Only 'last' keeps ascii values, and it is the only choice for non-numeric keywords.
+        """
+        if how == 'last':
+            times, index = self.time, np.arange(len(self))
+        else:
+            reduce = {'mean' : np.add, 'min' : np.minimum, 'max' : np.maximum}.get(how)
+            if reduce is None:
+                raise ValueError("Can't downsample with {0!r}, use one of 'mean', 'min', 'max' or 'last'.".format(how))
+            times, values = self._numeric()
+        if not len(times):
+            return self
+        bins = np.floor(times / interval)
+        starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+        time = bins[starts] * interval
+        if how == 'last':
+            last = index[np.r_[starts[1:], len(times)] - 1]
+            return self.__class__(time, self._codes[last], self._strings, self.binary[last],
+                None if self.valid is None else self.valid[last])
+        if how == 'mean':
+            binary = np.add.reduceat(values, starts, dtype=np.float64) / np.diff(np.r_[starts, len(times)])
+        else:
+            binary = reduce.reduceat(values, starts)
+        return self.__class__(time, None, self._strings, binary)
+
+
+class KeywordHistory(object):
+    """A ring buffer of the most recent `size` values of a keyword.
+
+    Times, ascii values and binary values are kept in separate NumPy arrays. Keyword types listed in :data:`HISTORY_DTYPES` keep their binary values in a numeric array, so that windows of the history can be summarized quickly. Other keyword types keep binary values as python objects.
+    """
+
+    __slots__ = ('size', 'name', 'dtype', '_time', '_ascii', '_binary', '_valid', '_count', '_next', '_strings', '_codes', '_lock')
+
+    def __init__(self, size, ktl_type=None, name=None):
+        super(KeywordHistory, self).__init__()
+        self.size = max(int(size), 0)
+        self.name = name
+        self.dtype = HISTORY_DTYPES.get(ktl_type)
+        self._allocate(0)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<{0} name={1} entries={2:d} size={3:d}>".format(self.__class__.__name__, self.name, len(self), self.size)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        window = self.window()
+        valid = window.valid.tolist() if window.valid is not None else [True] * len(window)
+        for timestamp, value, isvalid, ascii in zip(window.time.tolist(), window.binary.tolist(), valid, window.ascii):
+            yield self._slice(timestamp, value if isvalid else None, ascii)
+
+    def __getitem__(self, index):
+        with self._lock:
+            if not -self._count <= index < self._count:
+                raise IndexError("history index out of range")
+            position = self._position(index % self._count)
+            timestamp = self._time[position]
+            ascii = self._strings[self._ascii[position]]
+            if self._valid is None:
+                binary = self._binary[position]
+            else:
+                binary = self._binary[position].item() if self._valid[position] else None
+        return self._slice(timestamp, binary, ascii)
+
+    def _slice(self, timestamp, binary, ascii):
+        """Make a history slice for one entry."""
+        return HistorySlice(datetime.datetime.fromtimestamp(timestamp).time(), binary, ascii, self.name)
+
+    def _position(self, index):
+        """The buffer position of the `index`-th oldest entry."""
+        if self._count < len(self._time):
+            return index
+        return (self._next + index) % len(self._time)
+
+    def _allocate(self, entries):
+        """Allocate empty buffers."""
+        self._time = np.zeros(entries, dtype=np.float64)
+        self._ascii = np.zeros(entries, dtype=np.int32)
+        if self.dtype is not None:
+            self._binary = np.zeros(entries, dtype=self.dtype)
+            self._valid = np.zeros(entries, dtype=np.bool_)
+        else:
+            self._binary = np.empty(entries, dtype=object)
+            self._valid = None
+        self._count = self._next = 0
+        self._strings = []
+        self._codes = {}
+
+    def _grow(self):
+        """Allocate more entries, until the buffer holds `size` entries."""
+        entries = min(self.size, max(INITIAL_ENTRIES, 2 * len(self._time)))
+        for column in ('_time', '_ascii', '_binary', '_valid'):
+            old = getattr(self, column)
+            if old is not None:
+                new = np.empty(entries, dtype=old.dtype)
+                new[:self._count] = old[:self._count]
+                setattr(self, column, new)
+        self._next = self._count
+
+    def _intern(self, ascii):
+        """The string table index for an ascii value."""
+        try:
+            return self._codes[ascii]
+        except KeyError:
+            if len(self._strings) >= 2 * self.size + INITIAL_ENTRIES:
+                self._compact()
+            code = self._codes[ascii] = len(self._strings)
+            self._strings.append(ascii)
+            return code
+
+    def _compact(self):
+        """Drop interned strings which are no longer in the buffer."""
+        codes = self._ascii[:self._count]
+        live = np.unique(codes)
+        self._strings = [self._strings[code] for code in live.tolist()]
+        self._codes = dict((string, code) for code, string in enumerate(self._strings))
+        self._ascii[:self._count] = np.searchsorted(live, codes)
+
+    def append(self, timestamp, ascii, binary=None):
+        """Record a keyword value, set at `timestamp` seconds since the epoch.
+
+        For numeric keywords, `binary` is cast from `ascii` when it isn't given.
+        """
+        if not self.size:
+            return
+        if self.dtype is not None and binary is None and ascii is not None:
+            try:
+                binary = _CASTS[self.dtype](ascii)
+            except (TypeError, ValueError):
+                pass
+        with self._lock:
+            if self._count == len(self._time) and self._count < self.size:
+                self._grow()
+            position = self._next
+            self._time[position] = timestamp
+            self._ascii[position] = self._intern(ascii)
+            if self._valid is None:
+                self._binary[position] = binary
+            else:
+                try:
+                    self._binary[position] = binary
+                    self._valid[position] = binary is not None
+                except (TypeError, ValueError, OverflowError):
+                    self._valid[position] = False
+            self._next = (position + 1) % len(self._time)
+            self._count = min(self._count + 1, len(self._time))
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._allocate(0)
+
+    def _ordered(self, column):
+        """A copy of a column in time order."""
+        if self._count < len(self._time):
+            return column[:self._count].copy()
+        return np.concatenate((column[self._next:], column[:self._next]))
+
+    def window(self, start=None, end=None):
+        """Select the entries set between `start` and `end`, as a :class:`HistoryWindow`.
+
+        `start` and `end` are :class:`datetime.datetime` objects or seconds since the epoch. Either may be omitted.
+        """
+        with self._lock:
+            times = self._ordered(self._time)
+            lower = 0 if start is None else np.searchsorted(times, _timestamp(start), side='left')
+            upper = len(times) if end is None else np.searchsorted(times, _timestamp(end), side='right')
+            codes = self._ordered(self._ascii)[lower:upper]
+            binary = self._ordered(self._binary)[lower:upper]
+            valid = None if self._valid is None else self._ordered(self._valid)[lower:upper]
+            strings = self._strings
+        return HistoryWindow(times[lower:upper], codes, strings, binary, valid)
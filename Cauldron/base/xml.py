@@ -2,20 +2,12 @@
 """
 This module handles functions which interact with KTL XML.
 """
+import warnings
 from functools import wraps
     
 from ..exc import CauldronXMLWarning, WrongDispatcher, CauldronWarning
-from ..extern import ktlxml
 from ..api import STRICT_KTL_XML, WARN_KTL_XML, WARNINGS_KTL
-
-ktlxml_get = None
-try:
-    ktlxml_get = getattr(ktlxml, 'get')
-except:
-    try:
-        ktlxml_get = getattr(ktlxml, 'Get')
-    except:
-        pass
+from .xmlindex import load_index
 
 __all__ = ['get_dispatcher_XML', 'get_initial_XML', 'get_units_xml', 'init_xml']
 
@@ -40,9 +32,11 @@ def xml(msg="KTLXML raised an error. Exception was {exc!s}.", bound=False):
 
 @xml("KTLXML was not loaded correctly for service {self.name:s}. Keywords will not be validated against XML. Exception was {exc!s}.", bound=True)
 def init_xml(service):
-    """Return a ktlxml Service object"""
+    """Load the compiled XML index for a service."""
     try:
-        service.xml = ktlxml.Service(service.name)
+        config = service._config
+        service.xml = load_index(service.name, cache=config.getboolean("core", "xmlcache"),
+            threads=config.getint("core", "xmlthreads"), processes=config.getint("core", "xmlprocesses"))
     except IOError as e:
         if (not STRICT_KTL_XML) and str(e).startswith("cannot locate index.xml for service"):
             emit_xml_warning(service.log, "Could not locate index.xml for service {self.name:s}. Keywords will not be validated against XML.".format(self=service), exc_info=False)
@@ -51,9 +45,8 @@ def init_xml(service):
     except Exception as e:
         raise
     else:
-        for keyword in service.xml.list():
-            if service.dispatcher == get_dispatcher_XML(service, keyword):
-                service._keywords[keyword] = None
+        for keyword in service.xml.for_dispatcher(service.dispatcher):
+            service._keywords[keyword] = None
 
 def get_dispatcher_XML(service, name):
     """Check that the XML for the dispatcher is correct.
@@ -62,10 +55,7 @@ def get_dispatcher_XML(service, name):
     matches the keyword's dispatcher value.
     """
     if service.dispatcher != None:
-        keyword_node = service.xml[name]
-        dispatcher_node = ktlxml_get.dispatcher(keyword_node)
-        dispatcher = ktlxml_get.value(dispatcher_node, 'name')
-        return dispatcher
+        return service.xml.keyword(name).dispatcher
     return None
 
 def get_initial_XML(xml, name):
@@ -74,40 +64,7 @@ def get_initial_XML(xml, name):
     :param xml: The XML tree containing keywords.
     :param name: Name of the keyword.
     """
-    keyword_xml = xml[name]
-    
-    initial = None
-    
-    for element in keyword_xml.childNodes:
-        if element.nodeName != 'serverside' and \
-           element.nodeName != 'server-side':
-            continue
-            
-        server_xml = element
-        
-        for element in server_xml.childNodes:
-            if element.nodeName != 'initialize':
-                continue
-                
-            # TODO: this loop could check to see if
-            # there is more than one initial value,
-            # rather than immediately halting the
-            # iteration.
-            
-            try:
-                initial = ktlxml.getValue (element, 'value')
-            except ValueError: # pragma: no cover
-                continue
-                
-            # Found a value, stop the iteration.
-            break
-            
-            
-        if initial != None:
-            # Found a value, stop the iteration.
-            break
-            
-    return initial
+    return xml.keyword(name).initial
     
 @xml("XML setup for keyword '{self.name}' failed. Exception was {exc!s}")
 def get_initial_value(service, name, initial):
@@ -133,8 +90,7 @@ def setup_orphan(service, name):
     """Set up orphans, respecting XML."""
     from Cauldron import DFW
     try:
-        xml = service.xml[name]
-        ktl_type = ktlxml.getValue(xml, 'type')
+        ktl_type = service.xml.keyword(name).type
         cls = DFW.Keyword.types[ktl_type]
     except Exception as e:
         if STRICT_KTL_XML:
@@ -156,16 +112,7 @@ def setup_orphan(service, name):
 @xml("KTLXML failed to find units for {self.name:s}. Exception was {exc!s}.")
 def get_units_xml(xml, name):
     """Get the keyword's units value from the XML configuration."""
-    keyword_xml = xml[name]
-    
-    units = None
-    
-    try:
-        units = ktlxml.getValue(keyword_xml, 'units')
-    except ValueError:
-        pass
-    
-    return units
+    return xml.keyword(name).units
 
 def emit_xml_warning(log, msg, exc_info=False):
     """Emit an XML error or warning."""
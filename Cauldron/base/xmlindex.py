@@ -0,0 +1,499 @@
+# -*- coding: utf-8 -*-
+"""
+A compiled index of the KTL XML for a service.
+
+Parsing KTL XML with ktlxml builds a DOM tree for every bundle file in a service, which is slow and memory hungry for large services. The index is compiled by streaming each bundle file, one keyword at a time, and keeps only what Cauldron needs for each keyword along with the byte offsets of its XML. It is cached next to ``index.xml``, keyed by the modification times and hashes of every XML file it was compiled from. A keyword's DOM node is only parsed, from its offsets, when a caller asks for it.
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import json
+import hashlib
+import logging
+import tempfile
+import collections
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import xml.etree.ElementTree as ElementTree
+from xml.dom import minidom
+from xml.parsers import expat
+
+from ..extern import ktlxml
+
+__all__ = ['KeywordXML', 'XMLIndex', 'load_index', 'compile_index', 'scan_bundles', 'index_cache_path']
+
+log = logging.getLogger(__name__)
+
+# ktlxml exports its Service class under the name of the module which defines it.
+_build_attributes = sys.modules[ktlxml.Service.__module__].buildAttributes
+
+#: The name of the cache file, written in the same directory as ``index.xml``.
+CACHE_FILENAME = ".cauldron-index.json"
+
+#: Bundle files at least this many bytes long are parsed in a separate process.
+PARSE_PROCESS_SIZE = 1 << 20
+
+#: Bump this when the cached record format changes, so that old caches are recompiled.
+CACHE_VERSION = 2
+
+KeywordXML = collections.namedtuple("KeywordXML", ["name", "type", "dispatcher", "units", "initial", "enumerators", "range"])
+
+class XMLIndex(object):
+    """The compiled KTL XML for a service, which stands in for :class:`ktlxml.Service`.
+
+    Keyword records are available from :meth:`keyword`, and keyword names are partitioned
+    by dispatcher in :attr:`dispatchers`. Indexing the service by keyword name
+    returns the full XML node, which is parsed from its bundle file the first time it is used.
+    As with :class:`ktlxml.Service`, iterating over the index yields the XML node for each keyword,
+    in order of keyword name.
+    """
+
+    def __init__(self, name, keywords, locations, bundles, sources=()):
+        super(XMLIndex, self).__init__()
+        self.name = name
+        self.keywords = keywords
+        self.locations = locations
+        self.bundles = bundles
+        self.sources = list(sources)
+        self.dispatchers = {}
+        for name in sorted(keywords):
+            self.dispatchers.setdefault(keywords[name].dispatcher, []).append(name)
+        self._nodes = {}
+
+    def __repr__(self):
+        return "<{0} {1} keywords={2:d}>".format(self.__class__.__name__, self.name, len(self.keywords))
+
+    def __contains__(self, keyword):
+        return str(keyword).upper() in self.keywords
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def __getitem__(self, keyword):
+        """The XML node for a keyword."""
+        name = self.keyword(keyword).name
+        try:
+            return self._nodes[name]
+        except KeyError:
+            bundle, start, end = self.locations[name]
+            node = self._nodes[name] = _parse_keyword(name, self.bundles[bundle], start, end)
+            return node
+
+    def __iter__(self):
+        for name in self.list():
+            yield self[name]
+
+    def attributes(self, keyword):
+        """A dictionary of the simple attributes of a keyword, as for :meth:`ktlxml.Service.attributes`."""
+        node = self[keyword]
+        if not hasattr(node, 'ktlxml_attributes'):
+            node.ktlxml_attributes = _build_attributes(node)
+        return node.ktlxml_attributes
+
+    def keyword(self, keyword):
+        """The compiled record for a keyword."""
+        try:
+            return self.keywords[str(keyword).upper()]
+        except KeyError:
+            raise KeyError("service '{0}' does not have a keyword '{1}'".format(self.name, str(keyword).upper()))
+
+    def list(self):
+        """A sorted list of keyword names."""
+        return sorted(self.keywords)
+
+    def for_dispatcher(self, dispatcher):
+        """A sorted list of the names of keywords which belong to a dispatcher."""
+        return list(self.dispatchers.get(dispatcher, ()))
+
+    keys = list
+
+    def dump(self, fp):
+        """Write this index to a file."""
+        json.dump({
+            'version' : CACHE_VERSION,
+            'service' : self.name,
+            'sources' : self.sources,
+            'bundles' : self.bundles,
+            'keywords' : [ list(record) + list(self.locations[name]) for name, record in self.keywords.items() ],
+        }, fp, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, fp):
+        """Read an index from a file."""
+        data = json.load(fp)
+        if data.get('version') != CACHE_VERSION:
+            raise ValueError("Index cache version {0!r} is not {1!r}".format(data.get('version'), CACHE_VERSION))
+        size = len(KeywordXML._fields)
+        keywords = dict((entry[0], KeywordXML(*entry[:size])) for entry in data['keywords'])
+        locations = dict((entry[0], tuple(entry[size:])) for entry in data['keywords'])
+        return cls(data['service'], keywords, locations, [ tuple(bundle) for bundle in data['bundles'] ],
+            [ tuple(source) for source in data['sources'] ])
+
+    def stale(self):
+        """Whether any of the XML files which this index was compiled from have changed."""
+        for source in self.sources:
+            if _source(source[0], previous=source) != source:
+                return True
+        return False
+
+def _value(element, name):
+    """Get a simple value from an XML element, or None if it isn't present."""
+    found = element.findall(name)
+    if len(found) != 1 or len(found[0]) or found[0].text is None:
+        return None
+    return found[0].text.strip()
+
+def _initial(element):
+    """Get the initial value from a keyword's server side XML."""
+    for child in element:
+        if child.tag not in ('serverside', 'server-side'):
+            continue
+        for initialize in child.findall('initialize'):
+            initial = _value(initialize, 'value')
+            if initial is not None:
+                return initial
+    return None
+
+def _enumerators(element):
+    """Get the (key, value) enumerator pairs from a keyword's XML."""
+    values = element.findall('values')
+    if not values:
+        return None
+    enumerators = []
+    for entry in values[-1].findall('entry'):
+        key, value = _value(entry, 'key'), _value(entry, 'value')
+        if key is not None and value is not None:
+            enumerators.append([key, value])
+    return enumerators
+
+def _range(element):
+    """Get the range of a keyword's values."""
+    limits = element.find('range')
+    if limits is None:
+        return None
+    result = {}
+    for limit in ('minimum', 'maximum'):
+        try:
+            result[limit] = float(_value(limits, limit))
+        except (TypeError, ValueError):
+            result[limit] = None
+    if result['minimum'] is None and result['maximum'] is None:
+        return None
+    return result
+
+def compile_keyword(element, filename='???'):
+    """Compile the record for a single keyword XML element."""
+    name = _value(element, 'name')
+    if not name:
+        raise ValueError("<keyword> has no <name> child (file {0})".format(os.path.basename(filename)))
+    return KeywordXML(name.upper(), _value(element, 'type'), None, _value(element, 'units'),
+        _initial(element), _enumerators(element), _range(element))
+
+class _NotABundle(Exception):
+    """Raised to stop scanning a file which doesn't contain a keyword bundle."""
+    pass
+
+class BundleScanner(object):
+    """Stream a bundle file, compiling the record and finding the byte offsets of each keyword.
+
+    Only one keyword element is held in memory at a time. Offsets are the start of an element's
+    opening tag and the start of its closing tag.
+    """
+
+    def __init__(self, filename):
+        super(BundleScanner, self).__init__()
+        self.filename = filename
+        self.service = None
+        self.name = filename
+        self.id = 0
+        self.header = None
+        self.dispatcher = None
+        self.dispatcher_name = None
+        self.keywords = []
+        self._depth = 0
+        self._builder = None
+        self._start = None
+        self._parser = None
+
+    def scan(self, data=None):
+        """Scan the bundle file, or its contents if they have already been read, returning True if it contains a keyword bundle."""
+        self._parser = parser = expat.ParserCreate()
+        parser.StartElementHandler = self._start_element
+        parser.EndElementHandler = self._end_element
+        parser.CharacterDataHandler = self._data
+        try:
+            if data is None:
+                with open(self.filename, 'rb') as f:
+                    parser.ParseFile(f)
+            else:
+                parser.Parse(data, True)
+        except _NotABundle:
+            return False
+        except expat.ExpatError as e:
+            raise expat.ExpatError("{0}: {1}".format(self.filename, e))
+        finally:
+            self._parser = None
+        return True
+
+    def _start_element(self, tag, attrs):
+        if self._depth == 0:
+            if tag != 'bundle':
+                raise _NotABundle(tag)
+            if 'service' not in attrs:
+                raise ValueError("the root bundle node in file '{0}' does not have a 'service' attribute".format(self.filename))
+            self.service = attrs['service'].strip().lower()
+            self.name = attrs.get('name', self.filename).strip().lower()
+            self.id = int(attrs.get('id', '0').strip())
+        elif self._depth == 1:
+            if self.header is None:
+                self.header = self._parser.CurrentByteIndex
+            if tag in ('keyword', 'dispatcher'):
+                self._start = self._parser.CurrentByteIndex
+                self._builder = ElementTree.TreeBuilder()
+        if self._builder is not None:
+            self._builder.start(tag, attrs)
+        self._depth += 1
+
+    def _data(self, data):
+        if self._builder is not None:
+            self._builder.data(data)
+
+    def _end_element(self, tag):
+        self._depth -= 1
+        if self._builder is None:
+            return
+        self._builder.end(tag)
+        if self._depth == 1:
+            element = self._builder.close()
+            self._builder = None
+            span = (self._start, self._parser.CurrentByteIndex)
+            if tag == 'dispatcher':
+                self.dispatcher = span
+                self.dispatcher_name = _value(element, 'name')
+            else:
+                self.keywords.append((compile_keyword(element, self.filename), span))
+
+def _read_element(f, start, end):
+    """Read the text of an element from its offsets."""
+    f.seek(start)
+    text = f.read(end - start)
+    tail = b""
+    while b">" not in tail:
+        chunk = f.read(64)
+        if not chunk:
+            raise ValueError("Unterminated element at byte {0:d} of '{1}'".format(end, f.name))
+        tail += chunk
+    return text + tail[:tail.index(b">") + 1]
+
+def _parse_keyword(name, bundle, start, end):
+    """Parse the XML node for a single keyword, as it would appear in a full ktlxml DOM."""
+    filename, header, dispatcher, bundle_id = bundle
+    with open(filename, 'rb') as f:
+        parts = [f.read(header)]
+        if dispatcher is not None:
+            parts.append(_read_element(f, *dispatcher))
+        parts.append(_read_element(f, start, end))
+    parts.append(b"</bundle>")
+    root = minidom.parseString(b"".join(parts)).documentElement
+    root.ktlxml_filename = filename
+    root.ktlxml_dispatcher = None
+    for child in root.childNodes:
+        if child.nodeName == 'dispatcher':
+            root.ktlxml_dispatcher = child
+        elif child.nodeName == 'keyword':
+            node = child
+    node.ktlxml_keyword_name = name
+    if node.hasAttribute('id'):
+        node.setAttribute('id', str(bundle_id + int(node.getAttribute('id').strip())))
+    return node
+
+def _source(filename, previous=None, data=None):
+    """The identity of a source file, as (filename, mtime, size, hash).
+
+    Files are only hashed when the modification time differs from the previous identity.
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return (filename, None, None, None)
+    if previous is not None and previous[1:3] == (stat.st_mtime, stat.st_size):
+        return tuple(previous)
+    if data is None:
+        with open(filename, 'rb') as f:
+            data = f.read()
+    digest = hashlib.sha1(data).hexdigest()
+    if previous is not None and tuple(previous[2:]) == (stat.st_size, digest):
+        return tuple(previous)
+    return (filename, stat.st_mtime, stat.st_size, digest)
+
+def _index_files(filename):
+    """The files listed in an ``index.xml`` file."""
+    directory = os.path.dirname(filename)
+    root = ElementTree.parse(filename).getroot()
+    return [ os.path.join(directory, location.text.strip()) for location in root.findall("./files/file/location") ]
+
+def _read_bundle(filename):
+    """Read a bundle file, returning its contents and its identity as a source."""
+    with open(filename, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        data = f.read()
+    return data, (filename, stat.st_mtime, stat.st_size, hashlib.sha1(data).hexdigest())
+
+def _scan_bundle(filename, data):
+    """Scan the contents of a bundle file, returning the scanner, or None if the file isn't a keyword bundle."""
+    bundle = BundleScanner(filename)
+    return bundle if bundle.scan(data) else None
+
+def _process_pool(processes):
+    """A pool of processes which, where the platform allows it, are not forked from this process.
+
+    Forking a process with running threads (like ZMQ context threads) can deadlock the child, so on Python 3
+    the pool uses the ``forkserver`` or ``spawn`` start method.
+    """
+    if hasattr(multiprocessing, 'get_context'):
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        return multiprocessing.get_context(method).Pool(processes)
+    return multiprocessing.Pool(processes)
+
+def scan_bundles(filenames, threads=1, processes=0):
+    """Scan bundle files, returning a list of (scanner, source) pairs in the same order as `filenames`.
+
+    Files are read and hashed by a pool of `threads` threads, which overlap waiting on slow
+    filesystems. When there is more than one file larger than :data:`PARSE_PROCESS_SIZE`, and
+    more than one CPU, those files are parsed by a pool of up to `processes` processes. The rest
+    are parsed in this thread. On Python 2, the process pool is forked from this process, so only
+    use it before any backend threads have started.
+    """
+    if threads > 1 and len(filenames) > 1:
+        pool = ThreadPool(min(threads, len(filenames)))
+        try:
+            contents = pool.map(_read_bundle, filenames)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        contents = [ _read_bundle(filename) for filename in filenames ]
+
+    large = [ i for i, (data, source) in enumerate(contents) if len(data) >= PARSE_PROCESS_SIZE ]
+    results = [None] * len(filenames)
+    processes = min(processes, len(large), multiprocessing.cpu_count())
+    pool = _process_pool(processes) if processes > 1 else None
+    try:
+        if pool is not None:
+            for i in large:
+                results[i] = pool.apply_async(_scan_bundle, (filenames[i], contents[i][0]))
+        for i, filename in enumerate(filenames):
+            if results[i] is None:
+                results[i] = _scan_bundle(filename, contents[i][0])
+        if pool is not None:
+            for i in large:
+                results[i] = results[i].get()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return [ (result, source) for result, (data, source) in zip(results, contents) ]
+
+def _compile(name, filename, threads=1, processes=0):
+    """Scan the bundle files listed by ``filename``, and its included services, into an index.
+
+    Bundles are merged in the order of their service, and then their filename, so that the
+    index doesn't depend on how the files were scanned.
+    """
+    services = [(name, filename)] + sorted(ktlxml.includes(filename).items())
+    filenames = []
+    for service, index_filename in services:
+        if service != name and service.lower() == name.lower():
+            raise ValueError("included service is the same as the local service ('{0}')".format(name.lower()))
+        filenames.append((service, index_filename, sorted(_index_files(index_filename))))
+    scanned = iter(scan_bundles([ bundle_filename for _, _, bundle_filenames in filenames for bundle_filename in bundle_filenames ],
+        threads=threads, processes=processes))
+
+    keywords, locations, bundles, sources, names = {}, {}, [], [], set()
+    for service, index_filename, bundle_filenames in filenames:
+        sources.append(_source(index_filename))
+        for bundle_filename in bundle_filenames:
+            bundle, source = next(scanned)
+            sources.append(source)
+            if bundle is None:
+                continue
+            if bundle.service != service.lower():
+                raise ValueError("bundle in '{0}' is for service '{1}', not '{2}'".format(bundle_filename, bundle.service, service.lower()))
+            bundle_name = bundle.name if service == name else "{0}:{1}".format(service, bundle.name)
+            if bundle_name in names:
+                raise ValueError("bundle in '{0}' has duplicate bundle name '{1}'".format(bundle_filename, bundle_name))
+            names.add(bundle_name)
+            for record, (start, end) in bundle.keywords:
+                if record.name in keywords:
+                    raise ValueError("XML for service '{0}' has more than one keyword '{1}'".format(name, record.name))
+                keywords[record.name] = record._replace(dispatcher=bundle.dispatcher_name)
+                locations[record.name] = (len(bundles), start, end)
+            bundles.append((bundle_filename, bundle.header, bundle.dispatcher, bundle.id))
+    return XMLIndex(name, keywords, locations, bundles, sources)
+
+def compile_index(name, directory=None, threads=1, processes=0):
+    """Stream the XML for a service, and compile an index from it."""
+    filename = ktlxml.index(name, directory)
+    if filename is None:
+        raise IOError("cannot locate index.xml for service '{0}'".format(name))
+    return _compile(name, filename, threads, processes)
+
+def index_cache_path(filename):
+    """The path to the index cache for a given ``index.xml`` file."""
+    return os.path.join(os.path.dirname(os.path.abspath(filename)), CACHE_FILENAME)
+
+def _read_cache(path, name, filename):
+    """Read an index from the cache for ``filename``, returning None if it is missing or stale."""
+    try:
+        with open(path, 'r') as f:
+            index = XMLIndex.load(f)
+    except (IOError, OSError):
+        return None
+    except (ValueError, KeyError, TypeError) as e:
+        log.debug("Ignoring unreadable KTL XML index cache '{0}': {1!r}".format(path, e))
+        return None
+    if index.name.lower() != name.lower() or not index.sources or index.sources[0][0] != filename or index.stale():
+        log.debug("KTL XML index cache '{0}' is stale.".format(path))
+        return None
+    return index
+
+def _write_cache(path, index):
+    """Write an index to the cache, without ever leaving a partially written cache in place."""
+    try:
+        fd, tmp = tempfile.mkstemp(prefix=CACHE_FILENAME, dir=os.path.dirname(path))
+    except (IOError, OSError) as e:
+        log.debug("Can't write KTL XML index cache '{0}': {1!r}".format(path, e))
+        return
+    try:
+        with os.fdopen(fd, 'w') as f:
+            index.dump(f)
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, path)
+    except (IOError, OSError) as e:
+        log.debug("Can't write KTL XML index cache '{0}': {1!r}".format(path, e))
+        os.unlink(tmp)
+
+def load_index(name, directory=None, cache=True, threads=1, processes=0):
+    """Load the compiled XML index for a service, from the cache if it is fresh.
+
+    :param name: The service name.
+    :param directory: The XML directory, as for :func:`ktlxml.index`.
+    :param cache: Whether to read and write the cache next to ``index.xml``.
+    :param threads: The number of threads used to read bundle files, see :func:`scan_bundles`.
+    :param processes: The number of processes used to parse large bundle files.
+    """
+    filename = ktlxml.index(name, directory)
+    if filename is None:
+        raise IOError("cannot locate index.xml for service '{0}'".format(name))
+
+    path = index_cache_path(filename)
+    if cache:
+        index = _read_cache(path, name, filename)
+        if index is not None:
+            return index
+
+    index = _compile(name, filename, threads, processes)
+    if cache:
+        _write_cache(path, index)
+    return index
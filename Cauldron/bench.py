@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic dispatchers and clients which load a Cauldron deployment, used by the ``cauldron-bench`` console script.
+
+Synthetic dispatchers serve writable keywords named for their type, like ``INTEGER0000``, and periodic keywords named ``PERIODIC0000``. Each periodic keyword broadcasts a counter which increases by one with each update, so clients which monitor periodic keywords can count the broadcasts they missed from the gaps between the values they receive.
+
+Synthetic clients read and write the writable keywords in a random mix, and monitor a fraction of the periodic keywords. :func:`run_bench` starts both, and returns a report of throughput, latency percentiles, timeouts, errors and dropped broadcasts.
+"""
+from __future__ import absolute_import, division
+
+import time
+import random
+import logging
+import threading
+
+from .exc import TimeoutError
+from .metrics import _percentile
+
+__all__ = ['TYPES', 'OPERATIONS', 'SyntheticDispatcher', 'SyntheticClient', 'RequestStats', 'BroadcastStats',
+    'parse_mix', 'run_bench', 'format_report']
+
+log = logging.getLogger(__name__)
+
+TYPES = {
+    'integer' : ('Integer', lambda n : str(n)),
+    'double' : ('Double', lambda n : str(n + 0.5)),
+    'boolean' : ('Boolean', lambda n : str(n % 2)),
+    'string' : ('String', lambda n : "value{0:d}".format(n)),
+}
+"""Keyword types which synthetic dispatchers can serve, with the DFW keyword class and a function to generate the n-th value of each."""
+
+OPERATIONS = ('read', 'write')
+"""Operations which synthetic clients mix."""
+
+PERIODIC = "PERIODIC"
+
+def keyword_type(name):
+    """The synthetic type of a keyword, from its name, or None for periodic and unknown keywords."""
+    prefix = name.rstrip("0123456789").lower()
+    return prefix if prefix in TYPES else None
+
+def parse_mix(mix):
+    """Parse an operation mix like ``read=3,write=1`` into a dictionary of weights."""
+    weights = dict((operation, 0.0) for operation in OPERATIONS)
+    for item in mix.split(","):
+        operation, _, weight = item.partition("=")
+        operation = operation.strip().lower()
+        if operation not in weights:
+            raise ValueError("Unknown operation '{0}' in mix '{1}', expected one of {2}".format(operation, mix, ", ".join(OPERATIONS)))
+        try:
+            weights[operation] = float(weight) if weight.strip() else 1.0
+        except ValueError:
+            raise ValueError("Bad weight '{0}' for operation '{1}'".format(weight, operation))
+        if weights[operation] < 0:
+            raise ValueError("Weight for operation '{0}' must not be negative.".format(operation))
+    if not sum(weights.values()):
+        raise ValueError("Operation mix '{0}' has no operations.".format(mix))
+    return weights
+
+class RequestStats(object):
+    """Latencies, timeouts and errors of one kind of client request, from many threads."""
+
+    def __init__(self):
+        super(RequestStats, self).__init__()
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.timeouts = 0
+        self.errors = 0
+
+    def add(self, elapsed):
+        """Record a completed request."""
+        with self._lock:
+            self.latencies.append(elapsed)
+
+    def timeout(self):
+        """Record a request which timed out."""
+        with self._lock:
+            self.timeouts += 1
+
+    def error(self):
+        """Record a request which failed."""
+        with self._lock:
+            self.errors += 1
+
+    def summary(self, duration):
+        """A summary of these requests over `duration` seconds, with latencies in milliseconds."""
+        with self._lock:
+            latencies = sorted(self.latencies)
+            summary = {'count' : len(latencies), 'timeouts' : self.timeouts, 'errors' : self.errors}
+        summary['throughput'] = len(latencies) / duration if duration else 0.0
+        for q in (50, 90, 99, 100):
+            name = 'max' if q == 100 else 'p{0:d}'.format(q)
+            summary[name] = 1e3 * _percentile(latencies, q) if latencies else None
+        return summary
+
+class BroadcastStats(object):
+    """Broadcasts received from periodic keywords, and the broadcasts missed between them."""
+
+    def __init__(self):
+        super(BroadcastStats, self).__init__()
+        self._lock = threading.Lock()
+        self.received = 0
+        self.dropped = 0
+        self.reordered = 0
+
+    def add(self, received, dropped, reordered):
+        """Add the broadcasts counted by one client."""
+        with self._lock:
+            self.received += received
+            self.dropped += dropped
+            self.reordered += reordered
+
+    def summary(self, duration):
+        """A summary of these broadcasts over `duration` seconds."""
+        with self._lock:
+            return {'received' : self.received, 'dropped' : self.dropped, 'reordered' : self.reordered,
+                'throughput' : self.received / duration if duration else 0.0}
+
+class SyntheticDispatcher(object):
+    """A dispatcher for service `name`, with `keywords` writable keywords cycling through `types`, and `periodic` keywords updated every `period` seconds.
+
+    Keyword handlers sleep for `latency` seconds when reading or writing.
+    """
+
+    def __init__(self, name, config=None, keywords=100, types=('integer',), periodic=0, period=1.0, latency=0.0):
+        super(SyntheticDispatcher, self).__init__()
+        self.name = name
+        self.config = config
+        self.keywords = keywords
+        self.types = list(types)
+        self.periodic = periodic
+        self.period = period
+        self.latency = latency
+        self.running = False
+        self.service = None
+
+    def _keyword_class(self, typename):
+        """A DFW keyword class for `typename` which generates values, and sleeps in its handlers."""
+        from Cauldron import DFW
+        dispatcher = self
+
+        class SyntheticKeyword(getattr(DFW.Keyword, TYPES[typename][0])):
+            """A synthetic keyword."""
+
+            _count = 0
+
+            def read(self):
+                if dispatcher.latency:
+                    time.sleep(dispatcher.latency)
+                if not dispatcher.running or keyword_type(self.name) is not None:
+                    return self.value
+                self._count += 1
+                return TYPES[typename][1](self._count)
+
+            def write(self, value):
+                if dispatcher.latency:
+                    time.sleep(dispatcher.latency)
+
+        return SyntheticKeyword
+
+    def setup(self, service):
+        """Set up the synthetic keywords of `service`."""
+        classes = dict((typename, self._keyword_class(typename)) for typename in set(self.types + ['integer']))
+        for i in range(self.keywords):
+            typename = self.types[i % len(self.types)]
+            classes[typename]("{0}{1:04d}".format(typename.upper(), i), service, initial=TYPES[typename][1](0))
+        for i in range(self.periodic):
+            classes['integer']("{0}{1:04d}".format(PERIODIC, i), service, initial="0")
+
+    def start(self):
+        """Start this dispatcher, and its periodic updates."""
+        from Cauldron import DFW
+        self.running = True
+        self.service = DFW.Service(self.name, config=self.config, setup=self.setup)
+        for i in range(self.periodic):
+            self.service["{0}{1:04d}".format(PERIODIC, i)].period(self.period)
+        return self
+
+    def stop(self):
+        """Stop periodic updates."""
+        self.running = False
+
+    def shutdown(self):
+        """Shut down this dispatcher."""
+        self.running = False
+        if self.service is not None:
+            self.service.shutdown()
+            self.service = None
+
+class SyntheticClient(threading.Thread):
+    """A client which reads and writes the keywords of `services` in the proportions of `mix`, and monitors a `monitor` fraction of their periodic keywords.
+
+    Requests are made back-to-back, or at `rate` requests per second, until :attr:`done` is set. Each request waits up to `timeout` seconds.
+    """
+
+    def __init__(self, index, services, mix, stats, broadcasts, monitor=1.0, rate=0.0, timeout=None, seed=None):
+        super(SyntheticClient, self).__init__(name="cauldron-bench-client-{0:d}".format(index))
+        self.daemon = True
+        self.index = index
+        self.services = list(services)
+        self.operations = [operation for operation in OPERATIONS if mix.get(operation, 0)]
+        self.weights = [mix[operation] for operation in self.operations]
+        self.stats = stats
+        self.broadcasts = broadcasts
+        self.monitor = monitor
+        self.rate = rate
+        self.timeout = timeout
+        self.random = random.Random(None if seed is None else seed + index)
+        self.ready = threading.Event()
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+        self._last = {}
+        self._received = 0
+        self._dropped = 0
+        self._reordered = 0
+        self._writes = 0
+
+    def _choose(self):
+        """Choose an operation from the mix."""
+        point = self.random.uniform(0, sum(self.weights))
+        for operation, weight in zip(self.operations, self.weights):
+            point -= weight
+            if point <= 0:
+                return operation
+        return self.operations[-1]
+
+    def _value(self, keyword):
+        """A value to write to `keyword`, unique to this client."""
+        self._writes += 1
+        return TYPES[keyword_type(keyword.name)][1](self.index * 1000000 + self._writes)
+
+    def receive(self, keyword):
+        """Count a broadcast from a periodic keyword."""
+        value = int(keyword['ascii'])
+        with self._lock:
+            last = self._last.get(keyword.full_name)
+            self._last[keyword.full_name] = max(value, last or 0)
+            self._received += 1
+            if last is None:
+                return
+            if value > last:
+                self._dropped += value - last - 1
+            else:
+                self._reordered += 1
+                self._dropped = max(0, self._dropped - 1)
+
+    def _request(self, operation, keyword):
+        """Make a single request, recording its latency or failure."""
+        start = time.time()
+        try:
+            if operation == 'read':
+                keyword.read(timeout=self.timeout)
+            else:
+                keyword.write(self._value(keyword), timeout=self.timeout)
+        except TimeoutError:
+            self.stats[operation].timeout()
+        except Exception as e:
+            log.debug("{0} of {1} failed: {2!r}".format(operation, keyword.full_name, e))
+            self.stats[operation].error()
+        else:
+            self.stats[operation].add(time.time() - start)
+
+    def run(self):
+        """Make requests until done."""
+        from Cauldron import ktl
+        clients = [ktl.Service(name, populate=False) for name in self.services]
+        try:
+            targets = []
+            for client in clients:
+                for name in client.keywords():
+                    if keyword_type(name) is not None:
+                        targets.append(client[name])
+                    elif name.startswith(PERIODIC) and self.random.random() < self.monitor:
+                        client[name].callback(self.receive)
+                        client[name].monitor(prime=False)
+            self.ready.set()
+            if not targets or not self.operations:
+                self.done.wait()
+                return
+            interval = 1.0 / self.rate if self.rate else 0.0
+            deadline = time.time()
+            while not self.done.is_set():
+                self._request(self._choose(), self.random.choice(targets))
+                if interval:
+                    deadline += interval
+                    self.done.wait(max(0.0, deadline - time.time()))
+        finally:
+            self.ready.set()
+            with self._lock:
+                self.broadcasts.add(self._received, self._dropped, self._reordered)
+            for client in clients:
+                client.shutdown()
+
+def run_bench(services, duration=10.0, clients=1, mix=None, monitor=1.0, rate=0.0, timeout=None, seed=None,
+    dispatchers=True, config=None, keywords=100, types=('integer',), periodic=0, period=1.0, latency=0.0, drain=1.0):
+    """Load the KTL `services` for `duration` seconds, and return a report of the load.
+
+    When `dispatchers` is True, a synthetic dispatcher is started for each service, otherwise the services must already be served by synthetic dispatchers, e.g. from another ``cauldron-bench`` process. Clients stop making requests after `duration` seconds, and then wait `drain` seconds for broadcasts in flight.
+    """
+    mix = mix or {'read' : 1.0, 'write' : 1.0}
+    running = []
+    if dispatchers:
+        for name in services:
+            running.append(SyntheticDispatcher(name, config=config, keywords=keywords, types=types,
+                periodic=periodic, period=period, latency=latency).start())
+
+    stats = dict((operation, RequestStats()) for operation in OPERATIONS)
+    broadcasts = BroadcastStats()
+    threads = [SyntheticClient(i, services, mix, stats, broadcasts, monitor=monitor, rate=rate, timeout=timeout, seed=seed)
+        for i in range(clients)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.ready.wait()
+
+        start = time.time()
+        time.sleep(duration)
+        for thread in threads:
+            thread.done.set()
+        elapsed = time.time() - start
+
+        for dispatcher in running:
+            dispatcher.stop()
+        time.sleep(drain)
+    finally:
+        for thread in threads:
+            thread.done.set()
+        for thread in threads:
+            thread.join()
+        for dispatcher in running:
+            dispatcher.shutdown()
+
+    report = dict((operation, stats[operation].summary(elapsed)) for operation in OPERATIONS)
+    report['broadcast'] = broadcasts.summary(elapsed)
+    report['duration'] = elapsed
+    return report
+
+def _milliseconds(value):
+    """Format a latency in milliseconds."""
+    return "-" if value is None else "{0:.3f}".format(value)
+
+def format_report(report):
+    """Format a report from :func:`run_bench` as a table."""
+    lines = ["{0:<10s}{1:>10s}{2:>12s}{3:>10s}{4:>10s}{5:>10s}{6:>10s}{7:>10s}{8:>8s}".format(
+        "", "count", "per second", "p50 ms", "p90 ms", "p99 ms", "max ms", "timeouts", "errors")]
+    for operation in OPERATIONS:
+        summary = report[operation]
+        lines.append("{0:<10s}{1:>10d}{2:>12.1f}{3:>10s}{4:>10s}{5:>10s}{6:>10s}{7:>10d}{8:>8d}".format(
+            operation, summary['count'], summary['throughput'],
+            *[_milliseconds(summary[name]) for name in ('p50', 'p90', 'p99', 'max')]
+            + [summary['timeouts'], summary['errors']]))
+    summary = report['broadcast']
+    lines.append("{0:<10s}{1:>10d}{2:>12.1f}  dropped {3:d}, reordered {4:d}".format(
+        "broadcast", summary['received'], summary['throughput'], summary['dropped'], summary['reordered']))
+    lines.append("over {0:.1f} seconds".format(report['duration']))
+    return "\n".join(lines)
@@ -5,13 +5,20 @@ Console scripts for KTL.
 
 import argparse
 import collections
+import json
 import time
 import logging
 import traceback
 import sys
+import fnmatch
+import datetime
+import threading
+from multiprocessing.pool import ThreadPool
 
 from .exc import TimeoutError, DispatcherError
 from .config import get_timeout
+from .compat import OrderedDict
+from .bench import TYPES, SyntheticDispatcher, parse_mix, run_bench, format_report
 
 
 class BackendAction(argparse.Action):
@@ -98,6 +105,9 @@ def prepare_actions(parser, namespace):
     prepare_backend(parser, namespace)
     
 
+PARALLEL = 16
+"""The default number of keywords which :func:`ktl_show` reads at once, and the most :func:`ktl_modify` writes at once when asked to."""
+
 def show():
     """Argument parsing and actions."""
     parser = argparse.ArgumentParser(description="Show a single keyword value.")
@@ -111,41 +121,98 @@ def show():
         help="Display the binary version of a keyword.")
     parser.add_argument('-d', '--debug', action='store_const', const=logging.DEBUG,
         help="Show debug information.", default=logging.WARNING)
+    parser.add_argument('-t', '--timeout', type=float, help="Timeout when reading keywords.")
+    parser.add_argument('--parallel', type=int, default=PARALLEL,
+        help="Maximum number of keywords to read at once.")
+    parser.add_argument('-w', '--watch', action='store_true',
+        help="Monitor the keywords, and show each broadcast as it arrives. Keywords may be glob patterns.")
+    parser.add_argument('--json', action='store_true',
+        help="Show broadcasts as newline-delimited JSON when watching.")
     parser.add_argument('keyword', type=str, nargs="+", help="Name of the KTL Keyword to display.")
     opt = parser.parse_args()
     prepare_actions(parser, opt)
-    ktl_show(opt.service, *opt.keyword, binary=opt.binary)
+    if opt.watch:
+        try:
+            ktl_watch(opt.service, *opt.keyword, binary=opt.binary, json=opt.json)
+        except KeyboardInterrupt:
+            pass
+        return 0
+    ktl_show(opt.service, *opt.keyword, binary=opt.binary, parallel=opt.parallel, timeout=opt.timeout)
     return 0
-    
+
+def _ordered_map(function, items, parallel=PARALLEL):
+    """Call `function` on each item, at most `parallel` at a time, yielding results in the order of `items`."""
+    if parallel <= 1 or len(items) <= 1:
+        for item in items:
+            yield function(item)
+        return
+    pool = ThreadPool(min(parallel, len(items)))
+    try:
+        for result in pool.imap(function, items):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+def _read_many(svc, keywords, binary=False, timeout=None):
+    """Read `keywords` in a single batched command, if the backend supports one, returning a dictionary of values."""
+    if len(keywords) > 1 and hasattr(svc, 'read_many'):
+        try:
+            values = svc.read_many([keyword.name for keyword in keywords], binary=binary, timeout=timeout)
+        except (DispatcherError, TimeoutError):
+            pass
+        else:
+            return dict((keyword.name, value) for keyword, value in zip(keywords, values))
+    return {}
+
 def ktl_show(service, *keywords, **options):
-    """Implement the KTL Show functionality."""
+    """Implement the KTL Show functionality.
+    
+    Keywords are read concurrently, up to `parallel` at once, and shown in the order they were requested.
+    """
     from Cauldron import ktl
     binary = options.pop('binary', False)
+    parallel = options.pop('parallel', PARALLEL)
+    timeout = options.pop('timeout', None)
     outfile = options.pop('output', sys.stdout)
     errfile = options.pop('error', sys.stderr if outfile == sys.stdout else outfile)
     
     svc = ktl.Service(service, populate=False)
     try:
-        for keyword in keywords:
-        
+        requests = []
+        for name in keywords:
             try:
-                keyword = svc[keyword]
+                requests.append((name, svc[name]))
             except KeyError as e:
+                requests.append((name, e))
+        
+        values = _read_many(svc, [keyword for _, keyword in requests if not isinstance(keyword, KeyError)],
+            binary=binary, timeout=timeout)
+        
+        def read(request):
+            """Read a keyword and its units."""
+            name, keyword = request
+            if isinstance(keyword, KeyError):
+                return keyword, None, None
+            try:
+                if keyword.name in values:
+                    value = values[keyword.name]
+                else:
+                    value = keyword.read(binary=binary, timeout=timeout)
+                return keyword, value, keyword['units']
+            except (DispatcherError, TimeoutError) as e:
+                return keyword, e, None
+        
+        for (name, _), (keyword, value, unit) in zip(requests, _ordered_map(read, requests, parallel)):
+            if isinstance(keyword, KeyError):
                 errfile.write("Can't find keyword '{0}' in service '{1}'\n{2!s}\n".format(
-                    keyword.upper(), svc.name, e
+                    name.upper(), svc.name, keyword
                 ))
                 errfile.flush()
-                continue
-        
-            try:
-                value = keyword.read(binary=binary)
-            except DispatcherError as e:
-                errfile.write("Can't read from keyword '{0}'\n{1!s}".format(keyword.full_name, e))
+            elif isinstance(value, Exception):
+                errfile.write("Can't read from keyword '{0}'\n{1!s}".format(keyword.full_name, value))
                 errfile.flush()
-                continue
-        
-            unit = keyword['units']
-            if unit == '' or unit == "Unknown" or unit is None:
+            elif unit == '' or unit == "Unknown" or unit is None:
                 outfile.write("{0}: {1}\n".format(keyword.name, value))
                 outfile.flush()
             else:
@@ -156,6 +223,90 @@ def ktl_show(service, *keywords, **options):
             svc.shutdown()
     return
 
+class _Watcher(object):
+    """Write keyword broadcasts as they arrive, from any thread."""
+    
+    def __init__(self, outfile, binary=False, json=False, count=None):
+        super(_Watcher, self).__init__()
+        self.outfile = outfile
+        self.binary = binary
+        self.json = json
+        self.count = count
+        self.received = 0
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+        
+    def receive(self, keyword):
+        """Write a broadcast from `keyword`."""
+        now = time.time()
+        value = keyword['binary'] if self.binary else keyword['ascii']
+        if self.json:
+            line = json.dumps({'timestamp' : now, 'service' : keyword.service.name, 
+                'keyword' : keyword.name, 'value' : value}, default=str, sort_keys=True)
+        else:
+            line = "{0} {1}: {2}".format(datetime.datetime.fromtimestamp(now).isoformat(), keyword.name, value)
+        with self._lock:
+            if self.done.is_set():
+                return
+            self.outfile.write(line + "\n")
+            self.outfile.flush()
+            self.received += 1
+            if self.count is not None and self.received >= self.count:
+                self.done.set()
+    
+def ktl_watch(service, *keywords, **options):
+    """Monitor KTL keywords, writing each broadcast as it arrives.
+    
+    Keywords may be glob patterns, matched against every keyword in the service. Each keyword's current value is written first. Watching continues until `count` broadcasts have been written, or for `duration` seconds, or forever.
+    """
+    from Cauldron import ktl
+    binary = options.pop('binary', False)
+    count = options.pop('count', None)
+    duration = options.pop('duration', None)
+    outfile = options.pop('output', sys.stdout)
+    errfile = options.pop('error', sys.stderr if outfile == sys.stdout else outfile)
+    watcher = _Watcher(outfile, binary=binary, json=options.pop('json', False), count=count)
+    
+    svc = ktl.Service(service, populate=False)
+    try:
+        names = []
+        available = None
+        for pattern in keywords:
+            if any(char in pattern for char in "*?["):
+                if available is None:
+                    available = svc.keywords()
+                matched = fnmatch.filter(available, pattern.upper())
+                if not matched:
+                    errfile.write("No keywords match '{0}' in service '{1}'\n".format(pattern.upper(), svc.name))
+                    errfile.flush()
+                names.extend(matched)
+            else:
+                names.append(pattern)
+        
+        for name in OrderedDict.fromkeys(names):
+            try:
+                keyword = svc[name]
+            except KeyError as e:
+                errfile.write("Can't find keyword '{0}' in service '{1}'\n{2!s}\n".format(
+                    name.upper(), svc.name, e
+                ))
+                errfile.flush()
+                continue
+            keyword.callback(watcher.receive)
+            keyword.monitor(prime=True, wait=False)
+        
+        deadline = None if duration is None else time.time() + duration
+        while not watcher.done.is_set():
+            remaining = 1.0 if deadline is None else min(1.0, deadline - time.time())
+            if remaining <= 0:
+                break
+            watcher.done.wait(remaining)
+        watcher.done.set()
+    finally:
+        if hasattr(svc, 'shutdown'):
+            svc.shutdown()
+    return watcher.received
+
 def parseModifyCommands(commands, flags, verbose=False):
     """Parse modify commands, yielding values"""
     keyword, assignment = None, False
@@ -238,13 +389,15 @@ def modify():
         help="Don't wait for modify to complete, return immediately.")
     parser.add_argument('-q', '--silent', action='store_true',
         help="Don't produce output.")
-    parser.add_argument('-p', '--notify', action='store_true', dest='parallel',
+    parser.add_argument('-p', '--notify', action='store_true',
         help="Process requests in parallel.")
     parser.add_argument('-t', '--timeout', type=float, help="Timeout when waiting for keywords.")
+    parser.add_argument('--parallel', type=int, default=1,
+        help="Maximum number of keywords to write at once. Writes to the same keyword are always made in order.")
     parser.add_argument('commands', nargs="+", help="Keyword assignments", metavar="keyword=value")
     opt = parser.parse_args()
     
-    flags = {'binary' : opt.binary, 'debug': opt.debug, 'notify' : opt.parallel, 'nowait' : opt.nowait,
+    flags = {'binary' : opt.binary, 'debug': opt.debug, 'notify' : opt.notify, 'nowait' : opt.nowait,
         'silent' : opt.silent}
     try:
         commands = list(parseModifyCommands(opt.commands, flags))
@@ -254,6 +407,7 @@ def modify():
         setattr(opt, flag, value)
     prepare_actions(parser, opt)
     flags['timeout'] = opt.timeout
+    flags['parallel'] = opt.parallel
     try:
         ktl_modify(opt.service, *commands, **flags)
     except TimeoutError as e:
@@ -266,15 +420,20 @@ def modify():
     
     
 def ktl_modify(service, *commands, **options):
-    """Modify a series of KTL keywords."""
+    """Modify a series of KTL keywords.
+    
+    When waiting for each write, distinct keywords can be written concurrently, up to `parallel` at once.
+    Writes to the same keyword are always made in the order they were given.
+    """
     from Cauldron import ktl
     
     # Handle arguments
     binary = options.pop('binary', False)
     debug = options.pop('debug', False)
-    parallel = options.pop('notify', False)
+    notify = options.pop('notify', False)
     nowait = options.pop('nowait', False)
-    wait = not (nowait or parallel)
+    parallel = options.pop('parallel', 1)
+    wait = not (nowait or notify)
     verbose = not options.pop('silent', False)
     timeout = get_timeout(options.pop('timeout', None))
     waitfor = collections.deque()
@@ -282,7 +441,7 @@ def ktl_modify(service, *commands, **options):
     errfile = options.pop('error', sys.stderr if outfile == sys.stdout else outfile)
     
     
-    if parallel:
+    if notify:
         mode = "(notify)"
     elif wait:
         mode = "(wait)"
@@ -291,7 +450,8 @@ def ktl_modify(service, *commands, **options):
     
     svc = ktl.Service(service, populate=False)
     try:
-        # Initial write loop.
+        # Find keywords loop.
+        requests = []
         for keyword, value in commands:
         
             try:
@@ -306,11 +466,44 @@ def ktl_modify(service, *commands, **options):
                 if verbose:
                     outfile.write("setting {0:s} = {1:s} {2:s}\n".format(keyword.name, value, mode))
                     outfile.flush()
-                sequence = keyword.write(value, binary=binary, wait=wait, timeout=timeout)
-                if parallel == True and nowait == False:
+                requests.append((keyword, value))
+        
+        # Initial write loop.
+        if wait:
+            def write(group):
+                """Write each value to a keyword in turn, waiting for each write to complete."""
+                results = []
+                for keyword, value in group:
+                    try:
+                        keyword.write(value, binary=binary, wait=True, timeout=timeout)
+                    except Exception as e:
+                        results.append((keyword, e))
+                    else:
+                        results.append((keyword, None))
+                return results
+            
+            # Only distinct keywords are written concurrently, so that repeated writes land in order.
+            groups = collections.OrderedDict()
+            for keyword, value in requests:
+                groups.setdefault(keyword.name, []).append((keyword, value))
+            
+            errors = []
+            for results in _ordered_map(write, list(groups.values()), parallel):
+                for keyword, error in results:
+                    if error is not None:
+                        errfile.write("Error setting keyword '{0}'\n{1!s}\n".format(keyword.name, error))
+                        errfile.flush()
+                        errors.append(error)
+            if any(isinstance(error, TimeoutError) for error in errors):
+                raise TimeoutError("Error setting keyword(s): Timeout waiting for write(s) to complete")
+            elif errors:
+                raise DispatcherError("Error setting {0:d} keyword(s).".format(len(errors)))
+        else:
+            for keyword, value in requests:
+                sequence = keyword.write(value, binary=binary, wait=False, timeout=timeout)
+                if notify == True and nowait == False:
                     waitfor.append((keyword, sequence))
         
-    
         # Wait for writes to complete loop.
         start = time.time()
         while len(waitfor):
@@ -329,4 +522,88 @@ def ktl_modify(service, *commands, **options):
         if hasattr(svc, 'shutdown'):
             svc.shutdown()
     return
-    
\ No newline at end of file
+    
+def bench():
+    """Argument parsing and actions for cauldron-bench"""
+    epilog="""
+    By default, cauldron-bench starts synthetic dispatchers and clients in one process. To load a deployment with dispatchers in another process, run `cauldron-bench --role dispatcher` there, and `cauldron-bench --role client` here, with the same services.
+    
+    """
+    parser = argparse.ArgumentParser(description="Load a Cauldron backend with synthetic dispatchers and clients, and report throughput, latency, timeouts and dropped broadcasts.", epilog=epilog)
+    parser.add_argument('-c', '--configuration', action=ConfigureAction, 
+        help="The Cauldron configuration file.", metavar='config.cfg')
+    parser.add_argument('-k', '--backend', action=BackendAction,
+        help="The Cauldron Backend to use.")
+    parser.add_argument('-d', '--debug', action='store_const', const=logging.DEBUG,
+        help="Show debug information.", default=logging.WARNING)
+    parser.add_argument('-s', '--service', type=str, default="bench",
+        help="Name of the synthetic KTL service, or the prefix of their names when there are several.")
+    parser.add_argument('--role', choices=['both', 'dispatcher', 'client'], default='both',
+        help="Run synthetic dispatchers, clients, or both.")
+    parser.add_argument('--duration', type=float,
+        help="Seconds to run for. Clients run for 10 seconds by default, and dispatchers until interrupted.")
+    parser.add_argument('--seed', type=int, help="Random seed, to make client requests reproducible.")
+    parser.add_argument('--json', action='store_true', help="Report results as JSON.")
+    
+    group = parser.add_argument_group("dispatchers")
+    group.add_argument('--dispatchers', type=int, default=1, help="Number of synthetic services.")
+    group.add_argument('--keywords', type=int, default=100, help="Writable keywords in each service.")
+    group.add_argument('--types', type=str, default="integer",
+        help="Comma separated types of writable keywords, from {0}.".format(", ".join(sorted(TYPES))))
+    group.add_argument('--periodic', type=int, default=10, help="Periodic keywords in each service.")
+    group.add_argument('--period', type=float, default=0.1, help="Seconds between updates of periodic keywords.")
+    group.add_argument('--latency', type=float, default=0.0, help="Seconds each keyword handler takes to read or write.")
+    
+    group = parser.add_argument_group("clients")
+    group.add_argument('--clients', type=int, default=1, help="Number of concurrent clients.")
+    group.add_argument('--mix', type=str, default="read=1,write=1", help="Relative weights of client operations.")
+    group.add_argument('--monitor', type=float, default=1.0, help="Fraction of periodic keywords each client monitors.")
+    group.add_argument('--rate', type=float, default=0.0, help="Requests per second from each client, or 0 for no limit.")
+    group.add_argument('-t', '--timeout', type=float, help="Timeout for each request.")
+    opt = parser.parse_args()
+    
+    try:
+        mix = parse_mix(opt.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    types = [typename.strip().lower() for typename in opt.types.split(",")]
+    for typename in types:
+        if typename not in TYPES:
+            parser.error("Unknown keyword type '{0}'".format(typename))
+    prepare_actions(parser, opt)
+    
+    if opt.dispatchers > 1:
+        services = ["{0}{1:d}".format(opt.service, i) for i in range(opt.dispatchers)]
+    else:
+        services = [opt.service]
+    options = dict(config=opt.config, keywords=opt.keywords, types=types,
+        periodic=opt.periodic, period=opt.period, latency=opt.latency)
+    
+    if opt.backend == 'zmq' and opt.role != 'client':
+        from .zmq.broker import ZMQBroker
+        if not ZMQBroker.check(config=opt.config, timeout=0.1):
+            ZMQBroker.thread(opt.config).running.wait(2.0)
+    
+    if opt.role == 'dispatcher':
+        dispatchers = [SyntheticDispatcher(name, **options).start() for name in services]
+        try:
+            if opt.duration is None:
+                while True:
+                    time.sleep(1.0)
+            else:
+                time.sleep(opt.duration)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for dispatcher in dispatchers:
+                dispatcher.shutdown()
+        return 0
+    
+    duration = 10.0 if opt.duration is None else opt.duration
+    report = run_bench(services, duration=duration, clients=opt.clients, mix=mix, monitor=opt.monitor,
+        rate=opt.rate, timeout=get_timeout(opt.timeout), seed=opt.seed, dispatchers=(opt.role == 'both'), **options)
+    if opt.json:
+        print(json.dumps(report, sort_keys=True))
+    else:
+        print(format_report(report))
+    return 0
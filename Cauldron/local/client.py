@@ -2,6 +2,8 @@
 
 from __future__ import absolute_import
 
+import sys
+import six
 import weakref
 import warnings
 import logging
@@ -12,6 +14,8 @@ from .dispatcher import Service as Dispatcher
 from ..base import ClientService, ClientKeyword
 from ..base.core import Task as _BaseTask
 from ..exc import CauldronAPINotImplementedWarning, CauldronAPINotImplemented, ServiceNotStarted, DispatcherError, TimeoutError
+from ..config import get_configuration
+from ..logger import LazyFormat
 from .. import registry
 
 __all__ = ['Service', 'Keyword']
@@ -73,6 +77,12 @@ class LocalTaskQueue(threading.Thread):
 @registry.client.keyword_for("local")
 class Keyword(ClientKeyword):
     
+    def _prepare(self):
+        """Count this keyword's operations which are waiting in the task queue."""
+        super(Keyword, self)._prepare()
+        self._queued = 0
+        self._queued_lock = threading.Lock()
+    
     @property
     def source(self):
         """The source of knowledge about this keyword."""
@@ -93,7 +103,7 @@ class Keyword(ClientKeyword):
     def _ktl_units(self):
         """Units for this keyword."""
         if getattr(self, '_units', None) is None:
-            self._units = self.source._get_units()
+            self._receive_units(self.source._get_units())
         return '' if self._units is None else self._units
         
     def monitor(self, start=True, prime=True, wait=True):
@@ -104,36 +114,82 @@ class Keyword(ClientKeyword):
         else:
             self.source._consumers.discard(self._update)
         
+    def _runs_inline(self, wait, timeout):
+        """Whether an operation can skip the task queue.
+        
+        Only blocking calls without an explicit timeout run inline, and only when none of this keyword's operations are in the queue, so that they can't overtake an earlier operation.
+        """
+        return wait and timeout is None and self.service._inline and not self._queued
+    
+    def _enqueue(self, request, callback, timeout):
+        """Put an operation in the task queue."""
+        task = LocalTask(request, callback, timeout)
+        with self._queued_lock:
+            self._queued += 1
+        self.service._thread.queue.put(task)
+        return task
+    
+    def _dequeue(self):
+        """Count an operation from the task queue as finished."""
+        with self._queued_lock:
+            self._queued -= 1
+        
+    def _execute(self, operation, request):
+        """Run a dispatcher operation inline, in the caller's thread, then update this keyword.
+        
+        Only the dispatcher operation holds the keyword lock, so client callbacks run without it, as they do from the task queue.
+        """
+        try:
+            with self.source._lock:
+                result = operation(request)
+            self._update(result)
+        except Exception as e:
+            six.reraise(DispatcherError, DispatcherError(str(e)), sys.exc_info()[2])
+        
+    def _read_source(self, unused):
+        return str(self.source.update()) # Ensure ascii across the wire.
+        
     def _read_task(self, unused):
-        result = str(self.source.update()) # Ensure ascii across the wire.
-        self._update(result)
+        try:
+            self._update(self._read_source(unused))
+        finally:
+            self._dequeue()
         
     def read(self, binary=False, both=False, wait=True, timeout=None):
-        _call_msg = lambda : "{0!r}.read(wait={1}, timeout={2})".format(self, wait, timeout)
+        _call_msg = LazyFormat("{0!r}.read(wait={1}, timeout={2})", self, wait, timeout)
         
         if not self['reads']:
             raise ValueError("Keyword '{0}' does not support reads, it is write-only.".format(self.name))
         
-        task = LocalTask(None, self._read_task, timeout)
-        self.service._thread.queue.put(task)
+        if self._runs_inline(wait, timeout):
+            self._execute(self._read_source, None)
+            return self._current_value(binary=binary, both=both)
+        
+        task = self._enqueue(None, self._read_task, timeout)
         if wait:
             try:
                 result = task.get(timeout=timeout)
             except TimeoutError:
-                raise TimeoutError("{0} timed out.".format(_call_msg()))
+                raise TimeoutError("{0} timed out.".format(_call_msg))
             else:
-                self.service.log.debug("{0} complete.".format(_call_msg()))
+                self.service.log.lazy(logging.DEBUG, "{0} complete.", _call_msg)
             return self._current_value(binary=binary, both=both)
         else:
             return task
         
-    def _write_task(self, value):
+    def _write_source(self, value):
         self.source.modify(str(value))
-        self._update(str(self.source.value))
+        return str(self.source.value)
+        
+    def _write_task(self, value):
+        try:
+            self._update(self._write_source(value))
+        finally:
+            self._dequeue()
         return self._current_value()
         
     def write(self, value, wait=True, binary=False, timeout=None):
-        _call_msg = lambda : "{0!r}.write({1}, wait={2}, timeout={3})".format(self, value, wait, timeout)
+        _call_msg = LazyFormat("{0!r}.write({1}, wait={2}, timeout={3})", self, value, wait, timeout)
         
         if not self['writes']:
             raise ValueError("Keyword '{0}' does not support writes, it is read-only.".format(self.name))
@@ -144,17 +200,20 @@ class Keyword(ClientKeyword):
         except (TypeError, ValueError): #pragma: no cover
             pass
         
-        task = LocalTask(value, self._write_task, timeout)
-        self.service._thread.queue.put(task)
+        if self._runs_inline(wait, timeout):
+            self._execute(self._write_source, value)
+            return
+        
+        task = self._enqueue(value, self._write_task, timeout)
         if wait:
-            self.service.log.debug("{0} waiting.".format(_call_msg()))
+            self.service.log.lazy(logging.DEBUG, "{0} waiting.", _call_msg)
             try:
                 result = task.get(timeout=timeout)
             except TimeoutError:
-                raise TimeoutError("{0} timed out.".format(_call_msg()))
+                raise TimeoutError("{0} timed out.".format(_call_msg))
             else:
-                self.service.log.debug("{0} complete.".format(_call_msg()))
-            self.service.log.debug("{0} complete.".format(_call_msg()))
+                self.service.log.lazy(logging.DEBUG, "{0} complete.", _call_msg)
+            self.service.log.lazy(logging.DEBUG, "{0} complete.", _call_msg)
             return
         else:
             return task
@@ -177,6 +236,7 @@ class Service(ClientService):
         
     def _prepare(self):
         """Prepare the local client for action."""
+        self._inline = get_configuration().getboolean("local", "inline")
         self._thread = LocalTaskQueue(self.name, self.log)
         self._thread.start()
     
@@ -77,6 +77,7 @@ class Service(DispatcherService):
         
     def _prepare(self):
         self._scheduler = LocalScheduler(self.name)
+        self._scheduler.metrics_key = (self.name, self.dispatcher, "SCHEDULER", "LATENESS")
         
     def _begin(self):
         """Indicate that this service is ready to act, by inserting it into the local registry."""
@@ -96,13 +97,23 @@ class Service(DispatcherService):
 @registry.dispatcher.keyword_for("local")
 class Keyword(DispatcherKeyword):
     
+    __slots__ = ('_consumer_list',)
+    
     def __init__(self, name, service, initial=None, period=None):
+        self._consumer_list = None
         super(Keyword, self).__init__(name, service, initial, period)
-        self._consumers = Callbacks()
+    
+    @property
+    def _consumers(self):
+        """Client keywords which receive this keyword's values."""
+        if self._consumer_list is None:
+            self._consumer_list = Callbacks()
+        return self._consumer_list
     
     def _broadcast(self, value):
         """Notify consumers that this value has changed."""
-        self._consumers(value)
+        if self._consumer_list is not None:
+            self._consumer_list(value)
         
     def schedule(self, appointment=None, cancel=False):
         if cancel:
@@ -120,6 +120,92 @@ def test_wait(local_client, keyword_name):
     local_client[keyword_name].wait()
         
 
+@pytest.mark.parametrize("inline", ["yes", "no"])
+def test_read_write_modes(request, backend, servicename, config, keyword_name, inline):
+    """Test blocking reads and writes both inline and through the task queue."""
+    config.set("local", "inline", inline)
+    from Cauldron import ktl, DFW
+    svc = DFW.Service(servicename, config=config)
+    svc[keyword_name]
+    request.addfinalizer(svc.shutdown)
+    client = ktl.Service(servicename)
+    request.addfinalizer(client.shutdown)
+    assert client._inline == (inline == "yes")
+    
+    client[keyword_name].write("10")
+    assert svc[keyword_name].value == "10"
+    assert client[keyword_name].read() == "10"
+    task = client[keyword_name].write("11", wait=False)
+    client[keyword_name].wait(sequence=task)
+    assert svc[keyword_name].value == "11"
+    
+@pytest.mark.parametrize("inline", ["yes", "no"])
+def test_write_error(request, backend, servicename, config, keyword_name, inline):
+    """Test that dispatcher errors are wrapped in both execution modes."""
+    config.set("local", "inline", inline)
+    from Cauldron import ktl, DFW
+    from Cauldron.exc import DispatcherError
+    svc = DFW.Service(servicename, config=config)
+    svc[keyword_name]
+    request.addfinalizer(svc.shutdown)
+    client = ktl.Service(servicename)
+    request.addfinalizer(client.shutdown)
+    
+    def check(value):
+        raise ValueError("Bad value {0}".format(value))
+    svc[keyword_name].check = check
+    with pytest.raises(DispatcherError):
+        client[keyword_name].write("10")
+    
+@pytest.mark.parametrize("inline", ["yes", "no"])
+def test_callback_without_lock(request, backend, servicename, config, keyword_name, inline):
+    """Test that client callbacks don't run under the dispatcher's keyword lock."""
+    import threading
+    config.set("local", "inline", inline)
+    from Cauldron import ktl, DFW
+    svc = DFW.Service(servicename, config=config)
+    svc[keyword_name]
+    request.addfinalizer(svc.shutdown)
+    client = ktl.Service(servicename)
+    request.addfinalizer(client.shutdown)
+    
+    locked = []
+    def acquire():
+        lock = svc[keyword_name]._lock
+        locked.append(lock.acquire(False))
+        if locked[-1]:
+            lock.release()
+    
+    def callback(keyword):
+        # Another thread must be able to take the lock while the callback runs.
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        thread.join()
+    client[keyword_name].callback(callback)
+    client[keyword_name].write("10")
+    assert locked == [True]
+    
+def test_inline_after_queued(request, backend, servicename, config, keyword_name):
+    """Test that a blocking write doesn't overtake writes already in the task queue."""
+    import time
+    config.set("local", "inline", "yes")
+    from Cauldron import ktl, DFW
+    svc = DFW.Service(servicename, config=config)
+    svc[keyword_name]
+    request.addfinalizer(svc.shutdown)
+    client = ktl.Service(servicename)
+    request.addfinalizer(client.shutdown)
+    
+    def check(value):
+        if value == "first":
+            time.sleep(0.2)
+    svc[keyword_name].check = check
+    task = client[keyword_name].write("first", wait=False)
+    client[keyword_name].write("second")
+    assert task.wait(1.0)
+    assert svc[keyword_name].value == "second"
+    assert client[keyword_name]._queued == 0
+    
 def test_readonly(local_client, local_service, keyword_name3):
     """Test a read only keyword."""
     local_service[keyword_name3].readonly = True
@@ -6,7 +6,32 @@ A useful subclass of logger for more fine-grained messaging.
 import logging
 import weakref
 
-__all__ = ['KeywordMessageFilter']
+__all__ = ['KeywordLogger', 'KeywordMessageFilter', 'LazyFormat', 'MSG', 'TRACE']
+
+MSG = 5
+"""Messaging log level."""
+
+TRACE = 1
+"""Trace log level."""
+
+class LazyFormat(object):
+    """A message which is only formatted with :meth:`str.format` when it is converted to a string."""
+    
+    __slots__ = ('fmt', 'args')
+    
+    def __init__(self, fmt, *args):
+        super(LazyFormat, self).__init__()
+        self.fmt = fmt
+        self.args = args
+        
+    def __str__(self):
+        """Format the message."""
+        return self.fmt.format(*self.args)
+    
+    def __repr__(self):
+        """Represent this message."""
+        return "<{0} {1!r}>".format(self.__class__.__name__, self.fmt)
+    
 
 class Logger(logging.getLoggerClass()):
     """A basic subclass of logger with some useful items."""
@@ -15,19 +40,112 @@ class Logger(logging.getLoggerClass()):
         """Get a child logger."""
         return logging.getLogger("{0}.{1}".format(self.name, suffix))
     
+    def lazy(self, level, fmt, *args, **kwargs):
+        """Log `fmt` formatted with `args` at `level`, only formatting the message when `level` is enabled.
+        
+        Enabled messages are formatted right away, so that log records don't hold on to `args`, which are often messages that change later.
+        """
+        if self.isEnabledFor(level):
+            self._log(level, fmt.format(*args), (), **kwargs)
+    
     def msg(self, msg, *args, **kwargs):
         """Messaging-level logging."""
-        if self.isEnabledFor(5):
-            self._log(5, msg, args, **kwargs)
+        if self.isEnabledFor(MSG):
+            self._log(MSG, msg, args, **kwargs)
         
     def trace(self, msg, *args, **kwargs):
         """Trace-level logging."""
-        if self.isEnabledFor(1):
-            self._log(1, msg, args, **kwargs)
+        if self.isEnabledFor(TRACE):
+            self._log(TRACE, msg, args, **kwargs)
         
     
 logging.setLoggerClass(Logger)
 
+def _keyword_context(keyword_name, keyword):
+    """The extra record attributes which describe a keyword."""
+    if keyword is None:
+        return {'keyword_name' : keyword_name, 'keyword' : "<MissingKeyword '{0}'>".format(keyword_name)}
+    return {'keyword_name' : keyword_name, 'keyword' : repr(keyword)}
+
+class _KeywordRecordName(logging.Filter):
+    """Name records logged by a :class:`KeywordLogger` after their keyword, as if they were logged by a child of the service logger."""
+    
+    def filter(self, record):
+        """Rename keyword records."""
+        name = getattr(record, '_keyword_logger_name', None)
+        if name is not None:
+            record.name = name
+        return True
+    
+_keyword_record_name = _KeywordRecordName()
+
+class KeywordLogger(logging.LoggerAdapter):
+    """Log to a service logger, adding keyword context to each record.
+    
+    Keywords share their service's logger, so logging from a keyword doesn't create a logger (which the logging module keeps forever) or a filter. The keyword context is only computed for messages which are enabled. Records are still named ``<service logger>.<KEYWORD>``, so handlers can filter them by keyword.
+    """
+    
+    def __init__(self, logger, keyword):
+        logging.LoggerAdapter.__init__(self, logger, None)
+        self._keyword_name = keyword.full_name
+        self._keyword = weakref.ref(keyword)
+        self._record_name = "{0}.{1}".format(logger.name, keyword.name)
+        logger.addFilter(_keyword_record_name)
+    
+    def process(self, msg, kwargs):
+        """Add the keyword context to a record."""
+        extra = _keyword_context(self._keyword_name, self._keyword())
+        extra['_keyword_logger_name'] = self._record_name
+        if kwargs.get('extra'):
+            extra.update(kwargs['extra'])
+        kwargs['extra'] = extra
+        return msg, kwargs
+    
+    def isEnabledFor(self, level):
+        """Whether the service logger is enabled for `level`."""
+        return self.logger.isEnabledFor(level)
+    
+    def log(self, level, msg, *args, **kwargs):
+        """Log `msg` at `level`."""
+        if self.logger.isEnabledFor(level):
+            msg, kwargs = self.process(msg, kwargs)
+            self.logger.log(level, msg, *args, **kwargs)
+    
+    def lazy(self, level, fmt, *args, **kwargs):
+        """Log `fmt` formatted with `args` at `level`, only formatting the message when `level` is enabled."""
+        if self.logger.isEnabledFor(level):
+            self.log(level, fmt.format(*args), **kwargs)
+    
+    def trace(self, msg, *args, **kwargs):
+        """Trace-level logging."""
+        self.log(TRACE, msg, *args, **kwargs)
+    
+    def msg(self, msg, *args, **kwargs):
+        """Messaging-level logging."""
+        self.log(MSG, msg, *args, **kwargs)
+    
+    def debug(self, msg, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+    
+    def info(self, msg, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
+    
+    def warning(self, msg, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
+    
+    warn = warning
+    
+    def error(self, msg, *args, **kwargs):
+        self.log(logging.ERROR, msg, *args, **kwargs)
+    
+    def exception(self, msg, *args, **kwargs):
+        kwargs.setdefault('exc_info', True)
+        self.log(logging.ERROR, msg, *args, **kwargs)
+    
+    def critical(self, msg, *args, **kwargs):
+        self.log(logging.CRITICAL, msg, *args, **kwargs)
+    
+
 class KeywordMessageFilter(logging.Filter):
     
     def __init__(self, keyword):
@@ -38,12 +156,7 @@ class KeywordMessageFilter(logging.Filter):
     
     def filter(self, record):
         """Filter by applying keyword names."""
-        record.keyword_name = self._keyword_name
-        keyword = self._keyword()
-        if keyword is not None:
-            record.keyword = repr(keyword)
-        else:
-            record.keyword = "<MissingKeyword '{0}'>".format(self._keyword_name)
+        record.__dict__.update(_keyword_context(self._keyword_name, self._keyword()))
         return True
     
 
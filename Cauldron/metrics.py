@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Cauldron's own health metrics, published as keywords of a reserved KTL service.
+
+Brokers and dispatchers count messages, sample queue depths and record latencies in :data:`process`, the metrics collector for this process. When ``[metrics] enable`` is set, a :class:`MetricsPublisher` periodically aggregates the collector and sets keywords of the ``[metrics] service`` service, so that KTL tools can monitor Cauldron itself.
+
+Metric names are tuples of strings, like ``("BROKER", "MYSERVICE", "MODIFY")``, which are joined into keyword names like ``BROKER_MYSERVICE_MODIFY``. Each metric publishes these keywords:
+
+- counters publish their total, and their rate per second as ``<NAME>_RATE``.
+- gauges publish their current value, summed across every object which reports them.
+- observations publish their 50th and 99th percentiles as ``<NAME>_P50`` and ``<NAME>_P99``.
+"""
+from __future__ import absolute_import, division
+
+import re
+import time
+import logging
+import threading
+import weakref
+
+import six
+
+from . import registry
+from .config import read_configuration
+
+__all__ = ['Metrics', 'MetricsPublisher', 'process', 'publish', 'stop', 'keyword_name']
+
+log = logging.getLogger(__name__)
+
+def keyword_name(key):
+    """The keyword name for a metric."""
+    if not isinstance(key, tuple):
+        key = (key,)
+    return re.sub(r"[^A-Z0-9]+", "_", "_".join(key).upper()).strip("_")
+
+class _ThreadMetrics(object):
+    """The counts and samples recorded by one thread."""
+
+    __slots__ = ('counts', 'samples', 'lock', 'thread', '__weakref__')
+
+    def __init__(self):
+        super(_ThreadMetrics, self).__init__()
+        self.counts = {}
+        self.samples = {}
+        self.lock = threading.Lock()
+        self.thread = weakref.ref(threading.current_thread())
+
+    @property
+    def alive(self):
+        """Whether the thread which owns this store is still running."""
+        thread = self.thread()
+        return thread is not None and thread.is_alive()
+
+class Metrics(object):
+    """A collector of counters, gauges and observations.
+
+    Each thread records counters and observations in its own store, and stores are only aggregated by :meth:`snapshot`. Observations are appended under a per-store lock, which is only contended while a snapshot drains that store. Nothing is recorded unless the collector is :attr:`enabled`.
+    """
+
+    def __init__(self):
+        super(Metrics, self).__init__()
+        self.enabled = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stores = []
+        self._retired = {}
+        self._gauges = weakref.WeakKeyDictionary()
+
+    @property
+    def _store(self):
+        """The store for the current thread."""
+        try:
+            return self._local.store
+        except AttributeError:
+            store = self._local.store = _ThreadMetrics()
+            with self._lock:
+                self._stores.append(store)
+            return store
+
+    def increment(self, key, count=1):
+        """Add `count` to a counter."""
+        if self.enabled:
+            counts = self._store.counts
+            counts[key] = counts.get(key, 0) + count
+
+    def observe(self, key, value):
+        """Record an observation, like a latency in seconds."""
+        if self.enabled:
+            store = self._store
+            with store.lock:
+                try:
+                    store.samples[key].append(value)
+                except KeyError:
+                    store.samples[key] = [value]
+
+    def record(self, key, duration):
+        """Count an event, and observe how long it took."""
+        if self.enabled:
+            store = self._store
+            store.counts[key] = store.counts.get(key, 0) + 1
+            with store.lock:
+                try:
+                    store.samples[key].append(duration)
+                except KeyError:
+                    store.samples[key] = [duration]
+
+    def gauge(self, owner, key, getter):
+        """Report a gauge, the value of ``getter(owner)``, for as long as `owner` exists."""
+        self._gauges.setdefault(owner, []).append((key, getter))
+
+    def clear(self):
+        """Forget every counter and observation."""
+        with self._lock:
+            self._retired.clear()
+            for store in self._stores:
+                with store.lock:
+                    store.counts.clear()
+                    store.samples = {}
+
+    def snapshot(self):
+        """Aggregate every thread's metrics.
+
+        Returns a tuple of dictionaries of counter totals, gauge values and lists of the observations made since the last snapshot. The counts of threads which have finished are kept in a single total, and their stores are dropped.
+        """
+        samples = {}
+        with self._lock:
+            counters = dict(self._retired)
+            stores = []
+            for store in self._stores:
+                alive = store.alive
+                with store.lock:
+                    counts = list(store.counts.items())
+                    drained, store.samples = store.samples, {}
+                for key, count in counts:
+                    counters[key] = counters.get(key, 0) + count
+                    if not alive:
+                        self._retired[key] = self._retired.get(key, 0) + count
+                for key, values in drained.items():
+                    samples.setdefault(key, []).extend(values)
+                if alive:
+                    stores.append(store)
+            self._stores = stores
+        gauges = {}
+        for owner, reports in list(self._gauges.items()):
+            for key, getter in reports:
+                try:
+                    gauges[key] = gauges.get(key, 0) + getter(owner)
+                except Exception as e:
+                    log.debug("Can't read gauge {0}: {1!r}".format(keyword_name(key), e))
+        return counters, gauges, samples
+
+
+process = Metrics()
+"""The metrics collector for this process."""
+
+def _percentile(values, q):
+    """The `q`-th percentile of sorted values."""
+    return values[int(round((len(values) - 1) * q / 100.0))]
+
+class MetricsPublisher(threading.Thread):
+    """A thread which publishes a metrics collector as keywords of the metrics service, once every ``[metrics] period`` seconds.
+
+    `source` names the dispatcher of the metrics service which this process runs.
+    """
+
+    def __init__(self, source, config=None, metrics=None):
+        super(MetricsPublisher, self).__init__(name="Cauldron.metrics.{0}".format(source))
+        self.daemon = True
+        self.source = keyword_name(source)
+        self.config = read_configuration(config)
+        self.period = self.config.getfloat("metrics", "period")
+        self.metrics = metrics if metrics is not None else process
+        self.service = None
+        self.started = threading.Event()
+        self.finished = threading.Event()
+        self._keywords = {}
+        self._counts = {}
+        self._last = None
+
+    def __repr__(self):
+        return "<{0} source={1} keywords={2:d}>".format(self.__class__.__name__, self.source, len(self._keywords))
+
+    def _set(self, name, value):
+        """Set a metrics keyword."""
+        try:
+            keyword = self._keywords[name]
+        except KeyError:
+            from Cauldron import DFW
+            cls = DFW.Keyword.Integer if isinstance(value, six.integer_types) else DFW.Keyword.Double
+            keyword = self._keywords[name] = cls(name, self.service)
+        keyword.set("{0:d}".format(value) if isinstance(value, six.integer_types) else "{0:.6g}".format(value))
+
+    def publish(self):
+        """Aggregate the metrics, and set their keywords."""
+        counters, gauges, samples = self.metrics.snapshot()
+        now = time.time()
+        elapsed = (now - self._last) if self._last is not None else None
+        self._last = now
+        for key, count in counters.items():
+            name = keyword_name(key)
+            self._set(name, count)
+            if elapsed:
+                self._set(name + "_RATE", (count - self._counts.get(key, 0)) / elapsed)
+        self._counts = counters
+        for key, value in gauges.items():
+            self._set(keyword_name(key), value)
+        for key, values in samples.items():
+            values.sort()
+            name = keyword_name(key)
+            self._set(name + "_P50", float(_percentile(values, 50)))
+            self._set(name + "_P99", float(_percentile(values, 99)))
+
+    def run(self):
+        """Start the metrics service, and publish until stopped."""
+        from Cauldron import DFW
+        try:
+            self.service = DFW.Service(self.config.get("metrics", "service"), config=self.config, dispatcher=self.source)
+            self._last = time.time()
+            self.started.set()
+            while not self.finished.wait(self.period):
+                try:
+                    self.publish()
+                except Exception as e:
+                    log.exception("Error publishing metrics: {0!r}".format(e))
+        except Exception as e:
+            log.exception("Error starting the metrics service: {0!r}".format(e))
+        finally:
+            self.started.set()
+            if self.service is not None:
+                self.service.shutdown()
+
+    def stop(self, timeout=None):
+        """Stop publishing, and shut down the metrics service."""
+        self.finished.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+def publish(source, config=None):
+    """Start publishing this process's metrics, if they aren't already published.
+
+    Returns the :class:`MetricsPublisher` for this process.
+    """
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None or not _publisher.is_alive():
+            _publisher = MetricsPublisher(source, config)
+            process.enabled = True
+            _publisher.start()
+        return _publisher
+
+@registry.dispatcher.teardown_for
+def stop():
+    """Stop publishing this process's metrics."""
+    global _publisher
+    with _publisher_lock:
+        publisher, _publisher = _publisher, None
+        process.enabled = False
+    if publisher is not None:
+        publisher.stop()
+    process.clear()
@@ -13,6 +13,8 @@ import datetime
 import six
 
 from .base.core import _CauldronBaseMeta
+from .logger import MSG
+from .metrics import process as metrics
 
 now = time.time
 log = logging.getLogger(__name__)
@@ -63,7 +65,7 @@ class Collection(object):
             to_remove = []
             next_update = now() + self.period
             for keyword in self.keywords:
-                log.log(5, "Updating {0!r}".format(keyword))
+                log.lazy(MSG, "Updating {0!r}", keyword)
                 alive = _keyword_update(keyword)
                 if not alive:
                     to_remove.append(keyword)
@@ -137,6 +139,10 @@ def _normalize_time(time):
 @six.add_metaclass(_CauldronBaseMeta)
 class Scheduler(object):
     """A scheduler maintains appointments and periods, and responds with the next timeout."""
+    
+    #: The metric which records how late periodic updates run, see :mod:`Cauldron.metrics`.
+    metrics_key = None
+    
     def __init__(self, *args, **kwargs):
         super(Scheduler, self).__init__(*args, **kwargs)
         self._appointments = TimingDictionary()
@@ -195,6 +201,8 @@ class Scheduler(object):
         """Run period-triggered keywords."""
         at = at or now()
         if len(self._periods) and self._periods.next_event <= at:
+            if self.metrics_key is not None:
+                metrics.observe(self.metrics_key, at - self._periods.next_event)
             with self._periods.locked:
                 collection = self._periods.pop()
                 collection.update()
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+The shared memory backend serves keywords to clients on the same host
+through a memory-mapped keyword table. Clients read values directly
+from shared memory, and send writes to the dispatcher through a
+command ring in the same table.
+
+"""
+from .common import SHM_AVAILABLE
+
+def setup_shm_backend():
+    """Set up the shm backend."""
+    if SHM_AVAILABLE:
+        from . import client
+        from . import dispatcher
+    
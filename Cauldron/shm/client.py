@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Client implementation for the shm backend.
+
+Clients read keyword values straight out of the shared keyword table, and send writes to the dispatcher through the command ring. Monitored keywords are watched by a thread which waits on its own doorbell, rung by the dispatcher whenever it publishes a value, and checks the table's change counter.
+"""
+from __future__ import absolute_import
+
+import json
+import weakref
+import logging
+import threading
+
+from six.moves import queue
+from ..base import ClientService, ClientKeyword
+from ..base.core import Task
+from ..compat import WeakSet
+from ..config import get_configuration
+from ..exc import CauldronAPINotImplemented, ServiceNotStarted, DispatcherError
+from .. import registry
+from ..logger import LazyFormat, TRACE
+from .common import (check_shm, KeywordTable, Doorbell, shm_table_paths, monitor_doorbell_path,
+    READONLY, WRITEONLY, UPDATES, MODIFY, UNITS, UPDATE)
+
+__all__ = ['Service', 'Keyword']
+
+_registry = WeakSet()
+
+@registry.client.teardown_for("shm")
+def clear():
+    """Clear the registry."""
+    for service in list(_registry):
+        service.shutdown()
+    _registry.clear()
+
+class _ShmMonitorThread(threading.Thread):
+    """Watch the shared keyword table for changes to monitored keywords.
+    
+    The thread waits on a doorbell which it registers with each table, and which the dispatcher rings when it publishes a value. Tables are still polled every ``[shm] fallback`` seconds, to notice restarted dispatchers, or every ``[shm] poll`` seconds while a table has no free monitor slots.
+    """
+
+    def __init__(self, service):
+        super(_ShmMonitorThread, self).__init__(name="ktl.Service.{0:s}.Monitor".format(service.name))
+        self.service = weakref.proxy(service)
+        self.log = logging.getLogger("ktl.Service.{0:s}.Monitor".format(service.name))
+        self.monitored = set()
+        self.poll = service._poll
+        self.fallback = service._fallback
+        self.shutdown = threading.Event()
+        self.daemon = True
+        self.doorbell = None
+        self._sequences = {}
+        self._changes = {}
+        self._watching = {}
+
+    def start(self):
+        """Create this thread's doorbell, then start the thread."""
+        self.doorbell = Doorbell(monitor_doorbell_path(get_configuration()))
+        super(_ShmMonitorThread, self).start()
+
+    def run(self):
+        """Run the monitoring thread."""
+        while not self.shutdown.is_set():
+            try:
+                self.check()
+            except weakref.ReferenceError:
+                break
+            except Exception as e:
+                self.log.exception("Monitor error: {0!r}".format(e))
+            self.doorbell.wait(self.fallback if all(slot is not None for slot in self._watching.values()) else self.poll)
+
+    def watch(self, table):
+        """Register this thread's doorbell with a table."""
+        for other in list(self._watching):
+            if other.closed:
+                del self._watching[other]
+        slot = self._watching[table] = table.watch(self.doorbell.path)
+        if slot is None:
+            self.log.lazy(TRACE, "{0!r}.watch() no free monitor slots in '{1:s}', polling.", self, table.path)
+
+    def unwatch(self):
+        """Remove this thread's doorbell from every table."""
+        for table, slot in list(self._watching.items()):
+            if slot is not None and not table.closed:
+                table.unwatch(slot, self.doorbell.path)
+        self._watching = {}
+
+    def check(self):
+        """Propagate any changes to monitored keywords."""
+        changed = {}
+        for name in list(self.monitored):
+            keyword = self.service[name]
+            table, index = keyword._location()
+            if table not in self._watching:
+                self.watch(table)
+            if table not in changed:
+                changes = table.changes
+                changed[table] = (self._changes.get(table.path) != changes)
+                self._changes[table.path] = changes
+            if not changed[table]:
+                continue
+            sequence = table.sequence(index)
+            if self._sequences.get(name) == sequence:
+                continue
+            self._sequences[name] = sequence
+            _, value = table.read(index)
+            if value is not None:
+                try:
+                    keyword._update(value)
+                    self.log.lazy(TRACE, "{0!r}.monitor({1}={2})", self, keyword.name, value)
+                except Exception as e:
+                    self.log.exception("{0!r}._update() error: {1!r}".format(keyword, e))
+
+    def stop(self):
+        """Stop the monitoring thread."""
+        self.shutdown.set()
+        if self.is_alive():
+            self.doorbell.ring()
+            self.join()
+        if self.doorbell is not None:
+            self.unwatch()
+            self.doorbell.close()
+            self.doorbell = None
+
+class _ShmTaskQueue(threading.Thread):
+    """Complete asynchronous commands in the background."""
+
+    def __init__(self, service):
+        super(_ShmTaskQueue, self).__init__(name="ktl.Service.{0:s}.Tasks".format(service.name))
+        self.queue = queue.Queue()
+        self.daemon = True
+
+    def run(self):
+        """Run the task queue thread."""
+        while True:
+            task = self.queue.get()
+            if task is None:
+                break
+            task()
+
+    def stop(self):
+        """Stop the task queue thread."""
+        if self.is_alive():
+            self.queue.put(None)
+            self.join()
+
+@registry.client.service_for("shm")
+class Service(ClientService):
+
+    def __init__(self, name, populate=False):
+        check_shm()
+        self._tables = {}
+        self._locations = {}
+        self._lock = threading.RLock()
+        self._monitor = None
+        self._tasks = None
+        super(Service, self).__init__(name, populate)
+        _registry.add(self)
+
+    def _prepare(self):
+        """Open the shared keyword tables for this service."""
+        config = get_configuration()
+        self._poll = config.getfloat("shm", "poll")
+        self._fallback = config.getfloat("shm", "fallback")
+        self._refresh()
+        if not self._tables:
+            raise ServiceNotStarted("Service '{0!s}' is not started.".format(self.name))
+        self._monitor = _ShmMonitorThread(self)
+
+    def _refresh(self):
+        """Open any new or restarted tables, and rebuild the keyword index."""
+        with self._lock:
+            paths = set(shm_table_paths(get_configuration(), self.name))
+            for path, table in list(self._tables.items()):
+                if path not in paths or not table.running or table.replaced:
+                    del self._tables[path]
+                    table.close()
+            for path in paths.difference(self._tables):
+                try:
+                    table = KeywordTable.open(path)
+                except (OSError, IOError, ValueError) as e:
+                    self.log.debug("Can't open shared keyword table '{0}': {1!r}".format(path, e))
+                    continue
+                if table.running:
+                    self._tables[path] = table
+                else:
+                    table.close()
+            self._locations = {}
+            for table in self._tables.values():
+                for name, index in table.names().items():
+                    self._locations[name] = (table, index)
+
+    def _locate(self, name):
+        """Find the table and slot for a keyword."""
+        name = name.upper()
+        with self._lock:
+            try:
+                table, index = self._locations[name]
+            except KeyError:
+                table = None
+            if table is None or not table.running:
+                self._refresh()
+                table, index = self._locations[name]
+        return table, index
+
+    def _queue(self, task):
+        """Complete a task in the background."""
+        with self._lock:
+            if self._tasks is None:
+                self._tasks = _ShmTaskQueue(self)
+                self._tasks.start()
+        self._tasks.queue.put(task)
+
+    def shutdown(self):
+        """Shutdown this client."""
+        if getattr(self, '_monitor', None) is not None:
+            self._monitor.stop()
+        if getattr(self, '_tasks', None) is not None:
+            self._tasks.stop()
+            self._tasks = None
+        for table in list(getattr(self, '_tables', {}).values()):
+            table.close()
+        self._tables = {}
+        self._locations = {}
+        super(Service, self).shutdown()
+
+    def _has_keyword(self, name):
+        """Check for the existence of a keyword."""
+        try:
+            self._locate(name)
+        except KeyError:
+            return False
+        return True
+
+    def keywords(self):
+        """Return the list of all available keywords in this service instance."""
+        self._refresh()
+        return list(sorted(self._locations.keys()))
+
+    def _ktl_type(self, key):
+        """Return the KTL type of a named keyword."""
+        table, index = self._locate(key)
+        return table.ktl_type(index)
+
+@registry.client.keyword_for("shm")
+class Keyword(ClientKeyword):
+
+    def _location(self):
+        """The table and slot which hold this keyword."""
+        try:
+            return self.service._locate(self.name)
+        except KeyError:
+            raise DispatcherError("Keyword '{0}' is no longer available from any dispatcher.".format(self.name))
+
+    def _ktl_reads(self):
+        """Is this keyword readable?"""
+        table, index = self._location()
+        return not (table.flags(index) & WRITEONLY)
+
+    def _ktl_writes(self):
+        """Is this keyword writable?"""
+        table, index = self._location()
+        return not (table.flags(index) & READONLY)
+
+    def _ktl_monitored(self):
+        """Determine if this keyword is monitored."""
+        return self.name in self.service._monitor.monitored
+
+    def _ktl_units(self):
+        """Units for this keyword."""
+        if getattr(self, '_units', None) is None:
+            table, index = self._location()
+            self._receive_units(json.loads(table.wait(table.submit(index, UNITS, "", poll=self.service._poll), poll=self.service._poll)))
+        return '' if self._units is None else self._units
+
+    def monitor(self, start=True, prime=True, wait=True):
+        if start:
+            if prime:
+                self.read(wait=wait)
+            monitor = self.service._monitor
+            with self.service._lock:
+                monitor.monitored.add(self.name)
+                if not monitor.is_alive():
+                    monitor.start()
+        else:
+            self.service._monitor.monitored.discard(self.name)
+
+    def _read_task(self, timeout):
+        """Read this keyword's value directly from shared memory, after asking the dispatcher for an update if it customizes reads."""
+        table, index = self._location()
+        if table.flags(index) & UPDATES:
+            table.wait(table.submit(index, UPDATE, "", timeout=timeout, poll=self.service._poll), timeout=timeout, poll=self.service._poll)
+        _, value = table.read(index)
+        if value is not None:
+            self._update(value)
+
+    def read(self, binary=False, both=False, wait=True, timeout=None):
+        if not self['reads']:
+            raise ValueError("Keyword '{0}' does not support reads, it is write-only.".format(self.name))
+
+        if wait:
+            self._read_task(timeout)
+            return self._current_value(binary=binary, both=both)
+
+        task = Task(timeout, self._read_task, timeout)
+        self.service._queue(task)
+        return task
+
+    def _write_task(self, request):
+        """Wait for a write to complete."""
+        table, slot, timeout = request
+        self._update(table.wait(slot, timeout=timeout, poll=self.service._poll))
+
+    def write(self, value, wait=True, binary=False, timeout=None):
+        _call_msg = LazyFormat("{0!r}.write({1}, wait={2}, timeout={3})", self, value, wait, timeout)
+
+        if not self['writes']:
+            raise ValueError("Keyword '{0}' does not support writes, it is read-only.".format(self.name))
+
+        # User-facing convenience to make writes smoother.
+        try:
+            value = self.cast(value)
+        except (TypeError, ValueError): #pragma: no cover
+            pass
+
+        table, index = self._location()
+        slot = table.submit(index, MODIFY, str(value), timeout=timeout, poll=self.service._poll)
+        self.service.log.lazy(TRACE, "{0} submitted.", _call_msg)
+        if wait:
+            self._write_task((table, slot, timeout))
+            return
+
+        task = Task((table, slot, timeout), self._write_task, timeout)
+        self.service._queue(task)
+        return task
+
+    def wait(self, timeout=None, operator=None, value=None, sequence=None, reset=False, case=False):
+        if sequence is not None:
+            return sequence.wait(timeout=timeout)
+        raise CauldronAPINotImplemented("Asynchronous expression operations are not supported for Cauldron.shm")
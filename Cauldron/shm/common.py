@@ -0,0 +1,639 @@
+# -*- coding: utf-8 -*-
+"""
+Shared memory layout for the shm backend.
+
+Each dispatcher owns a single file (normally in ``/dev/shm``) which is memory mapped by the dispatcher and by every client on the same host. The file holds a fixed-size header, a table of keyword slots and a ring of client commands::
+
+    header | slot 0 | slot 1 | ... | slot N-1 | command 0 | ... | command M-1 | monitor 0 | ... | monitor K-1
+
+Keyword slots are written only by the dispatcher, and are guarded by a sequence counter (a seqlock): the counter is odd while the slot is being written, and readers retry until they see the same even value before and after copying the slot. Commands are written by clients while holding an exclusive :func:`fcntl.flock` on the file, and are answered in place by the dispatcher. Each command records the process which submitted it, so that the slot of a client which died before collecting its response can be reused. A named pipe next to the table acts as a doorbell, waking the dispatcher whenever a command is submitted.
+
+Clients which monitor keywords register their own doorbell in a monitor slot, and the dispatcher rings every registered doorbell whenever it publishes a value.
+"""
+from __future__ import absolute_import
+
+import os
+import six
+import time
+import mmap
+import errno
+import struct
+import select
+import tempfile
+import itertools
+import threading
+import contextlib
+
+from ..config import get_timeout
+from ..exc import DispatcherError, TimeoutError
+
+try:
+    import fcntl
+except ImportError: #pragma: no cover
+    fcntl = None
+
+__all__ = ['SHM_AVAILABLE', 'check_shm', 'KeywordTable', 'Doorbell', 'shm_directory', 'shm_table_path', 'shm_table_paths', 'monitor_doorbell_path']
+
+SHM_AVAILABLE = fcntl is not None and hasattr(os, 'mkfifo')
+
+MAGIC = b"CLDRSHM1"
+VERSION = 3
+
+#: Table states.
+STOPPED, RUNNING = 0, 1
+
+#: Keyword slot flags. ``UPDATES`` marks keywords which must be read through the dispatcher.
+HASVALUE, READONLY, WRITEONLY, UPDATES = 1, 2, 4, 8
+
+#: Command states.
+FREE, PENDING, DONE, FAILED, ABANDONED = 0, 1, 2, 3, 4
+
+#: Command kinds.
+MODIFY, UNITS, UPDATE = 1, 2, 3
+
+# magic, version, state, pid, capacity, value size, ring size, monitor slots, padding to align the counters
+HEADER = struct.Struct("<8sIIIIIII4x")
+STATE = 12
+COUNT = HEADER.size
+CHANGES = COUNT + 8
+HEAD = CHANGES + 8
+TAIL = HEAD + 8
+MONITORS = TAIL + 8
+HEADER_SIZE = MONITORS + 8
+
+# sequence, flags, length, name, KTL type
+SLOT = struct.Struct("<QII64s16s")
+
+# state, keyword index, kind, length, submitting process
+COMMAND = struct.Struct("<IIIII")
+
+# monitoring process, doorbell filename
+MONITOR = struct.Struct("<I60s")
+
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+
+def check_shm():
+    """Check if the shm backend is available on this platform."""
+    if SHM_AVAILABLE:
+        return
+    raise RuntimeError("The shm backend requires a POSIX platform with fcntl and named pipes.")
+
+def _align(size, alignment=8):
+    """Round `size` up to a multiple of `alignment`."""
+    return (size + alignment - 1) // alignment * alignment
+
+def _encode(value):
+    """Encode a keyword value as bytes."""
+    if isinstance(value, six.text_type):
+        return value.encode('utf-8')
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode('utf-8')
+
+def _decode(data):
+    """Decode bytes into a native keyword string."""
+    if six.PY2:
+        return bytes(data)
+    return data.decode('utf-8')
+
+def _backoff(poll):
+    """Yield increasing sleep intervals, capped at `poll`."""
+    delay = 1e-5
+    while True:
+        yield min(delay, poll)
+        delay *= 2
+
+def _alive(pid):
+    """Whether the process `pid` exists."""
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.ESRCH
+    return True
+
+def shm_directory(config):
+    """Get the directory which holds shared keyword tables."""
+    directory = config.get("shm", "directory")
+    if not directory:
+        directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.abspath(os.path.expanduser(directory))
+
+def _table_prefix(service):
+    """Filename prefix for tables belonging to a service."""
+    return "cauldron.{0:s}.".format(str(service).lower())
+
+def shm_table_path(config, service, dispatcher):
+    """The path to the shared keyword table for a single dispatcher."""
+    return os.path.join(shm_directory(config), "{0:s}{1:s}.shm".format(_table_prefix(service), dispatcher))
+
+def shm_table_paths(config, service):
+    """All shared keyword table paths for a service, one per dispatcher."""
+    directory = shm_directory(config)
+    prefix = _table_prefix(service)
+    try:
+        filenames = os.listdir(directory)
+    except OSError:
+        return []
+    return [ os.path.join(directory, filename) for filename in sorted(filenames)
+             if filename.startswith(prefix) and filename.endswith(".shm") ]
+
+def doorbell_path(path):
+    """The doorbell pipe which accompanies a table."""
+    return os.path.splitext(path)[0] + ".cmd"
+
+_monitor_doorbells = itertools.count()
+
+def monitor_doorbell_path(config):
+    """A new, unique path for a client's monitor doorbell, in the directory which holds shared keyword tables."""
+    return os.path.join(shm_directory(config), "cauldron-monitor.{0:d}.{1:d}.bell".format(os.getpid(), next(_monitor_doorbells)))
+
+class Doorbell(object):
+    """The dispatcher end of a command doorbell.
+
+    Clients write a single byte to the pipe after submitting a command, which wakes up a dispatcher blocked in :func:`select.select`.
+    """
+    def __init__(self, path):
+        super(Doorbell, self).__init__()
+        self.path = path
+        if os.path.exists(path):
+            os.unlink(path)
+        os.mkfifo(path, 0o600)
+        # Opening read-write means the pipe never reports EOF, and never blocks.
+        self._fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+
+    def fileno(self):
+        """File descriptor to select on."""
+        return self._fd
+
+    def wait(self, timeout=None):
+        """Wait until the doorbell rings, then drain it."""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if readable:
+            try:
+                while os.read(self._fd, 4096):
+                    pass
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+        return bool(readable)
+
+    def ring(self):
+        """Ring the doorbell from within the dispatcher."""
+        _ring(self._fd)
+
+    def close(self):
+        """Close and remove the doorbell."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+def _ring(fd):
+    """Write a wake-up byte to a doorbell file descriptor."""
+    try:
+        os.write(fd, b"\0")
+    except OSError as e:
+        # A full pipe will wake the dispatcher anyways.
+        if e.errno != errno.EAGAIN:
+            raise
+
+class KeywordTable(object):
+    """A memory-mapped table of keyword values, with a ring of client commands.
+
+    Use :meth:`create` in a dispatcher, and :meth:`open` in a client.
+    """
+    def __init__(self, path, fd):
+        super(KeywordTable, self).__init__()
+        self.path = path
+        self._fd = fd
+        self._doorbell = None
+        self._monitors = {}
+        self._monitors_changed = None
+        self._lock = threading.RLock()
+        self._mmap = mmap.mmap(fd, os.fstat(fd).st_size)
+        magic, version, _, self.pid, self.capacity, self.size, self.ring_size, self.monitors = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("'{0:s}' is not a Cauldron shared keyword table.".format(path))
+        self._slot_size = _align(SLOT.size + self.size)
+        self._command_size = _align(COMMAND.size + self.size)
+        self._ring_offset = HEADER_SIZE + self.capacity * self._slot_size
+        self._monitor_offset = self._ring_offset + self.ring_size * self._command_size
+
+    def __repr__(self):
+        return "<{0:s} path={1:s} count={2:d}>".format(self.__class__.__name__, self.path, self.count)
+
+    @classmethod
+    def create(cls, path, capacity, size, ring_size, monitors=32):
+        """Create a new table at `path`, replacing any existing table.
+
+        The table is written to a temporary file and renamed into place, so clients never see a partial table, and clients which still map an old table keep a valid (but stopped) mapping.
+        """
+        length = (HEADER_SIZE + capacity * _align(SLOT.size + size) + ring_size * _align(COMMAND.size + size)
+                  + monitors * MONITOR.size)
+        partial = "{0:s}.{1:d}.tmp".format(path, os.getpid())
+        fd = os.open(partial, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, length)
+            os.write(fd, HEADER.pack(MAGIC, VERSION, STOPPED, os.getpid(), capacity, size, ring_size, monitors))
+            os.rename(partial, path)
+        except Exception:
+            os.close(fd)
+            os.unlink(partial)
+            raise
+        return cls(path, fd)
+
+    @classmethod
+    def open(cls, path):
+        """Open an existing table."""
+        fd = os.open(path, os.O_RDWR)
+        if os.fstat(fd).st_size < HEADER_SIZE:
+            os.close(fd)
+            raise ValueError("'{0:s}' is not a Cauldron shared keyword table.".format(path))
+        return cls(path, fd)
+
+    def close(self):
+        """Close this table's mapping."""
+        if self._doorbell is not None:
+            os.close(self._doorbell)
+            self._doorbell = None
+        for _, fd in self._monitors.values():
+            if fd is not None:
+                os.close(fd)
+        self._monitors = {}
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    @property
+    def closed(self):
+        """Whether this table has been closed."""
+        return self._mmap is None
+
+    def _get(self, fmt, offset):
+        return fmt.unpack_from(self._mmap, offset)[0]
+
+    def _set(self, fmt, offset, value):
+        fmt.pack_into(self._mmap, offset, value)
+
+    @property
+    def running(self):
+        """Whether the owning dispatcher is running."""
+        return self._mmap is not None and self._get(_U32, STATE) == RUNNING
+
+    @running.setter
+    def running(self, value):
+        self._set(_U32, STATE, RUNNING if value else STOPPED)
+
+    @property
+    def stale(self):
+        """Whether this table is marked running, but its dispatcher process is gone."""
+        return self.running and not _alive(self.pid)
+
+    @property
+    def replaced(self):
+        """Whether the file at this table's path is no longer this table."""
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._fd).st_ino
+        except OSError:
+            return True
+
+    @property
+    def count(self):
+        """Number of keywords in the table."""
+        return self._get(_U64, COUNT)
+
+    @property
+    def changes(self):
+        """A counter which increments whenever any keyword slot changes."""
+        return self._get(_U64, CHANGES)
+
+    def _slot(self, index):
+        """The offset of a keyword slot."""
+        if not 0 <= index < self.capacity:
+            raise IndexError("Slot {0:d} is out of range.".format(index))
+        return HEADER_SIZE + index * self._slot_size
+
+    def register(self, name, ktl_type):
+        """Add a keyword to the table, returning its slot index."""
+        with self._lock:
+            index = self.count
+            if index >= self.capacity:
+                raise ValueError("Shared keyword table '{0:s}' is full ({1:d} keywords).".format(self.path, self.capacity))
+            SLOT.pack_into(self._mmap, self._slot(index), 0, 0, 0, _encode(name), _encode(ktl_type or ""))
+            self._set(_U64, COUNT, index + 1)
+        return index
+
+    def names(self):
+        """A mapping of keyword names to slot indices."""
+        names = {}
+        for index in range(self.count):
+            names[_decode(SLOT.unpack_from(self._mmap, self._slot(index))[3].rstrip(b"\0"))] = index
+        return names
+
+    def ktl_type(self, index):
+        """The KTL type stored with a keyword."""
+        return _decode(SLOT.unpack_from(self._mmap, self._slot(index))[4].rstrip(b"\0"))
+
+    def sequence(self, index):
+        """The sequence counter for a keyword slot."""
+        return self._get(_U64, self._slot(index))
+
+    @contextlib.contextmanager
+    def _writing(self, index):
+        """Hold the seqlock for a slot while it is written."""
+        with self._lock:
+            offset = self._slot(index)
+            sequence = self._get(_U64, offset)
+            self._set(_U64, offset, sequence + 1)
+            try:
+                yield offset
+            finally:
+                self._set(_U64, offset, sequence + 2)
+                self._set(_U64, CHANGES, self.changes + 1)
+
+    def publish(self, index, value):
+        """Publish a new value to a keyword slot.
+
+        Raises :exc:`ValueError` for values larger than the table's value size, which is set by ``[shm] size``.
+        """
+        data = b"" if value is None else _encode(value)
+        if len(data) > self.size:
+            name = _decode(SLOT.unpack_from(self._mmap, self._slot(index))[3].rstrip(b"\0"))
+            raise ValueError("Value of keyword '{0:s}' is {1:d} bytes, larger than the {2:d} bytes available in shared memory. "
+                             "Increase [shm] size to publish larger values.".format(name, len(data), self.size))
+        with self._writing(index) as offset:
+            flags = self._get(_U32, offset + 8)
+            flags = (flags | HASVALUE) if value is not None else (flags & ~HASVALUE)
+            self._set(_U32, offset + 8, flags)
+            self._set(_U32, offset + 12, len(data))
+            self._mmap[offset + SLOT.size:offset + SLOT.size + len(data)] = data
+        with self._lock:
+            self._ring_monitors()
+
+    def flag(self, index, flag, value):
+        """Set or clear a flag on a keyword slot."""
+        with self._writing(index) as offset:
+            flags = self._get(_U32, offset + 8)
+            flags = (flags | flag) if value else (flags & ~flag)
+            self._set(_U32, offset + 8, flags)
+
+    def read(self, index, timeout=1.0):
+        """Read a keyword slot, returning ``(flags, value)``.
+
+        Raises :exc:`DispatcherError` if the slot is still being written after `timeout` seconds, or its dispatcher has died mid-write.
+        """
+        offset = self._slot(index)
+        deadline = time.time() + timeout
+        for delay in _backoff(1e-3):
+            sequence = self._get(_U64, offset)
+            if sequence % 2:
+                if self.stale or time.time() > deadline:
+                    raise DispatcherError("Keyword slot {0:d} in '{1:s}' was left half written.".format(index, self.path))
+                time.sleep(delay)
+                continue
+            _, flags, length = struct.unpack_from("<QII", self._mmap, offset)
+            data = self._mmap[offset + SLOT.size:offset + SLOT.size + min(length, self.size)]
+            if self._get(_U64, offset) == sequence:
+                break
+        return flags, (_decode(data) if flags & HASVALUE else None)
+
+    def flags(self, index):
+        """Read only the flags of a keyword slot."""
+        return self.read(index)[0]
+
+    @contextlib.contextmanager
+    def _exclusive(self):
+        """Hold exclusive access to the command ring, across threads and processes."""
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _command(self, slot):
+        """The offset of a command slot."""
+        return self._ring_offset + slot * self._command_size
+
+    def _write_payload(self, offset, state, payload):
+        """Write a command or response payload, then its state."""
+        data = _encode(payload)[:self.size]
+        self._set(_U32, offset + 12, len(data))
+        self._mmap[offset + COMMAND.size:offset + COMMAND.size + len(data)] = data
+        self._set(_U32, offset, state)
+
+    def _read_payload(self, offset):
+        """Read a command or response payload."""
+        length = self._get(_U32, offset + 12)
+        return _decode(self._mmap[offset + COMMAND.size:offset + COMMAND.size + min(length, self.size)])
+
+    def submit(self, index, kind, payload, timeout=None, poll=0.01):
+        """Submit a command to the dispatcher, returning the command slot to wait on.
+
+        Commands take the first free slot from the head of the ring, skipping slots which hold a response that a client hasn't collected yet. The ring never holds more than one lap of commands ahead of the dispatcher, so commands are still answered in the order they were submitted.
+        """
+        data = _encode(payload)
+        if len(data) > self.size:
+            raise ValueError("Value is {0:d} bytes, larger than the {1:d} bytes available in shared memory.".format(len(data), self.size))
+        timeout = get_timeout(timeout)
+        deadline = None if timeout is None else time.time() + timeout
+        for delay in _backoff(poll):
+            with self._exclusive():
+                position = self._claim()
+                if position is not None:
+                    slot = position % self.ring_size
+                    offset = self._command(slot)
+                    self._set(_U32, offset + 4, index)
+                    self._set(_U32, offset + 8, kind)
+                    self._set(_U32, offset + 16, os.getpid())
+                    self._write_payload(offset, PENDING, data)
+                    # The dispatcher skips slots before the head which aren't pending, so move the head only once the command is written.
+                    self._set(_U64, HEAD, position + 1)
+                    break
+            if deadline is not None and time.time() > deadline:
+                raise TimeoutError("Command ring for '{0:s}' is full.".format(self.path))
+            time.sleep(delay)
+        try:
+            self._ring()
+        except DispatcherError:
+            self._abandon(slot)
+            raise
+        return slot
+
+    def _claim(self):
+        """Find the position of the first free command slot from the head of the ring, or return None if the ring is full.
+
+        Must be called with exclusive access to the ring.
+        """
+        for position in range(self._get(_U64, HEAD), self._get(_U64, TAIL) + self.ring_size):
+            slot = position % self.ring_size
+            offset = self._command(slot)
+            state = self._get(_U32, offset)
+            if state in (DONE, FAILED) and not _alive(self._get(_U32, offset + 16)):
+                # The client which submitted this command died before collecting the response.
+                state = FREE
+            if state == FREE:
+                return position
+        return None
+
+    def _ring(self):
+        """Ring the dispatcher's doorbell.
+
+        Raises :exc:`DispatcherError` when nobody is listening to the doorbell, i.e. the dispatcher has exited.
+        """
+        if self._doorbell is None:
+            try:
+                self._doorbell = os.open(doorbell_path(self.path), os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as e:
+                raise DispatcherError("Dispatcher for '{0:s}' is not listening: {1!s}".format(self.path, e))
+        try:
+            _ring(self._doorbell)
+        except OSError as e:
+            if e.errno != errno.EPIPE:
+                raise
+            os.close(self._doorbell)
+            self._doorbell = None
+            raise DispatcherError("Dispatcher for '{0:s}' is not listening: {1!s}".format(self.path, e))
+
+    def _abandon(self, slot):
+        """Abandon a pending command, returning True if it was still pending."""
+        offset = self._command(slot)
+        with self._exclusive():
+            if self._get(_U32, offset) == PENDING:
+                self._set(_U32, offset, ABANDONED)
+                return True
+        return False
+
+    def wait(self, slot, timeout=None, poll=0.01):
+        """Wait for a response to a command, returning the response payload.
+
+        Raises :exc:`DispatcherError` when the dispatcher reports an error, stops running or dies, and :exc:`TimeoutError` when `timeout` expires. A command which times out is abandoned, and its slot will be freed by the dispatcher.
+        """
+        timeout = get_timeout(timeout)
+        deadline = None if timeout is None else time.time() + timeout
+        offset = self._command(slot)
+        for delay in _backoff(poll):
+            if self._get(_U32, offset) in (DONE, FAILED):
+                break
+            if not self.running:
+                raise DispatcherError("Dispatcher for '{0:s}' stopped.".format(self.path))
+            if self.stale:
+                self._abandon(slot)
+                raise DispatcherError("Dispatcher for '{0:s}' died in process {1:d}.".format(self.path, self.pid))
+            if deadline is not None and time.time() > deadline:
+                if self._abandon(slot):
+                    raise TimeoutError("Command timed out.")
+                break
+            time.sleep(delay)
+
+        with self._exclusive():
+            state = self._get(_U32, offset)
+            response = self._read_payload(offset)
+            self._set(_U32, offset, FREE)
+        if state == FAILED:
+            raise DispatcherError(response)
+        return response
+
+    def _monitor(self, slot):
+        """The offset of a monitor slot."""
+        return self._monitor_offset + slot * MONITOR.size
+
+    def watch(self, path):
+        """Register the monitor doorbell at `path`, which must be in the same directory as this table.
+
+        Returns the monitor slot, or None when every monitor slot is taken by a live process.
+        """
+        name = _encode(os.path.basename(path))
+        if len(name) > MONITOR.size - 4:
+            raise ValueError("Monitor doorbell name '{0:s}' is too long.".format(path))
+        with self._exclusive():
+            for slot in range(self.monitors):
+                offset = self._monitor(slot)
+                pid = self._get(_U32, offset)
+                if pid == 0 or not _alive(pid):
+                    MONITOR.pack_into(self._mmap, offset, os.getpid(), name)
+                    self._set(_U64, MONITORS, self._get(_U64, MONITORS) + 1)
+                    return slot
+        return None
+
+    def unwatch(self, slot, path):
+        """Remove the monitor doorbell at `path` from a monitor slot."""
+        name = _encode(os.path.basename(path))
+        with self._exclusive():
+            offset = self._monitor(slot)
+            pid, registered = MONITOR.unpack_from(self._mmap, offset)
+            if pid == os.getpid() and registered.rstrip(b"\0") == name:
+                MONITOR.pack_into(self._mmap, offset, 0, b"")
+                self._set(_U64, MONITORS, self._get(_U64, MONITORS) + 1)
+
+    def _open_monitors(self):
+        """Open the doorbells of monitors which registered since the last time a value was published."""
+        changed = self._get(_U64, MONITORS)
+        if changed == self._monitors_changed:
+            return
+        self._monitors_changed = changed
+        directory = os.path.dirname(self.path)
+        for slot in range(self.monitors):
+            pid, name = MONITOR.unpack_from(self._mmap, self._monitor(slot))
+            name = _decode(name.rstrip(b"\0")) if pid else None
+            current = self._monitors.get(slot)
+            if current is not None and current[0] == name:
+                continue
+            if current is not None:
+                self._monitors.pop(slot)
+                if current[1] is not None:
+                    os.close(current[1])
+            if name is not None:
+                try:
+                    fd = os.open(os.path.join(directory, name), os.O_WRONLY | os.O_NONBLOCK)
+                except OSError:
+                    # The monitor has gone away, it will be removed when another monitor claims the slot.
+                    fd = None
+                self._monitors[slot] = (name, fd)
+
+    def _ring_monitors(self):
+        """Ring the doorbell of every registered monitor."""
+        self._open_monitors()
+        for slot, (name, fd) in list(self._monitors.items()):
+            if fd is None:
+                continue
+            try:
+                _ring(fd)
+            except OSError as e:
+                if e.errno != errno.EPIPE:
+                    raise
+                # Nobody reads this doorbell anymore.
+                os.close(fd)
+                self._monitors[slot] = (name, None)
+
+    def pending(self):
+        """Return the next pending command as ``(slot, index, kind, payload)``, or None."""
+        tail = self._get(_U64, TAIL)
+        while tail < self._get(_U64, HEAD):
+            slot = tail % self.ring_size
+            offset = self._command(slot)
+            if self._get(_U32, offset) in (PENDING, ABANDONED):
+                return slot, self._get(_U32, offset + 4), self._get(_U32, offset + 8), self._read_payload(offset)
+            # A slot which was skipped by submit, as it held an uncollected response.
+            tail += 1
+            self._set(_U64, TAIL, tail)
+        return None
+
+    def respond(self, slot, response, ok=True):
+        """Respond to the command at the tail of the ring."""
+        offset = self._command(slot)
+        with self._exclusive():
+            if self._get(_U32, offset) == ABANDONED:
+                self._set(_U32, offset, FREE)
+            else:
+                self._write_payload(offset, DONE if ok else FAILED, response)
+            self._set(_U64, TAIL, self._get(_U64, TAIL) + 1)
+
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Dispatcher implementation for the shm backend.
+
+The dispatcher owns the shared keyword table. Every keyword value is published to the table when it is set, and a single responder thread answers client commands from the command ring, and runs scheduled keyword updates.
+"""
+from __future__ import absolute_import
+
+import os
+import json
+import time
+import weakref
+import logging
+import threading
+
+from ..base import DispatcherService, DispatcherKeyword
+from ..scheduler import Scheduler
+from .. import registry
+from ..logger import TRACE
+from .common import (check_shm, KeywordTable, Doorbell, shm_table_path, doorbell_path, _encode,
+    READONLY, WRITEONLY, UPDATES, MODIFY, UNITS, UPDATE)
+
+__all__ = ['Service', 'Keyword']
+
+_registry = weakref.WeakValueDictionary()
+
+#: Modules whose read hooks only return the stored value, so reads can skip the dispatcher.
+_PASSIVE_MODULES = ("Cauldron.base.", "Cauldron.types", __name__)
+
+@registry.dispatcher.teardown_for("shm")
+def clear():
+    """Clear the registry."""
+    for service in list(_registry.values()):
+        service.shutdown()
+    _registry.clear()
+
+class ShmResponder(Scheduler, threading.Thread):
+    """Answer client commands from the command ring, and run scheduled keyword updates."""
+
+    def __init__(self, service):
+        super(ShmResponder, self).__init__(name="DFW.Service.{0:s}.Responder".format(service.name))
+        self.service = weakref.proxy(service)
+        self.log = logging.getLogger("DFW.Service.{0:s}.Responder".format(service.name))
+        self.table = None
+        self.doorbell = None
+        self.shutdown = threading.Event()
+        self.daemon = True
+        self.handlers = {MODIFY : self.handle_modify, UNITS : self.handle_units, UPDATE : self.handle_update}
+
+    def wake(self):
+        """Wake up the thread."""
+        if self.doorbell is not None:
+            self.doorbell.ring()
+        
+    def listen(self, table):
+        """Start answering commands for `table`."""
+        self.table = table
+        self.doorbell = Doorbell(doorbell_path(table.path))
+        self.start()
+
+    def run(self):
+        """Run the responder thread."""
+        while not self.shutdown.is_set():
+            self.doorbell.wait(self.get_timeout())
+            self.respond()
+            now = time.time()
+            self.run_periods(at=now)
+            self.run_appointments(at=now)
+
+    def respond(self):
+        """Answer every pending command."""
+        while True:
+            command = self.table.pending()
+            if command is None:
+                break
+            slot, index, kind, payload = command
+            try:
+                keyword = self.service._shared[index]
+                response = self.handlers[kind](keyword, payload)
+            except Exception as e:
+                self.log.lazy(TRACE, "{0!r}.respond({1:d}) error: {2!r}", self, index, e)
+                self.table.respond(slot, str(e), ok=False)
+            else:
+                self.table.respond(slot, response)
+
+    def handle_modify(self, keyword, payload):
+        """Handle a modify command."""
+        with keyword._lock:
+            keyword.modify(payload)
+        return str(keyword.value)
+
+    def handle_update(self, keyword, payload):
+        """Handle an update command. The new value is published to the table by the update itself."""
+        with keyword._lock:
+            keyword.update()
+        return ""
+        
+    def handle_units(self, keyword, payload):
+        """Handle the units command."""
+        return json.dumps(keyword._get_units())
+
+    def stop(self):
+        """Stop the responder thread."""
+        self.shutdown.set()
+        if self.is_alive():
+            self.wake()
+            self.join()
+        # The doorbell is closed only once the thread has finished, so that waking the thread never rings a closed doorbell.
+        if self.doorbell is not None:
+            self.doorbell.close()
+            self.doorbell = None
+        self.log.debug("Closed responder")
+
+@registry.dispatcher.service_for("shm")
+class Service(DispatcherService):
+
+    _table = None
+    _responder = None
+
+    def __init__(self, name, config, setup=None, dispatcher=None):
+        check_shm()
+        self._shared = []
+        super(Service, self).__init__(name, config, setup, dispatcher)
+
+    def _prepare(self):
+        """Claim the shared keyword table path."""
+        path = shm_table_path(self._config, self.name, self.dispatcher)
+        if os.path.exists(path):
+            try:
+                existing = KeywordTable.open(path)
+            except ValueError:
+                pass
+            else:
+                try:
+                    if existing.running and not existing.stale:
+                        raise ValueError("Service '{0}' dispatcher '{1}' is already running in process {2:d}.".format(self.name, self.dispatcher, existing.pid))
+                finally:
+                    existing.close()
+        self._path = path
+        self._responder = ShmResponder(self)
+
+    def _begin(self):
+        """Create the shared keyword table, publish every keyword, and start responding to clients."""
+        capacity = max(self._config.getint("shm", "keywords"), 2 * len(self._keywords))
+        self._table = KeywordTable.create(self._path, capacity,
+            self._config.getint("shm", "size"), self._config.getint("shm", "commands"), self._config.getint("shm", "monitors"))
+        for keyword in self:
+            if keyword is not None:
+                keyword._share()
+        self._table.running = True
+        _registry[self.name, self.dispatcher] = self
+        self._responder.listen(self._table)
+
+    def __setitem__(self, name, value):
+        """Add a keyword, checking that its initial value fits in the shared keyword table."""
+        size = self._config.getint("shm", "size")
+        initial = getattr(value, 'initial', None)
+        length = 0 if initial is None else len(_encode(initial))
+        if length > size:
+            raise ValueError("Initial value of keyword '{0:s}' is {1:d} bytes, larger than the {2:d} bytes available in shared memory. "
+                             "Increase [shm] size to use larger values.".format(value.name, length, size))
+        super(Service, self).__setitem__(name, value)
+
+    def shutdown(self):
+        """Stop responding to clients, and remove the shared keyword table."""
+        if self._responder is not None:
+            self._responder.stop()
+            self._responder = None
+        if self._table is not None:
+            self._table.running = False
+            if not self._table.replaced:
+                os.unlink(self._table.path)
+            self._table.close()
+            self._table = None
+
+
+@registry.dispatcher.keyword_for("shm")
+class Keyword(DispatcherKeyword):
+
+    __slots__ = ('_index', '_readonly', '_writeonly')
+
+    def __init__(self, name, service, initial=None, period=None):
+        self._index = None
+        super(Keyword, self).__init__(name, service, initial, period)
+        if service._table is not None:
+            self._share()
+
+    def _share(self):
+        """Add this keyword to the shared keyword table."""
+        table = self.service._table
+        with table._lock:
+            # The responder finds keywords in _shared by their slot index, so they must be added in the same order.
+            self._index = table.register(self.name, self.KTL_TYPE)
+            self.service._shared.append(self)
+        table.flag(self._index, READONLY, self.readonly)
+        table.flag(self._index, WRITEONLY, self.writeonly)
+        table.flag(self._index, UPDATES, not self._passive())
+        if self.value is not None:
+            table.publish(self._index, self.value)
+
+    def _passive(self):
+        """Whether this keyword's read hooks are the defaults, so that clients can read it straight from shared memory."""
+        for method in ('preread', 'read', 'postread'):
+            for cls in type(self).__mro__:
+                if method in cls.__dict__:
+                    if not cls.__module__.startswith(_PASSIVE_MODULES):
+                        return False
+                    break
+        return True
+        
+    @property
+    def readonly(self):
+        """Whether clients may write to this keyword."""
+        return self._readonly
+
+    @readonly.setter
+    def readonly(self, value):
+        self._readonly = bool(value)
+        if self._index is not None:
+            self.service._table.flag(self._index, READONLY, self._readonly)
+
+    @property
+    def writeonly(self):
+        """Whether clients may read from this keyword."""
+        return self._writeonly
+
+    @writeonly.setter
+    def writeonly(self, value):
+        self._writeonly = bool(value)
+        if self._index is not None:
+            self.service._table.flag(self._index, WRITEONLY, self._writeonly)
+
+    def _broadcast(self, value):
+        """Publish this value to the shared keyword table."""
+        if self._index is not None:
+            self.service._table.publish(self._index, value)
+
+    def schedule(self, appointment=None, cancel=False):
+        if cancel:
+            self.service._responder.cancel_appointment(appointment, self)
+        else:
+            self.service._responder.appointment(appointment, self)
+
+    def period(self, period):
+        self.service._responder.period(period, self)
@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+
+def requires_2to3():
+    """Skip 2to3 on package contents."""
+    return False
\ No newline at end of file
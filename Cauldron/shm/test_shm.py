@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+"""
+Tests specific to the shm backend.
+"""
+
+import os
+import sys
+import subprocess
+import textwrap
+
+import pytest
+from ..conftest import fail_if_not_teardown, available_backends
+from ..exc import DispatcherError, TimeoutError
+pytestmark = [pytest.mark.usefixtures("teardown_cauldron"),
+              pytest.mark.skipif("shm" not in available_backends, reason="requires shm")]
+
+@pytest.fixture
+def shmdir(config, tmpdir):
+    """Keep shared keyword tables in a temporary directory."""
+    config.set("shm", "directory", str(tmpdir))
+    return str(tmpdir)
+
+@pytest.fixture
+def backend(request, shmdir):
+    """Use the shm backend."""
+    from Cauldron.api import use
+    use('shm')
+    request.addfinalizer(fail_if_not_teardown)
+
+@pytest.fixture
+def shm_service(request, backend, servicename, config, keyword_name):
+    """A dispatcher service."""
+    from Cauldron.DFW import Service
+    svc = Service(servicename, config=config)
+    mykw = svc[keyword_name]
+    request.addfinalizer(svc.shutdown)
+    return svc
+
+@pytest.fixture
+def shm_client(request, shm_service, servicename):
+    """A client service."""
+    from Cauldron import ktl
+    svc = ktl.Service(servicename)
+    request.addfinalizer(svc.shutdown)
+    return svc
+
+@pytest.fixture
+def table(request, tmpdir):
+    """A bare keyword table."""
+    from .common import KeywordTable
+    table = KeywordTable.create(str(tmpdir.join("cauldron.table.DEFAULT.shm")), 4, 16, 2)
+    request.addfinalizer(table.close)
+    return table
+
+def test_table_publish(table):
+    """Test publishing values to a keyword table."""
+    from .common import KeywordTable, READONLY
+    index = table.register("KEYWORD", "string")
+    assert table.names() == {"KEYWORD" : index}
+    assert table.ktl_type(index) == "string"
+    assert table.read(index) == (0, None)
+
+    table.publish(index, "value")
+    assert table.read(index)[1] == "value"
+    assert table.sequence(index) % 2 == 0
+    table.flag(index, READONLY, True)
+    assert table.flags(index) & READONLY
+
+    other = KeywordTable.open(table.path)
+    try:
+        assert other.read(index)[1] == "value"
+    finally:
+        other.close()
+
+    with pytest.raises(ValueError):
+        table.publish(index, "x" * 17)
+
+def test_table_full(table):
+    """Test registering more keywords than a table holds."""
+    for i in range(table.capacity):
+        table.register("KEYWORD{0:d}".format(i), "string")
+    with pytest.raises(ValueError):
+        table.register("EXTRA", "string")
+
+def test_table_commands(table):
+    """Test the command ring."""
+    from .common import Doorbell, doorbell_path, MODIFY
+    doorbell = Doorbell(doorbell_path(table.path))
+    try:
+        table.running = True
+        slot = table.submit(0, MODIFY, "10")
+        assert doorbell.wait(0.0)
+        assert table.pending() == (slot, 0, MODIFY, "10")
+        table.respond(slot, "response")
+        assert table.pending() is None
+        assert table.wait(slot) == "response"
+
+        slot = table.submit(0, MODIFY, "11")
+        table.respond(slot, "bad value", ok=False)
+        with pytest.raises(DispatcherError):
+            table.wait(slot)
+
+        # Abandoned commands are freed by the responder.
+        slot = table.submit(0, MODIFY, "12")
+        with pytest.raises(TimeoutError):
+            table.wait(slot, timeout=0.01)
+        table.respond(slot, "late")
+        for i in range(table.ring_size):
+            slot = table.submit(0, MODIFY, str(i))
+            table.respond(slot, str(i))
+            assert table.wait(slot) == str(i)
+    finally:
+        doorbell.close()
+
+def dead_pid():
+    """The process ID of a process which has exited."""
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+def test_table_read_half_written(table):
+    """Test reading a slot which is never finished."""
+    from .common import _U64
+    index = table.register("KEYWORD", "string")
+    table.publish(index, "value")
+    offset = table._slot(index)
+    table._set(_U64, offset, table.sequence(index) + 1)
+    with pytest.raises(DispatcherError):
+        table.read(index, timeout=0.01)
+
+    # A dead dispatcher fails immediately.
+    table.running = True
+    table.pid = dead_pid()
+    with pytest.raises(DispatcherError):
+        table.read(index, timeout=60.0)
+
+def test_table_dead_dispatcher(table):
+    """Test waiting on and ringing a dispatcher which has died."""
+    from .common import Doorbell, doorbell_path, MODIFY, ABANDONED, _U32
+    doorbell = Doorbell(doorbell_path(table.path))
+    try:
+        table.running = True
+        slot = table.submit(0, MODIFY, "10")
+        table.pid = dead_pid()
+        with pytest.raises(DispatcherError):
+            table.wait(slot)
+        assert table._get(_U32, table._command(slot)) == ABANDONED
+    finally:
+        doorbell.close()
+
+    # Nobody is listening to the doorbell any more.
+    with pytest.raises(DispatcherError):
+        table.submit(0, MODIFY, "11")
+    assert table._get(_U32, table._command(slot + 1)) == ABANDONED
+
+def test_table_monitors(table):
+    """Test ringing monitor doorbells when values are published."""
+    from .common import Doorbell, MONITOR
+    index = table.register("KEYWORD", "string")
+    doorbell = Doorbell(table.path + ".bell")
+    try:
+        slot = table.watch(doorbell.path)
+        table.publish(index, "value")
+        assert doorbell.wait(0.0)
+        table.unwatch(slot, doorbell.path)
+        table.publish(index, "other")
+        assert not doorbell.wait(0.0)
+
+        # Slots held by monitors which have died are reused.
+        slot = table.watch(doorbell.path)
+        MONITOR.pack_into(table._mmap, table._monitor(slot), dead_pid(), b"dead.bell")
+        assert table.watch(doorbell.path) == slot
+    finally:
+        doorbell.close()
+    # A monitor which stopped reading its doorbell doesn't stop values from being published.
+    table.publish(index, "closed")
+    assert table.read(index)[1] == "closed"
+
+def test_table_reclaim_commands(table):
+    """Test that commands from dead clients are reclaimed once the ring wraps around."""
+    from .common import Doorbell, doorbell_path, MODIFY, _U32
+    doorbell = Doorbell(doorbell_path(table.path))
+    try:
+        table.running = True
+        for i in range(table.ring_size):
+            slot = table.submit(0, MODIFY, str(i))
+            table.respond(slot, str(i))
+            table._set(_U32, table._command(slot) + 16, dead_pid())
+        slot = table.submit(0, MODIFY, "reclaimed", timeout=0.1)
+        table.respond(slot, "reclaimed")
+        assert table.wait(slot) == "reclaimed"
+
+        # Responses which a live client hasn't collected are kept.
+        for i in range(table.ring_size):
+            table.submit(0, MODIFY, str(i))
+        with pytest.raises(TimeoutError):
+            table.submit(0, MODIFY, "full", timeout=0.01)
+    finally:
+        doorbell.close()
+
+def test_table_skip_uncollected(table):
+    """Test that commands skip slots holding responses which haven't been collected yet."""
+    from .common import Doorbell, doorbell_path, MODIFY
+    doorbell = Doorbell(doorbell_path(table.path))
+    try:
+        table.running = True
+        first = table.submit(0, MODIFY, "first")
+        assert table.pending()[0] == first
+        table.respond(first, "first")
+        second = table.submit(0, MODIFY, "second")
+        table.respond(second, "second")
+        assert table.wait(second) == "second"
+        
+        # The head of the ring still holds the uncollected first response.
+        third = table.submit(0, MODIFY, "third", timeout=0.1)
+        assert third == second
+        assert table.pending() == (third, 0, MODIFY, "third")
+        table.respond(third, "third")
+        assert table.pending() is None
+        assert table.wait(third) == "third"
+        assert table.wait(first) == "first"
+        
+        # Commands are still answered in order, after the ring wraps around.
+        slots = [ table.submit(0, MODIFY, str(i)) for i in range(table.ring_size) ]
+        for i, slot in enumerate(slots):
+            assert table.pending() == (slot, 0, MODIFY, str(i))
+            table.respond(slot, str(i))
+        assert [ table.wait(slot) for slot in slots ] == [ str(i) for i in range(table.ring_size) ]
+    finally:
+        doorbell.close()
+
+def test_duplicate_services(backend, servicename, config):
+    """Test duplicate services."""
+    from Cauldron.DFW import Service
+    svc = Service(servicename, config=config)
+    with pytest.raises(ValueError):
+        svc2 = Service(servicename, config=config)
+    svc.shutdown()
+
+def test_client_not_started(backend, servicename):
+    """Use shm, but fail when a client hasn't been started yet."""
+    from Cauldron.exc import ServiceNotStarted
+    from Cauldron.ktl import Service
+    with pytest.raises(ServiceNotStarted):
+        Service(servicename)
+
+def test_shutdown_removes_table(backend, servicename, config, shmdir):
+    """Test that a dispatcher removes its table when it shuts down."""
+    from Cauldron.DFW import Service
+    svc = Service(servicename, config=config)
+    assert len(os.listdir(shmdir)) == 2
+    svc.shutdown()
+    assert os.listdir(shmdir) == []
+
+def test_readonly(shm_client, shm_service, keyword_name):
+    """Test a read only keyword."""
+    shm_service[keyword_name].readonly = True
+    with pytest.raises(ValueError):
+        shm_client[keyword_name].write("10")
+
+def test_monitor_doorbell(shm_client, shm_service, keyword_name, config, shmdir):
+    """Test that monitors are woken up by the dispatcher, rather than by polling."""
+    import threading
+    config.set("shm", "fallback", "60")
+    client = shm_client.__class__(shm_client.name)
+    try:
+        keyword = client[keyword_name]
+        received = threading.Event()
+        def callback(kwd):
+            received.set()
+        keyword.callback(callback)
+        keyword.monitor()
+        received.clear()
+        assert any(filename.endswith(".bell") for filename in os.listdir(shmdir))
+        shm_service[keyword_name].modify("monitored")
+        assert received.wait(5.0)
+        assert keyword['ascii'] == "monitored"
+    finally:
+        client.shutdown()
+    assert not any(filename.endswith(".bell") for filename in os.listdir(shmdir))
+
+def test_value_too_large(shm_client, shm_service, keyword_name, config):
+    """Test writing a value which doesn't fit in shared memory."""
+    with pytest.raises(ValueError):
+        shm_client[keyword_name].write("x" * (config.getint("shm", "size") + 1))
+
+def test_initial_value_too_large(backend, servicename, config, keyword_name):
+    """Test creating a keyword with an initial value which doesn't fit in shared memory."""
+    from Cauldron import DFW
+    svc = DFW.Service(servicename, config=config)
+    try:
+        with pytest.raises(ValueError) as excinfo:
+            DFW.Keyword.String(keyword_name, svc, initial="x" * (config.getint("shm", "size") + 1))
+        assert "[shm] size" in str(excinfo.value)
+        assert keyword_name not in svc._keywords or svc._keywords[keyword_name] is None
+    finally:
+        svc.shutdown()
+
+def test_dispatcher_restart(backend, servicename, config, keyword_name):
+    """Test a client which outlives a dispatcher."""
+    from Cauldron import DFW, ktl
+    svc = DFW.Service(servicename, config=config)
+    svc[keyword_name].modify("first")
+    client = ktl.Service(servicename)
+    try:
+        assert client[keyword_name].read() == "first"
+        svc.shutdown()
+        with pytest.raises(DispatcherError):
+            client[keyword_name].read()
+
+        svc = DFW.Service(servicename, config=config)
+        svc[keyword_name].modify("second")
+        assert client[keyword_name].read() == "second"
+    finally:
+        client.shutdown()
+        svc.shutdown()
+
+def test_other_process(shm_service, keyword_name, servicename, shmdir):
+    """Test a client in another process."""
+    shm_service[keyword_name].modify("dispatcher")
+    script = textwrap.dedent("""
+    import sys
+    from Cauldron.test_helpers import setup_entry_points_api
+    setup_entry_points_api()
+    from Cauldron.api import use
+    use("shm")
+    from Cauldron.config import get_configuration
+    get_configuration().set("shm", "directory", sys.argv[1])
+    from Cauldron import ktl
+    svc = ktl.Service(sys.argv[2])
+    sys.stdout.write(svc[sys.argv[3]].read())
+    svc[sys.argv[3]].write("client")
+    svc.shutdown()
+    """)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))] + sys.path)
+    output = subprocess.check_output([sys.executable, "-c", script, shmdir, servicename, keyword_name], env=env)
+    assert output.decode('utf-8').strip().endswith("dispatcher")
+    assert shm_service[keyword_name].value == "client"
+
+def test_dispatcher_killed(backend, servicename, config, keyword_name, shmdir):
+    """Test writing to a dispatcher which was killed, and never cleaned up its table."""
+    from Cauldron import ktl
+    script = textwrap.dedent("""
+    import sys, time
+    from Cauldron.test_helpers import setup_entry_points_api
+    setup_entry_points_api()
+    from Cauldron.api import use
+    use("shm")
+    from Cauldron.config import get_configuration
+    get_configuration().set("shm", "directory", sys.argv[1])
+    from Cauldron import DFW
+    svc = DFW.Service(sys.argv[2], config=None)
+    svc[sys.argv[3]].modify("dispatcher")
+    sys.stdout.write("ready\\n")
+    sys.stdout.flush()
+    time.sleep(60)
+    """)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))] + sys.path)
+    process = subprocess.Popen([sys.executable, "-c", script, shmdir, servicename, keyword_name], env=env, stdout=subprocess.PIPE)
+    try:
+        assert process.stdout.readline().decode('utf-8').strip() == "ready"
+        client = ktl.Service(servicename)
+        try:
+            client[keyword_name].write("first")
+            assert client[keyword_name].read() == "first"
+            process.kill()
+            process.wait()
+            with pytest.raises(DispatcherError):
+                client[keyword_name].write("second")
+        finally:
+            client.shutdown()
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
@@ -16,11 +16,13 @@ log = logging.getLogger(__name__)
 def setup_entry_points_api():
     """Set up the entry points API if Cauldron isn't installed."""
     from . import registry
-    if any(backend not in registry.keys() for backend in ["zmq", "local"]):
+    if any(backend not in registry.keys() for backend in ["zmq", "local", "shm"]):
         from .zmq import setup_zmq_backend
         setup_zmq_backend()
         from .local import setup_local_backend
         setup_local_backend()
+        from .shm import setup_shm_backend
+        setup_shm_backend()
         from . import mock
 
 def get_available_backends():
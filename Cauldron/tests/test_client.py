@@ -61,8 +61,11 @@ def test_read_write_timeout(slow_keyword, service, client, waittime):
     with pytest.raises(TimeoutError):
         client[slow_keyword].write("blah", timeout=waittime/10.0)
 
-def test_history(service, client, keyword_name):
+def test_history(request, service, client, keyword_name, config):
     """Test history."""
+    size = config.get("history", "client")
+    request.addfinalizer(lambda : config.set("history", "client", size))
+    config.set("history", "client", "5")
     keyword = client[keyword_name]
     for i in range(6):
         keyword.write(str(i))
@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 
+import json
+import time
+import threading
 import pytest
 
 from six.moves import cStringIO as StringIO
 
-from ..console import ktl_show, ktl_modify, parseModifyCommands
+from ..console import ktl_show, ktl_modify, ktl_watch, parseModifyCommands
+from ..bench import parse_mix, run_bench, format_report, SyntheticClient, BroadcastStats
 from ..conftest import dispatcher
 
 
@@ -66,6 +70,53 @@ def test_show_error(dispatcher, keyword_name, missing_keyword_name, keyword_name
     assert len(output)
     assert output.splitlines() == ["{0}: Hello{1}".format(keyword,i) for i,keyword in enumerate(keywords)]
     
+@pytest.mark.parametrize("parallel", [1, 4])
+def test_show_order(dispatcher, keyword_name, keyword_name1, keyword_name2, keyword_name3, missing_keyword_name, outfile, parallel):
+    """Test that concurrent reads are shown in the order they were requested, with errors in place."""
+    keywords = [keyword_name3, keyword_name1, keyword_name, keyword_name2]
+    for i,keyword in enumerate(keywords):
+        dispatcher[keyword].modify("Hello{0}".format(i))
+    
+    ktl_show(dispatcher.name, *(keywords[:2] + [missing_keyword_name] + keywords[2:]), output=outfile, parallel=parallel)
+    output = outfile.getvalue().splitlines()
+    assert output[:2] == ["{0}: Hello{1}".format(keyword,i) for i,keyword in enumerate(keywords[:2])]
+    assert output[2] == "Can't find keyword '{0}' in service 'testsvc'".format(missing_keyword_name)
+    assert output[4:] == ["{0}: Hello{1}".format(keyword,i + 2) for i,keyword in enumerate(keywords[2:])]
+    
+def wait_for_lines(outfile, n, timeout=5.0):
+    """Wait for `n` lines of output."""
+    start = time.time()
+    while len(outfile.getvalue().splitlines()) < n and time.time() - start < timeout:
+        time.sleep(0.01)
+    return outfile.getvalue().splitlines()
+
+@pytest.mark.parametrize("fmt", ["text", "json"])
+def test_watch(dispatcher, keyword_name, keyword_name1, keyword_name2, outfile, errfile, fmt):
+    """Test watching keywords matched by a pattern."""
+    keywords = [keyword_name, keyword_name1]
+    for i,keyword in enumerate(keywords + [keyword_name2]):
+        dispatcher[keyword].modify("Hello{0}".format(i))
+    
+    watch = threading.Thread(target=ktl_watch, args=(dispatcher.name, "keyword[01]", keyword_name),
+        kwargs=dict(output=outfile, error=errfile, count=4, duration=10.0, json=(fmt == "json")))
+    watch.start()
+    assert len(wait_for_lines(outfile, 2)) == 2
+    time.sleep(0.5)
+    for i,keyword in enumerate(keywords):
+        dispatcher[keyword].modify("Goodbye{0}".format(i))
+    watch.join()
+    
+    assert errfile.getvalue() == ""
+    output = outfile.getvalue().splitlines()
+    if fmt == "json":
+        output = [json.loads(line) for line in output]
+        pairs = [(line['keyword'], line['value']) for line in output]
+        assert all(line['service'] == dispatcher.name for line in output)
+    else:
+        pairs = [tuple(line.split(" ", 1)[1].split(": ")) for line in output]
+    assert sorted(pairs[:2]) == [(keyword, "Hello{0}".format(i)) for i,keyword in enumerate(keywords)]
+    assert sorted(pairs[2:]) == [(keyword, "Goodbye{0}".format(i)) for i,keyword in enumerate(keywords)]
+    
 def check_parse_modify(pairs, n, keyword, value):
     """Check parse-modify commands."""
     assert len(pairs) == n
@@ -131,6 +182,55 @@ def test_modify_success(dispatcher, keyword_name, keyword_name1, keyword_name2,
     if mode == "notify" and not flags['nowait']:
         assert output.splitlines()[len(keywords):] == ["{0} complete".format(keyword) for keyword in keywords]
     
+@pytest.mark.parametrize("parallel", [1, 4])
+def test_modify_parallel(dispatcher, keyword_name, keyword_name1, keyword_name2, keyword_name3, outfile, errfile, parallel):
+    """Test concurrent writes, waiting for each to complete."""
+    keywords = [keyword_name3, keyword_name1, keyword_name, keyword_name2]
+    for i,keyword in enumerate(keywords):
+        dispatcher[keyword].modify("Hello{0}".format(i))
+    commands = [(keyword, "Goodbye{0}".format(i)) for i,keyword in enumerate(keywords)]
+    ktl_modify(dispatcher.name, *commands, output=outfile, error=errfile, timeout=5.0, parallel=parallel)
+    assert errfile.getvalue() == ""
+    assert outfile.getvalue().splitlines() == ["setting {0} = Goodbye{1} (wait)".format(keyword,i) for i,keyword in enumerate(keywords)]
+    for keyword, value in commands:
+        assert dispatcher[keyword].value == value
+    
+@pytest.fixture
+def slow_keyword(dispatcher_setup, waittime, keyword_name1):
+    """A keyword which is slow to write its first value."""
+    from Cauldron.types import Basic
+    
+    class SlowKeyword(Basic):
+        """A keyword which slows down writes of 'first'."""
+        def write(self, value):
+            """Slow down the write."""
+            if value == "first":
+                time.sleep(5.0 * waittime)
+            return value
+        
+    def setup(service):
+        SlowKeyword(keyword_name1, service)
+    dispatcher_setup.append(setup)
+    return keyword_name1
+    
+@pytest.mark.parametrize("parallel", [1, 4])
+def test_modify_repeated(slow_keyword, dispatcher, client, keyword_name, waittime, monkeypatch, outfile, errfile, parallel):
+    """Test that repeated writes to one keyword are applied in order."""
+    # Delay sending 'first' as well, so that a concurrent write of 'second' would reach the dispatcher before it.
+    cls = type(client[slow_keyword])
+    write = cls.write
+    def slow_write(self, value, *args, **kwargs):
+        if value == "first":
+            time.sleep(2.0 * waittime)
+        return write(self, value, *args, **kwargs)
+    monkeypatch.setattr(cls, 'write', slow_write)
+    commands = [(slow_keyword, "first"), (keyword_name, "other"), (slow_keyword, "second")]
+    ktl_modify(dispatcher.name, *commands, output=outfile, error=errfile, timeout=5.0, parallel=parallel)
+    assert errfile.getvalue() == ""
+    assert outfile.getvalue().splitlines() == ["setting {0} = {1} (wait)".format(keyword, value) for keyword, value in commands]
+    assert dispatcher[slow_keyword].value == "second"
+    assert dispatcher[keyword_name].value == "other"
+    
 def test_modify_error(dispatcher, keyword_name, missing_keyword_name, keyword_name2, outfile, errfile):
     """Test a succsessful modify command."""
     keywords = [keyword_name, keyword_name2]
@@ -148,4 +248,46 @@ def test_modify_error(dispatcher, keyword_name, missing_keyword_name, keyword_na
     assert output == ["setting {0} = Goodbye{1} (wait)".format(keyword,i) for i,keyword in enumerate(keywords)]
     
 
+def test_parse_mix():
+    """Test parsing operation mixes for cauldron-bench."""
+    assert parse_mix("read=3,write=1") == {'read' : 3.0, 'write' : 1.0}
+    assert parse_mix("read") == {'read' : 1.0, 'write' : 0.0}
+    for mix in ["read=3,monitor=1", "read=fast", "read=-1", "write=0"]:
+        with pytest.raises(ValueError):
+            parse_mix(mix)
+
+def test_bench(backend, config, servicename):
+    """Test a short cauldron-bench run."""
+    report = run_bench([servicename], duration=0.5, clients=2, config=config, keywords=4,
+        types=['integer', 'double', 'boolean', 'string'], periodic=1, period=0.1, timeout=5.0, seed=1, drain=0.1)
+    for operation in ('read', 'write'):
+        assert report[operation]['count'] > 0
+        assert report[operation]['timeouts'] == 0
+        assert report[operation]['errors'] == 0
+        assert report[operation]['p50'] <= report[operation]['p99'] <= report[operation]['max']
+    assert report['broadcast']['received'] > 0
+    assert len(format_report(report).splitlines()) == 5
 
+class PeriodicKeyword(object):
+    """A stand-in for a client keyword which broadcasts a counter."""
+    
+    full_name = "bench.PERIODIC0"
+    
+    def __init__(self):
+        self.value = 0
+    
+    def __getitem__(self, key):
+        assert key == 'ascii'
+        return str(self.value)
+    
+def test_bench_client_receive():
+    """Test counting dropped and reordered broadcasts in cauldron-bench clients."""
+    broadcasts = BroadcastStats()
+    client = SyntheticClient(0, [], {'read' : 1.0}, {}, broadcasts)
+    keyword = PeriodicKeyword()
+    for value in [1, 2, 5, 4, 6, 9]:
+        keyword.value = value
+        client.receive(keyword)
+    assert client._received == 6
+    assert client._dropped == 3
+    assert client._reordered == 1
@@ -296,3 +296,45 @@ def test_strict_xml(backend, servicename, xmlvar):
     use_strict_xml()
     from Cauldron.DFW import Service
     svc = Service(servicename, None)
+
+def test_keyword_lazy_attributes(dispatcher, missing_keyword_name):
+    """Test that a keyword's lock and callbacks are created when they are used."""
+    from Cauldron.DFW import Keyword
+    keyword = Keyword.Keyword(missing_keyword_name, dispatcher)
+    assert keyword._rlock is None
+    assert keyword._callback_list is None
+    assert keyword.log.logger is dispatcher.log
+    assert keyword._lock is keyword._lock
+    keyword.callback(lambda kw : None, remove=True)
+    assert keyword._callback_list is None
+    keyword.comment = "Attributes which aren't in slots still work."
+    assert keyword.comment.startswith("Attributes")
+    
+def test_keyword_instance_dict(dispatcher, missing_keyword_name):
+    """Test that keywords keep their attributes in slots, and don't create an instance dictionary."""
+    import gc
+    from Cauldron.DFW import Keyword
+    for i, name in enumerate(['Basic', 'Integer', 'Enumerated', 'Mask', 'String']):
+        keyword = getattr(Keyword, name)("{0}{1:d}".format(missing_keyword_name, i), dispatcher)
+        if name == 'Integer':
+            keyword.set("1")
+            keyword.set("2")
+        values = getattr(keyword, 'values', None)
+        assert not [ ref for ref in gc.get_referents(keyword) if type(ref) is dict and ref is not values ], name
+    
+def test_keyword_lazy_history(dispatcher, missing_keyword_name):
+    """Test that a keyword's history buffer is only created for its second value, or when it is read."""
+    from Cauldron.DFW import Keyword
+    keyword = Keyword.Keyword(missing_keyword_name, dispatcher)
+    keyword.set("1")
+    assert keyword._history_buffer is None
+    keyword.set("2")
+    assert keyword._history_buffer is not None
+    assert [entry.ascii for entry in keyword.history] == ["1", "2"]
+    
+    keyword = Keyword.Keyword(missing_keyword_name + "A", dispatcher)
+    keyword.set("1")
+    assert [entry.ascii for entry in keyword.history] == ["1"]
+    assert keyword._history_first is None
+    keyword.set("2")
+    assert [entry.ascii for entry in keyword.history] == ["1", "2"]
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for keyword history buffers.
+"""
+
+import datetime
+import pytest
+import numpy as np
+
+from Cauldron.base.history import KeywordHistory, HistorySlice, INITIAL_ENTRIES
+
+def fill(history, values, start=1000.0, step=1.0):
+    """Append `values` to a history, `step` seconds apart."""
+    for i, value in enumerate(values):
+        history.append(start + i * step, str(value))
+
+def test_history_ring():
+    """Test that the history keeps the most recent values."""
+    history = KeywordHistory(40, 'integer', 'MYINT')
+    assert len(history) == 0
+    with pytest.raises(IndexError):
+        history[0]
+    fill(history, range(INITIAL_ENTRIES))
+    assert len(history._time) == INITIAL_ENTRIES
+    fill(history, range(INITIAL_ENTRIES, 100), start=1000.0 + INITIAL_ENTRIES)
+    assert len(history) == 40
+    assert len(history._time) == 40
+    assert history[0] == HistorySlice(datetime.datetime.fromtimestamp(1060.0).time(), 60, '60', 'MYINT')
+    assert history[-1].binary == 99
+    assert [entry.binary for entry in history] == list(range(60, 100))
+    
+    history.clear()
+    assert len(history) == 0
+    
+def test_history_disabled():
+    """Test a history with no entries."""
+    history = KeywordHistory(0, 'integer')
+    fill(history, range(10))
+    assert len(history) == 0
+    assert len(history.window()) == 0
+
+def test_history_window():
+    """Test selecting and summarizing a window of the history."""
+    history = KeywordHistory(100, 'double')
+    fill(history, [1.0, 2.0, 'nan-ish', 4.0, 5.0, 6.0])
+    
+    window = history.window(1001.0, 1004.0)
+    assert window.ascii == ['2.0', 'nan-ish', '4.0', '5.0']
+    assert window.valid.tolist() == [True, False, True, True]
+    assert window.min() == 2.0
+    assert window.max() == 5.0
+    assert window.mean() == pytest.approx(11.0 / 3.0)
+    assert history[2].binary is None
+    
+    start = datetime.datetime.fromtimestamp(1003.0)
+    assert history.window(start=start).ascii == ['4.0', '5.0', '6.0']
+    assert len(history.window(end=999.0)) == 0
+
+def test_history_downsample():
+    """Test downsampling a window."""
+    history = KeywordHistory(100, 'integer')
+    fill(history, range(10), step=0.5)
+    window = history.window()
+    
+    mean = window.downsample(2.0)
+    assert mean.time.tolist() == [1000.0, 1002.0, 1004.0]
+    assert mean.binary.tolist() == [1.5, 5.5, 8.5]
+    with pytest.raises(ValueError):
+        mean.ascii
+    assert window.downsample(2.0, 'min').binary.tolist() == [0, 4, 8]
+    assert window.downsample(2.0, 'max').binary.tolist() == [3, 7, 9]
+    last = window.downsample(2.0, 'last')
+    assert last.ascii == ['3', '7', '9']
+    assert last.binary.tolist() == [3, 7, 9]
+    with pytest.raises(ValueError):
+        window.downsample(2.0, 'median')
+
+def test_history_strings():
+    """Test string values, which are interned and can't be summarized."""
+    history = KeywordHistory(4, 'string', 'MYSTRING')
+    values = ["value{0:d}".format(i) for i in range(100)]
+    for i, value in enumerate(values):
+        history.append(1000.0 + i, value, value)
+    assert len(history._strings) <= 2 * history.size + INITIAL_ENTRIES
+    assert [entry.ascii for entry in history] == values[-4:]
+    assert [entry.binary for entry in history] == values[-4:]
+    window = history.window()
+    with pytest.raises(TypeError):
+        window.mean()
+    assert window.downsample(2.0, 'last').ascii == ['value97', 'value99']
+
+def test_dispatcher_history(dispatcher, missing_keyword_name, config):
+    """Test the history of a dispatcher keyword."""
+    from Cauldron.DFW import Keyword
+    keyword = Keyword.Integer(missing_keyword_name, dispatcher)
+    for value in range(5):
+        keyword.modify(str(value))
+    assert len(keyword.history) == 5
+    assert keyword.history[-1].ascii == '4'
+    assert keyword.history.window().mean() == 2.0
+    assert keyword.history.size == config.getint("history", "dispatcher")
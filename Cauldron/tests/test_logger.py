@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import pytest
+
+from Cauldron.logger import LazyFormat, MSG, TRACE
+
+class Unformattable(object):
+    """An object which fails when it is formatted."""
+
+    def __repr__(self):
+        raise AssertionError("Formatted a disabled log message.")
+
+
+@pytest.fixture
+def log(request):
+    """A logger at WARNING."""
+    log = logging.getLogger("DFW.test.lazy")
+    log.setLevel(logging.WARNING)
+    request.addfinalizer(lambda : log.setLevel(logging.NOTSET))
+    return log
+
+def test_lazy_disabled(log):
+    """Test that disabled messages aren't formatted."""
+    log.lazy(MSG, "{0!r}", Unformattable())
+    log.lazy(TRACE, "{0}", LazyFormat("{0!r}", Unformattable()))
+
+def test_lazy_enabled(log, caplog):
+    """Test that enabled messages are formatted when they are logged."""
+    log.setLevel(TRACE)
+    value = ["before"]
+    log.lazy(MSG, "{0!r} {1}", value, LazyFormat("{0:d}%", 10))
+    value[0] = "after"
+    assert caplog.records[-1].getMessage() == "['before'] 10%"
+    assert caplog.records[-1].levelno == MSG
+
+def test_keyword_logger(dispatcher, missing_keyword_name, caplog):
+    """Test that keywords log to their service's logger, with keyword context."""
+    from Cauldron.DFW import Keyword
+    keyword = Keyword.Keyword(missing_keyword_name, dispatcher)
+    dispatcher.log.setLevel(TRACE)
+    try:
+        keyword.log.lazy(MSG, "{0} logged", "keyword")
+        keyword.log.warning("%s logged", "warning")
+    finally:
+        dispatcher.log.setLevel(logging.NOTSET)
+    assert [record.getMessage() for record in caplog.records[-2:]] == ["keyword logged", "warning logged"]
+    record = caplog.records[-1]
+    assert record.name == "{0}.{1}".format(dispatcher.log.name, keyword.name)
+    assert record.keyword_name == keyword.full_name
+    assert record.keyword == repr(keyword)
+    assert keyword.log.logger is dispatcher.log
+
+class RecordingHandler(logging.Handler):
+    """A handler which keeps its records."""
+    
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+    
+    def emit(self, record):
+        self.records.append(record)
+    
+def test_keyword_logger_filter(dispatcher, missing_keyword_name):
+    """Test that handlers can filter records by keyword."""
+    from Cauldron.DFW import Keyword
+    keyword = Keyword.Keyword(missing_keyword_name, dispatcher)
+    other = Keyword.Keyword(missing_keyword_name + "OTHER", dispatcher)
+    handler = RecordingHandler()
+    handler.addFilter(logging.Filter("{0}.{1}".format(dispatcher.log.name, keyword.name)))
+    dispatcher.log.addHandler(handler)
+    try:
+        keyword.log.warning("from keyword")
+        other.log.warning("from other")
+        dispatcher.log.warning("from service")
+    finally:
+        dispatcher.log.removeHandler(handler)
+    assert [record.getMessage() for record in handler.records] == ["from keyword"]
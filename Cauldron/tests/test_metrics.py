@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+import gc
+import threading
+import pytest
+
+from Cauldron import metrics
+from Cauldron.metrics import Metrics, keyword_name
+
+class Owner(object):
+    """An object which reports a gauge."""
+    depth = 3
+
+def test_keyword_name():
+    """Test naming metrics keywords."""
+    assert keyword_name(("BROKER", "my.service", "modify")) == "BROKER_MY_SERVICE_MODIFY"
+    assert keyword_name("queue-depth") == "QUEUE_DEPTH"
+
+def test_metrics_threads():
+    """Test that counters from many threads are aggregated."""
+    collector = Metrics()
+    collector.increment("COUNT")
+    assert collector.snapshot() == ({}, {}, {})
+    
+    collector.enabled = True
+    def work():
+        for i in range(100):
+            collector.increment("COUNT")
+        collector.record("COMMAND", 0.5)
+    threads = [threading.Thread(target=work) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    counters, gauges, samples = collector.snapshot()
+    assert counters == {"COUNT" : 400, "COMMAND" : 4}
+    assert samples == {"COMMAND" : [0.5] * 4}
+    
+    counters, gauges, samples = collector.snapshot()
+    assert counters["COUNT"] == 400
+    assert samples == {}
+    assert collector._stores == []
+
+def test_metrics_snapshot_during_observe():
+    """Test that observations made while other threads snapshot are never lost."""
+    collector = Metrics()
+    collector.enabled = True
+    done = threading.Event()
+    def work():
+        for i in range(20000):
+            collector.observe("LATENCY", 1.0)
+        done.set()
+    thread = threading.Thread(target=work)
+    thread.start()
+    total = 0
+    while not done.is_set():
+        total += len(collector.snapshot()[2].get("LATENCY", []))
+    thread.join()
+    total += len(collector.snapshot()[2].get("LATENCY", []))
+    assert total == 20000
+
+def test_metrics_gauge():
+    """Test that gauges are summed, and go away with their owner."""
+    collector = Metrics()
+    owners = [Owner(), Owner()]
+    for owner in owners:
+        collector.gauge(owner, "DEPTH", lambda owner : owner.depth)
+    assert collector.snapshot()[1] == {"DEPTH" : 6}
+    del owners, owner
+    gc.collect()
+    assert collector.snapshot()[1] == {}
+
+@pytest.fixture
+def publisher(request, backend, config, servicename):
+    """A metrics publisher, started by a dispatcher."""
+    config.set("metrics", "enable", "yes")
+    config.set("metrics", "period", "1000")
+    def reset():
+        config.set("metrics", "enable", "no")
+        config.set("metrics", "period", "1.0")
+        metrics.stop()
+    request.addfinalizer(reset)
+    from Cauldron import DFW
+    svc = DFW.Service(servicename, config=config)
+    request.addfinalizer(svc.shutdown)
+    publisher = metrics.publish(servicename, config)
+    publisher.started.wait(5.0)
+    assert publisher.service is not None
+    return publisher
+
+def test_publish(publisher):
+    """Test publishing metrics as keywords."""
+    metrics.process.increment(("TEST", "COUNT"), 3)
+    metrics.process.observe(("TEST", "LATENCY"), 0.25)
+    publisher.publish()
+    metrics.process.increment(("TEST", "COUNT"), 2)
+    publisher.publish()
+    
+    assert publisher.service["TEST_COUNT"].value == "5"
+    assert float(publisher.service["TEST_COUNT_RATE"].value) > 0.0
+    assert float(publisher.service["TEST_LATENCY_P50"].value) == 0.25
+    
+    from Cauldron import ktl
+    client = ktl.Service(publisher.service.name)
+    assert client["TEST_COUNT"].read() == "5"
@@ -111,7 +111,94 @@ def test_keyword_enumerated(keyword_enumerated, dispatcher, client, modify, upda
         check_client_type(dkw, client, rbinary, rascii)
     assert set(client[keyword_enumerated]['enumerators'].values()) == set(["ZERO", "ONE", "TWO", "THREE"])
 
-@pytest.mark.parametrize("kwtype", ['mask', 'integer array', 'float array', 'double array'])
+def test_keyword_enumerated_client_lookup(keyword_enumerated, dispatcher, client):
+    """Client enumerated lookups ignore case, and keywords with identical enumerators share tables."""
+    from Cauldron.types import Enumeration, _shared_enumeration
+    ckw = client[keyword_enumerated]
+    assert ckw.cast("TWO") == 2
+    assert ckw.cast("two") == 2
+    assert ckw.cast("3") == 3
+    assert ckw._to_ascii(1) == "ONE"
+    with pytest.raises(ValueError):
+        ckw.cast("FOUR")
+    assert ckw.mapping is _shared_enumeration(Enumeration, ckw['enumerators'])
+    with pytest.raises(TypeError):
+        ckw.mapping[4] = "FOUR"
+    with pytest.raises(TypeError):
+        ckw.values["FOUR"] = 4
+    with pytest.raises(TypeError):
+        ckw.mapping.enums.update({4: "FOUR"})
+    assert 4 not in _shared_enumeration(Enumeration, ckw['enumerators'])
+    
+@pytest.fixture
+def keyword_mask(backend, dispatcher_setup):
+    """A mask keyword."""
+    from Cauldron import DFW
+    def setup(dispatcher):
+        kwd = DFW.Keyword.types["mask"]("MYMASK", dispatcher)
+    dispatcher_setup.append(setup)
+    return "MYMASK"
+
+@pytest.mark.parametrize("modify,update,rbinary,rascii", [
+    ("POWER", 1, 1, "POWER"),
+    ("power, door", 5, 5, "POWER, DOOR"),
+    (["SHUTTER", 40], (1 << 40) | 2, (1 << 40) | 2, "SHUTTER, ESTOP"),
+    (6, 6, 6, "SHUTTER, DOOR"),
+    ("0x3", 3, 3, "POWER, SHUTTER"),
+    ("CLEAR", 0, 0, "CLEAR"),
+    (8, ValueError, None, None),
+    ("WINDOW", ValueError, None, None),
+])
+def test_keyword_mask(keyword_mask, dispatcher, client, modify, update, rbinary, rascii):
+    """Modify-update tests for a mask keyword."""
+    dkw = dispatcher[keyword_mask]
+    dkw.modify(7)
+    modify_update(dkw, modify, update)
+    
+    if not (inspect.isclass(update) and issubclass(update, Exception)):
+        check_client_type(dkw, client, rbinary, rascii)
+    assert set(client[keyword_mask]['enumerators'].values()) == set(["CLEAR", "POWER", "SHUTTER", "DOOR", "ESTOP"])
+    
+def test_keyword_mask_client(keyword_mask, dispatcher, client):
+    """Clients name mask bits from the enumerators sent by the dispatcher."""
+    from Cauldron.types import MaskEnumeration
+    dispatcher[keyword_mask].modify("POWER, DOOR")
+    ckw = client[keyword_mask]
+    assert ckw['units'] is None
+    assert ckw['enumerators']['40'] == "ESTOP"
+    assert ckw.bits == ["POWER", "SHUTTER", "DOOR", "ESTOP"]
+    assert ckw.bitmask("shutter", 40) == (1 << 40) | 2
+    assert ckw.decode(5) == ["POWER", "DOOR"]
+    assert ckw.cast("CLEAR") == 0
+    
+    mapping = MaskEnumeration(None)
+    assert mapping.enums == {} and mapping.none is None
+    
+def test_keyword_mask_bits(keyword_mask, dispatcher):
+    """Test setting, clearing and testing many mask bits at once."""
+    dkw = dispatcher[keyword_mask]
+    dkw.modify(0)
+    dkw.setbits("POWER", "DOOR", "ESTOP")
+    assert dkw.value == str((1 << 40) | 5)
+    assert dkw.test("power", "door")
+    assert not dkw.test("SHUTTER", "DOOR")
+    assert dkw.decode() == ["POWER", "DOOR", "ESTOP"]
+    dkw.clearbits("POWER", "ESTOP")
+    assert dkw.value == "4"
+    assert dkw.bits == ["POWER", "SHUTTER", "DOOR", "ESTOP"]
+    
+    bits = dkw.tobits()
+    assert bits.shape == (41,)
+    assert list(bits.nonzero()[0]) == [2]
+    bits[40] = True
+    assert dkw.frombits(bits) == (1 << 40) | 4
+    assert list(dkw.tobits(0x1FF, nbits=4)) == [True] * 4
+    assert list(dkw.tobits(0x1FF, nbits=12).nonzero()[0]) == list(range(9))
+    
+    with pytest.raises(ValueError):
+        dkw.setbits("WINDOW")
+
+@pytest.mark.parametrize("kwtype", ['integer array', 'float array', 'double array'])
 def test_keyword_type_not_implemented(kwtype, dispatcher_args, dispatcher_setup):
     """Test not-implemented keyword types"""
     from Cauldron import DFW
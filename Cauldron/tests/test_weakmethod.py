@@ -254,3 +254,46 @@ def test_prepend():
         assert cb() == other_function()
         break
     
+
+def test_callbacks_bound(my_class):
+    """Test dispatching to bound methods, and dropping their instances."""
+    my_instance = my_class()
+    other_instance = my_class()
+    other_instance.value = 30
+    cbs = Callbacks(my_instance.my_method, other_instance.my_method, my_class.my_classmethod)
+    assert my_instance.my_method in cbs
+    assert my_class().my_method not in cbs
+    assert cbs() == [20, 30, 400]
+    
+    del other_instance
+    assert len(cbs) == 2
+    assert cbs() == [20, 400]
+    
+    cbs.remove(my_instance.my_method)
+    assert my_instance.my_method not in cbs
+    with pytest.raises(ValueError):
+        cbs.remove(my_instance.my_method)
+    cbs.discard(my_instance.my_method)
+    assert cbs() == [400]
+    
+def test_callbacks_modified_while_called():
+    """Test that callbacks added or removed by a callback take effect on the next call."""
+    calls = []
+    def my_function():
+        """docstring"""
+        calls.append("my_function")
+        cbs.remove(other_function)
+        cbs.add(new_function)
+    def other_function():
+        """docstring"""
+        calls.append("other_function")
+    def new_function():
+        """docstring"""
+        calls.append("new_function")
+        
+    cbs = Callbacks(my_function, other_function)
+    cbs()
+    assert calls == ["my_function", "other_function"]
+    cbs.remove(my_function)
+    cbs()
+    assert calls == ["my_function", "other_function", "new_function"]
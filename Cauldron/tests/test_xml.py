@@ -2,6 +2,7 @@
 
 import pytest
 import os
+import py
 
 pytestmark = pytest.mark.usefixtures("teardown_cauldron")
 
@@ -79,3 +80,133 @@ def test_Service_with_wrong_dispatcher(strictxml, backend, servicename, config,
     svc = DFW.Service(servicename, config, dispatcher=dispatcher_name2)
     with pytest.raises(WrongDispatcher):
         keyword = svc[keyword_name_ENUMERATED]
+
+@pytest.fixture
+def xmlcopy(xmlvar, xmlpath, tmpdir):
+    """A copy of the service XML, in a directory where the index cache can be changed."""
+    directory = tmpdir.join("xml")
+    py.path.local(xmlpath).copy(directory)
+    return directory
+
+def test_compile_xml_index(xmlcopy, servicename, keyword_name_ENUMERATED, keyword_name_INTEGER, dispatcher_name):
+    """Test compiling the XML index."""
+    from ..base.xmlindex import compile_index
+    index = compile_index(servicename, directory=str(xmlcopy))
+    assert keyword_name_ENUMERATED in index
+    assert index.list() == sorted(index.keywords)
+    record = index.keyword(keyword_name_ENUMERATED)
+    assert record.type == 'enumerated'
+    assert record.dispatcher == dispatcher_name
+    assert record.initial == 'Open'
+    assert record.enumerators == [['0', 'Open'], ['1', 'Closed']]
+    assert index.keyword(keyword_name_INTEGER).units == 'warps'
+    with pytest.raises(KeyError):
+        index.keyword("NOTAKEYWORD")
+    assert index.for_dispatcher(dispatcher_name) == sorted(name for name in index.keywords if index.keyword(name).dispatcher == dispatcher_name)
+    assert index.for_dispatcher("notadispatcher") == []
+
+def test_xml_index_nodes(xmlcopy, servicename, keyword_name_ENUMERATED, dispatcher_name):
+    """Test parsing keyword nodes on demand from the XML index."""
+    from ..base.xmlindex import load_index
+    from ..extern import ktlxml
+    index = load_index(servicename, directory=str(xmlcopy))
+    assert index._nodes == {}
+    node = index[keyword_name_ENUMERATED]
+    assert list(index._nodes) == [keyword_name_ENUMERATED]
+    assert index[keyword_name_ENUMERATED] is node
+    
+    expected = ktlxml.Service(servicename, directory=str(xmlcopy))[keyword_name_ENUMERATED]
+    assert node.toxml() == expected.toxml()
+    assert ktlxml.getKeywordName(node) == keyword_name_ENUMERATED
+    assert ktlxml.getValue(ktlxml.get.dispatcher(node), 'name') == dispatcher_name
+    assert ktlxml.getFilename(node) == str(xmlcopy.join("dispatcher1.xml"))
+
+def test_xml_index_iterate(xmlcopy, servicename, keyword_name_ENUMERATED):
+    """Test iterating over the XML index, and keyword attributes, as for the ktlxml service."""
+    from ..base.xmlindex import load_index
+    from ..extern import ktlxml
+    index = load_index(servicename, directory=str(xmlcopy))
+    expected = ktlxml.Service(servicename, directory=str(xmlcopy))
+    nodes = list(index)
+    assert [ ktlxml.getKeywordName(node) for node in nodes ] == expected.list()
+    assert [ node.toxml() for node in nodes ] == [ node.toxml() for node in expected ]
+    assert index.attributes(keyword_name_ENUMERATED) == expected.attributes(keyword_name_ENUMERATED)
+    assert index.attributes(keyword_name_ENUMERATED) is index.attributes(keyword_name_ENUMERATED)
+    with pytest.raises(KeyError):
+        index.attributes("NOTAKEYWORD")
+    
+def test_Service_xml_iterate(xmlvar, backend, servicename, config, dispatcher_name, keyword_name_ENUMERATED):
+    """Test iterating over a service's XML."""
+    from Cauldron import DFW
+    from ..extern import ktlxml
+    svc = DFW.Service(servicename, config, dispatcher=dispatcher_name)
+    try:
+        names = [ ktlxml.getKeywordName(node) for node in svc.xml ]
+        assert keyword_name_ENUMERATED in names
+        assert names == svc.xml.list()
+        assert svc.xml.attributes(keyword_name_ENUMERATED)['type'] == 'enumerated'
+    finally:
+        svc.shutdown()
+    
+def test_xml_index_cache(xmlcopy, servicename, keyword_name_INTEGER, monkeypatch):
+    """Test the XML index cache, which is only recompiled when the XML changes."""
+    from ..base import xmlindex
+    index = xmlindex.load_index(servicename, directory=str(xmlcopy))
+    assert xmlcopy.join(xmlindex.CACHE_FILENAME).check()
+    
+    compiled = []
+    compile_index = xmlindex._compile
+    monkeypatch.setattr(xmlindex, '_compile', lambda *args: compiled.append(args) or compile_index(*args))
+    cached = xmlindex.load_index(servicename, directory=str(xmlcopy))
+    assert compiled == []
+    assert cached.keywords == index.keywords
+    
+    # Touching a file doesn't change its contents.
+    bundle = xmlcopy.join("dispatcher1.xml")
+    bundle.setmtime(bundle.mtime() + 10)
+    assert xmlindex.load_index(servicename, directory=str(xmlcopy)).keyword(keyword_name_INTEGER).units == 'warps'
+    assert compiled == []
+    
+    bundle.write(bundle.read().replace("<units>warps</units>", "<units>parsecs</units>"))
+    assert xmlindex.load_index(servicename, directory=str(xmlcopy)).keyword(keyword_name_INTEGER).units == 'parsecs'
+    assert len(compiled) == 1
+    assert xmlindex.load_index(servicename, directory=str(xmlcopy)).keyword(keyword_name_INTEGER).units == 'parsecs'
+    assert len(compiled) == 1
+
+@pytest.fixture
+def bundledir(xmlvar, tmpdir):
+    """XML for a service with keywords split between several bundle files."""
+    directory = tmpdir.join("bundles")
+    directory.ensure(dir=True)
+    files = "".join("<file><location>bundle{0:d}.xml</location></file>".format(i) for i in range(6))
+    directory.join("index.xml").write('<?xml version="1.0"?>\n<index service="bundlesvc"><files>{0}</files></index>\n'.format(files))
+    for i in range(6):
+        keywords = "".join("<keyword><name>KEYWORD{0:d}_{1:d}</name><type>integer</type></keyword>\n".format(i, k) for k in range(20))
+        directory.join("bundle{0:d}.xml".format(i)).write('<?xml version="1.0"?>\n<bundle name="BUNDLE{0:d}" service="bundlesvc">\n'
+            '<dispatcher><name>dispatcher{1:d}</name></dispatcher>\n{2}</bundle>\n'.format(i, i % 2, keywords))
+    return directory
+
+def test_xml_index_parallel(bundledir, monkeypatch):
+    """Test scanning bundle files in parallel, which should give the same index as scanning them in order."""
+    from ..base import xmlindex
+    monkeypatch.setattr(xmlindex, 'PARSE_PROCESS_SIZE', 0)
+    monkeypatch.setattr(xmlindex.multiprocessing, 'cpu_count', lambda : 2)
+    expected = xmlindex.compile_index("bundlesvc", directory=str(bundledir))
+    index = xmlindex.compile_index("bundlesvc", directory=str(bundledir), threads=4, processes=2)
+    assert len(index) == 120
+    assert index.keywords == expected.keywords
+    assert index.locations == expected.locations
+    assert index.bundles == expected.bundles
+    assert index.sources == expected.sources
+    assert index.for_dispatcher("dispatcher1") == expected.for_dispatcher("dispatcher1")
+    assert index["KEYWORD5_3"].toxml() == expected["KEYWORD5_3"].toxml()
+
+def test_xml_index_parallel_duplicates(bundledir, monkeypatch):
+    """Test that duplicate keywords are found when bundle files are scanned in parallel."""
+    from ..base import xmlindex
+    monkeypatch.setattr(xmlindex, 'PARSE_PROCESS_SIZE', 0)
+    monkeypatch.setattr(xmlindex.multiprocessing, 'cpu_count', lambda : 2)
+    bundle = bundledir.join("bundle5.xml")
+    bundle.write(bundle.read().replace("KEYWORD5_3", "KEYWORD0_3"))
+    with pytest.raises(ValueError):
+        xmlindex.compile_index("bundlesvc", directory=str(bundledir), threads=4, processes=2)
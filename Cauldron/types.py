@@ -12,13 +12,17 @@ to a python type.
 from __future__ import absolute_import
 
 import warnings
+import binascii
 import collections
 import itertools
+import numbers
+import weakref
 import types
 import sys
 import abc
 import six
 import logging
+import numpy as np
 from .exc import CauldronAPINotImplementedWarning, CauldronXMLWarning, CauldronTypeError
 from .api import guard_use, STRICT_KTL_XML, BASENAME, CAULDRON_SETUP
 from .base.core import _CauldronBaseMeta
@@ -43,22 +47,27 @@ def client_keyword(cls):
     _client.add(cls)
     return cls
     
-_bases = set()
+_concrete = {}
+"""Concrete keyword classes for the active backend, keyed by (keyword type, dispatcher)."""
 
-def _generate_keyword_subclass(basecls, subclass, module, dispatcher):
+def _generate_keyword_subclass(basecls, subclass, module, dispatcher, basedoc=None):
     """Generate a single keyword subclass."""
+    if basedoc is None:
+        basedoc = _inherited_docstring(basecls)
     if getattr(subclass, '__doc__', None) is not None:
-        doc = _prepend_to_docstring(_inherited_docstring(basecls), subclass.__doc__)
+        doc = _prepend_to_docstring(basedoc, subclass.__doc__)
     else:
-        doc = _inherited_docstring(basecls)
+        doc = basedoc
     cls = subclass._make_subclass(basecls, dispatcher, doc, module)
     cls.KTL_REGISTERED = True
+    _concrete[(subclass, dispatcher)] = cls
     return cls
     
 def generate_keyword_subclasses(basecls, subclasses, module, dispatcher):
     """Given a base class, generate keyword subclasses."""
+    basedoc = _inherited_docstring(basecls)
     for subclass in subclasses:
-        yield _generate_keyword_subclass(basecls, subclass, module, dispatcher)
+        yield _generate_keyword_subclass(basecls, subclass, module, dispatcher, basedoc)
 
 def _setup_keyword_class(kwcls, module):
     """Set up a keyword class on a module."""
@@ -96,10 +105,7 @@ def setup_dispatcher_keyword_module():
 @registry.client.teardown_for('all')
 def teardown_generated_user_classes():
     """Cleanup user generated classes."""
-    for cls in _bases:
-        if hasattr(cls, '_subcls'):
-            del cls._subcls
-    _bases.clear()
+    _concrete.clear()
 
 @six.add_metaclass(_CauldronBaseMeta)
 class KeywordType(object):
@@ -119,23 +125,25 @@ class KeywordType(object):
     KTL_DISPATCHER = None
     """Flag describing whether this is a dispatcher or client keyword."""
     
-    _subcls = None
+    _KTL_SLOTS = ()
+    """Instance attributes kept in slots by the class made for each backend. Types can't declare their own slots, as they are combined with backend keyword classes which have slots."""
     
     @classmethod
     def _is_dispatcher(cls, args, kwargs):
         """Get the service argument."""
         if "service" in kwargs:
-            if "DFW.Service" in str(type(kwargs["service"])):
-                return True
-            return getattr(kwargs["service"],'_DISPATCHER', None)
-        for i,arg in enumerate(args):
-            if i > 1:
-                break
-            if not isinstance(arg, six.string_types):
-                if "DFW.Service" in str(type(arg)):
-                    return True
-                return getattr(arg, '_DISPATCHER', None)
-        return None
+            service = kwargs["service"]
+        elif len(args) and not isinstance(args[0], six.string_types):
+            service = args[0]
+        elif len(args) > 1 and not isinstance(args[1], six.string_types):
+            service = args[1]
+        else:
+            return None
+        dispatcher = getattr(service, '_DISPATCHER', None)
+        if dispatcher is None and "DFW.Service" in str(type(service)):
+            # Native KTL dispatcher services don't set _DISPATCHER.
+            return True
+        return dispatcher
     
     @classmethod
     def _get_cauldron_basecls(cls, dispatcher=None):
@@ -151,12 +159,15 @@ class KeywordType(object):
         
         
     @classmethod
-    def _get_subclass(cls, basecls, dispatcher, docstring=None, module=None):
-        """Get the cached cauldron subclass."""
-        if cls.__dict__.get('_subcls',None) is None:
-            cls._subcls = cls._make_subclass(basecls, dispatcher, docstring, module)
-            _bases.add(cls)
-        return cls._subcls
+    def _get_concrete_class(cls, dispatcher):
+        """Get the concrete class for this type with the active backend, and remember it for later keywords."""
+        basecls = cls._get_cauldron_basecls(dispatcher)
+        if issubclass(cls, basecls):
+            newcls = cls
+        else:
+            newcls = cls._make_subclass(basecls, dispatcher)
+        _concrete[(cls, dispatcher)] = _concrete[(newcls, dispatcher)] = newcls
+        return newcls
     
     
     @classmethod
@@ -168,15 +179,18 @@ class KeywordType(object):
             module = cls.__module__
         members = {'__module__': module, 
                    '__doc__': docstring,
+                   '__slots__': cls._KTL_SLOTS,
                    'KTL_DISPATCHER':bool(dispatcher) }
         return type(cls.__name__, (cls, basecls, object), members)
     
     def __new__(cls, *args, **kwargs):
         if not cls.KTL_REGISTERED:
             dispatcher = cls._is_dispatcher(args, kwargs)
-            basecls = cls._get_cauldron_basecls(dispatcher)
-            if not issubclass(cls, basecls):
-                newcls = cls._get_subclass(basecls, dispatcher)
+            try:
+                newcls = _concrete[(cls, dispatcher)]
+            except KeyError:
+                newcls = cls._get_concrete_class(dispatcher)
+            if newcls is not cls:
                 return newcls.__new__(newcls, *args, **kwargs)
         
         # See http://stackoverflow.com/questions/19277399/why-does-object-new-work-differently-in-these-three-cases for why this is necessary.
@@ -339,16 +353,33 @@ class Integer(Basic):
         return super(Integer, self).postread(self.cast(value))
         
 
+class _FrozenDict(dict):
+    """A dictionary which can't be changed after it is built."""
+    
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Shared enumeration tables are read-only")
+    
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+    
+
 class Enumeration(collections.Mapping):
-    """The key-value pairs for enumeration"""
+    """The key-value pairs for enumeration.
+    
+    An enumeration built from ``None`` is empty, as clients without units (e.g. before the dispatcher
+    has replied) have no enumerators yet.
+    """
     def __init__(self, *args, **kwargs):
         super(Enumeration, self).__init__()
         self.enums = dict()
         self.bkeys = dict()
+        self.frozen = False
+        if len(args) and args[0] is None:
+            args = args[1:]
         for k, v in dict(*args, **kwargs).items():
             self[k] = v
 
     def __setitem__(self, key, value):
+        self._check_frozen()
         k = int(key)
         v = str(value)
         self.enums[k] = v
@@ -356,6 +387,18 @@ class Enumeration(collections.Mapping):
         self.bkeys[v.lower()] = k
         self.bkeys[str(k)] = k
     
+    def _check_frozen(self):
+        """Raise a TypeError if this enumeration is read-only."""
+        if self.frozen:
+            raise TypeError("Enumeration {0!r} is shared, and so read-only".format(self))
+    
+    def freeze(self):
+        """Make this enumeration read-only, so that it can be shared between keywords."""
+        self.enums = _FrozenDict(self.enums)
+        self.bkeys = _FrozenDict(self.bkeys)
+        self.frozen = True
+        return self
+    
     def __iter__(self):
         return itertools.chain(self.enums.keys(), self.bkeys.keys())
         
@@ -376,6 +419,21 @@ class Enumeration(collections.Mapping):
         else:
             raise KeyError(key)
     
+    def index(self, value):
+        """Get the integer value for an enumerator name or number. Names are not case sensitive."""
+        if isinstance(value, numbers.Integral):
+            return int(value)
+        value = str(value).strip()
+        if value in self.bkeys:
+            return self.bkeys[value]
+        elif value.lower() in self.bkeys:
+            return self.bkeys[value.lower()]
+        return int(float(value))
+    
+    def export(self):
+        """Export the enumerators as a dictionary with string keys, as sent to clients."""
+        return dict((str(k), v) for k, v in self.enums.items())
+    
     def load_from_xml(self, xml):
         """Load enumeration values from XML"""
         
@@ -393,50 +451,88 @@ class Enumeration(collections.Mapping):
                     self[key] = value
         
 
-@dispatcher_keyword
-@client_keyword
-class Enumerated(Integer):
-    """An enumerated keyword, which uses an integer as the underlying datatype."""
-    KTL_TYPE = 'enumerated'
+def _load_enumeration_xml(keyword):
+    """Load a keyword's enumeration mapping from the service XML."""
+    try:
+        for key, value in keyword.service.xml.keyword(keyword.name).enumerators or ():
+            keyword.mapping[key] = value
+    except Exception as e:
+        if STRICT_KTL_XML:
+            raise
+        if keyword.service.xml is not None:
+            msg = "XML enumeration setup for keyword '{0}' failed. {1}".format(keyword.name, e)
+            emit_xml_warning(keyword.log, msg)
+
+_enumerations = weakref.WeakValueDictionary()
+
+def _shared_enumeration(cls, enumerators):
+    """Get an enumeration lookup table, shared between all keywords with identical enumerators.
+    
+    Shared tables are frozen, so that no keyword can change the enumerators seen by the others.
+    """
+    if not enumerators:
+        enumerators = {}
+    elif not isinstance(enumerators, collections.Mapping):
+        enumerators = dict(enumerate(enumerators))
+    key = (cls, frozenset((str(k), str(v)) for k, v in enumerators.items()))
+    try:
+        return _enumerations[key]
+    except KeyError:
+        mapping = _enumerations[key] = cls(enumerators).freeze()
+        return mapping
+
+class _Enumerators(object):
+    """Enumerator handling common to keyword types which name their integer values.
+    
+    Dispatchers load the enumerators from XML. Clients receive them from the dispatcher as the keyword
+    units, and build the lookup tables exactly once, when they arrive.
+    """
+    
+    _enumeration = Enumeration
+    
+    _KTL_SLOTS = ('mapping', 'values', '_enumerators_ready', '_ktl_enumerators_cache')
     
     def __init__(self, *args, **kwargs):
-        # We override __init__ so we can set up 
-        # the enumerated values.
-        super(Enumerated, self).__init__(*args, **kwargs)
-        self.mapping = Enumeration()
-        self.values = self.mapping.bkeys
-        if hasattr(self, '_ALLOWED_KEYS'):
-            self._ALLOWED_KEYS = self._ALLOWED_KEYS.union(["enumerators"])
+        # The mapping must exist before the backend initializer runs, as some backends request
+        # enumerators as soon as the keyword is prepared.
+        self._set_mapping(self._enumeration())
+        self._enumerators_ready = False
+        super(_Enumerators, self).__init__(*args, **kwargs)
+        cls = type(self)
+        if getattr(cls, '_ALLOWED_KEYS', None) is not None and "enumerators" not in cls._ALLOWED_KEYS:
+            cls._ALLOWED_KEYS = cls._ALLOWED_KEYS.union(["enumerators"])
         if self.KTL_DISPATCHER:
-            try:
-                xml = self.service.xml[self.name]
-                self.mapping.load_from_xml(xml)
-            except Exception as e:
-                if STRICT_KTL_XML:
-                    raise
-                if self.service.xml is not None:
-                    msg = "XML enumeration setup for keyword '{0}' failed. {1}".format(self.name, e)
-                    emit_xml_warning(self.log, msg)
-            
-        
-    @property
-    def keys(self):
-        """The keys available."""
-        return self.mapping.enums.keys()
-        
-    def prewrite(self, value):
-        value = str(int(self.translate(value)))
-        return super(Enumerated, self).prewrite(value)
-        
+            _load_enumeration_xml(self)
+    
+    def _set_mapping(self, mapping):
+        """Set the enumeration lookup table."""
+        self.mapping = mapping
+        self.values = mapping.bkeys
+    
+    def _get_mapping(self):
+        """Get the enumeration lookup table, fetching the enumerators first for clients."""
+        if not (self.KTL_DISPATCHER or self._enumerators_ready):
+            self._ktl_enumerators()
+        return self.mapping
+    
+    def _receive_units(self, units):
+        """Build the lookup tables when enumerators arrive from the dispatcher."""
+        super(_Enumerators, self)._receive_units(units)
+        self._set_mapping(_shared_enumeration(self._enumeration, units))
+        self._enumerators_ready = True
+        self.log.trace("Enumerators are {0!r}".format(self.mapping))
+    
     def _ktl_enumerators(self):
         """Get KTL enumerators."""
+        if self.KTL_DISPATCHER:
+            return self.mapping.export()
         enums = getattr(self, '_ktl_enumerators_cache', None)
         if enums is None:
-            enums = super(Enumerated, self)._ktl_units()
+            enums = super(_Enumerators, self)._ktl_units()
+            if not self._enumerators_ready:
+                self._receive_units(enums)
+            enums = self.mapping.export()
             self._ktl_enumerators_cache = enums
-        if not isinstance(enums, collections.Mapping):
-            enums = dict(enumerate(enums))
-        self.log.trace("Enumerators are {0!r}".format(enums))
         return enums
         
     def _ktl_units(self):
@@ -445,26 +541,37 @@ class Enumerated(Integer):
         
     def _get_units(self):
         """Return a dictionary of enumerators."""
-        enums = {}
-        for k, v in self.mapping.enums.items():
-            enums[str(k)] = v
-        return enums
+        return self.mapping.export()
+    
+
+@dispatcher_keyword
+@client_keyword
+class Enumerated(_Enumerators, Integer):
+    """An enumerated keyword, which uses an integer as the underlying datatype."""
+    KTL_TYPE = 'enumerated'
+    
+    @property
+    def keys(self):
+        """The keys available."""
+        return self.mapping.enums.keys()
+        
+    def prewrite(self, value):
+        value = str(int(self.translate(value)))
+        return super(Enumerated, self).prewrite(value)
         
     def cast(self, value):
         """Cast the enumerated integer to the binary representation."""
         if self.KTL_DISPATCHER:
             return int(self.translate(value))
+        mapping = self._get_mapping()
         try:
-            vnum = int(float(value))
+            return mapping.bkeys[value]
+        except (KeyError, TypeError) as e:
+            pass
+        try:
+            return mapping.index(value)
         except (TypeError, ValueError) as e:
-            enums = self['enumerators']
-            for k, v in enums.items():
-                if v == str(value):
-                    vnum = int(k)
-                    break
-            else:
-                raise ValueError("Bad value for enumerated keyword {0}: '{1}' not in {2!r}".format(self.full_name, value, self.mapping))
-        return vnum
+            raise ValueError("Bad value for enumerated keyword {0}: '{1}' not in {2!r}".format(self.full_name, value, mapping))
         
     def _to_ascii(self, value):
         """Convert a binary value to ASCII."""
@@ -472,10 +579,7 @@ class Enumerated(Integer):
             vnum = int(float(value))
         except (TypeError, ValueError) as e:
             raise ValueError("Bad value for enumerated keyword {0}: '{1}' not in {2!r}".format(self.full_name, value, self.mapping))
-        if self.KTL_DISPATCHER:
-            return self.mapping.enums[vnum]
-        else:
-            return self['enumerators'][str(vnum)]
+        return self._get_mapping().enums[vnum]
     
     def check(self, value):
         """Check the value"""
@@ -503,9 +607,206 @@ class Enumerated(Integer):
         super(Enumerated, self)._update(self._to_ascii(value))
         
 
+class MaskEnumeration(Enumeration):
+    """The bit index-name pairs for a mask.
+    
+    Keys are bit positions, so that bit ``n`` corresponds to the integer value ``1 << n``.
+    An entry with the key ``None`` gives the name used when no bits are set.
+    """
+    def __init__(self, *args, **kwargs):
+        self.none = None
+        super(MaskEnumeration, self).__init__(*args, **kwargs)
+    
+    def __setitem__(self, key, value):
+        self._check_frozen()
+        if str(key).lower() == 'none':
+            self.none = str(value)
+            return
+        super(MaskEnumeration, self).__setitem__(key, value)
+    
+    @property
+    def allowed(self):
+        """An integer with every named bit set."""
+        allowed = 0
+        for bit in self.enums:
+            allowed |= (1 << bit)
+        return allowed
+    
+    def export(self):
+        """Export the bit names as a dictionary with string keys, as sent to clients."""
+        enums = super(MaskEnumeration, self).export()
+        if self.none is not None:
+            enums['None'] = self.none
+        return enums
+    
+    def bitmask(self, bits):
+        """Combine an iterable of bit names or numbers into an integer mask."""
+        value = 0
+        for bit in bits:
+            value |= (1 << self.index(bit))
+        return value
+    
+    def decode(self, value):
+        """Return the names of each bit set in an integer value, in bit order.
+        
+        Only the set bits are visited, so sparse masks decode quickly no matter how many bits are defined.
+        """
+        names = []
+        value = int(value)
+        while value:
+            low = value & -value
+            bit = low.bit_length() - 1
+            names.append(self.enums.get(bit, str(bit)))
+            value ^= low
+        return names
+    
+
 @dispatcher_keyword
-class Mask(Basic, _NotImplemented):
+@client_keyword
+class Mask(_Enumerators, Basic):
+    """A bit mask keyword, which uses an integer as the underlying datatype.
+    
+    Bits are named in the KTL XML, where each ``entry`` key is the bit position. The ascii representation
+    is a comma separated list of the names of set bits. Many bits can be set, cleared and tested at once
+    with :meth:`setbits`, :meth:`clearbits` and :meth:`test`; each change is a single integer value, and so
+    a single broadcast.
+    """
     KTL_TYPE = 'mask'
+    _type = int
+    
+    _enumeration = MaskEnumeration
+    
+    separator = ", "
+    """The separator between bit names in the ascii representation."""
+    
+    @property
+    def bits(self):
+        """The names of the bits available, in bit order."""
+        mapping = self._get_mapping()
+        return [mapping.enums[bit] for bit in sorted(mapping.enums)]
+    
+    def bitmask(self, *bits):
+        """Return the integer value with each of the named (or numbered) `bits` set."""
+        try:
+            return self._get_mapping().bitmask(bits)
+        except (TypeError, ValueError, KeyError):
+            raise ValueError("Bad bits for mask keyword {0}: {1!r}".format(self.full_name, bits))
+    
+    def cast(self, value):
+        """Cast the mask to the integer binary representation."""
+        return int(self.translate(value))
+    
+    def translate(self, value):
+        """Translate to the integer binary value.
+        
+        Accepts integers, numeric strings, comma separated bit names, or an iterable of bit names or numbers.
+        """
+        mapping = self._get_mapping()
+        try:
+            if isinstance(value, numbers.Integral):
+                ivalue = int(value)
+            elif isinstance(value, six.string_types):
+                value = value.strip()
+                try:
+                    ivalue = int(value, 0)
+                except ValueError:
+                    if value == "" or (mapping.none is not None and value.lower() == mapping.none.lower()):
+                        ivalue = 0
+                    else:
+                        ivalue = mapping.bitmask(value.split(","))
+            elif isinstance(value, numbers.Real):
+                ivalue = int(value)
+            else:
+                ivalue = mapping.bitmask(value)
+        except (TypeError, ValueError, KeyError):
+            raise ValueError("Bad value for mask keyword {0}: '{1}' not in {2!r}".format(self.full_name, value, mapping))
+        return str(ivalue)
+    
+    def check(self, value):
+        """Check that the value only sets known bits."""
+        ivalue = int(value)
+        if ivalue < 0:
+            raise ValueError("Keyword {0} must have a non-negative mask value, got {1}".format(self.name, ivalue))
+        mapping = self._get_mapping()
+        if len(mapping.enums) and (ivalue & ~mapping.allowed):
+            raise ValueError("Keyword {0} has no bits {1!r}".format(self.name, mapping.decode(ivalue & ~mapping.allowed)))
+        super(Mask, self).check(value)
+    
+    def prewrite(self, value):
+        value = self.translate(value)
+        return super(Mask, self).prewrite(value)
+    
+    def postread(self, value):
+        """Translate the value for python binary return."""
+        return super(Mask, self).postread(self.translate(value))
+    
+    def decode(self, value=None):
+        """Return a list of the names of the set bits in `value` (or the current keyword value)."""
+        if value is None:
+            value = self._ktl_binary()
+        return self._get_mapping().decode(self.cast(value))
+    
+    def test(self, *bits, **kwargs):
+        """Test whether all of the named `bits` are set in `value` (default: the current keyword value)."""
+        value = kwargs.pop('value', None)
+        if value is None:
+            value = self._ktl_binary()
+        mask = self.bitmask(*bits)
+        return (self.cast(value) & mask) == mask
+    
+    def _modify_bits(self, value):
+        """Change the value of this mask as the owner of the keyword."""
+        if self.KTL_DISPATCHER:
+            self.set(str(value))
+        else:
+            self.write(value)
+    
+    def setbits(self, *bits):
+        """Set all of the named `bits`, leaving the remaining bits unchanged."""
+        current = self._ktl_binary() if self._ktl_value() is not None else 0
+        self._modify_bits(current | self.bitmask(*bits))
+        
+    def clearbits(self, *bits):
+        """Clear all of the named `bits`, leaving the remaining bits unchanged."""
+        current = self._ktl_binary() if self._ktl_value() is not None else 0
+        self._modify_bits(current & ~self.bitmask(*bits))
+    
+    def tobits(self, value=None, nbits=None):
+        """Unpack an integer mask `value` into a boolean :mod:`numpy` array, where element ``n`` is bit ``n``.
+        
+        Bits at or above `nbits` are dropped.
+        """
+        if value is None:
+            value = self._ktl_binary()
+        value = self.cast(value)
+        if nbits is None:
+            nbits = max(value.bit_length(), self._get_mapping().allowed.bit_length())
+        else:
+            value &= (1 << nbits) - 1
+        nbytes = max((nbits + 7) // 8, 1)
+        packed = np.frombuffer(binascii.unhexlify("{0:0{1:d}x}".format(value, 2 * nbytes)), dtype=np.uint8)
+        return np.unpackbits(packed)[::-1][:nbits].astype(bool)
+    
+    def frombits(self, bits):
+        """Pack a boolean array, where element ``n`` is bit ``n``, into an integer mask value."""
+        bits = np.asarray(bits, dtype=bool)
+        nbytes = max((bits.size + 7) // 8, 1)
+        padded = np.zeros(nbytes * 8, dtype=bool)
+        padded[:bits.size] = bits
+        return int(binascii.hexlify(np.packbits(padded[::-1]).tobytes()), 16)
+    
+    def _to_ascii(self, value):
+        """Convert a binary value to ASCII."""
+        mapping = self._get_mapping()
+        names = mapping.decode(self.cast(value))
+        if not names:
+            return "" if mapping.none is None else mapping.none
+        return self.separator.join(names)
+    
+    def _update(self, value):
+        """Update this keyword value."""
+        super(Mask, self)._update(self._to_ascii(value))
+    
 
 @dispatcher_keyword
 @client_keyword
@@ -182,6 +182,10 @@ class IterationGuard(object):
             w._remove_pending()
         
 
+def _callback_key(item):
+    """An identity key for a function or bound method, which doesn't depend on creating a new bound method object."""
+    return (id(getattr(item, '__func__', item)), id(getattr(item, '__self__', None)))
+
 class Callbacks(object):
     """A list of callback functions."""
     def __init__(self, *args):
@@ -189,6 +193,8 @@ class Callbacks(object):
         self.data = []
         self._pending = []
         self._iterating = set()
+        self._index = {}
+        self._targets = None
         for item in args:
             self.add(item)
         
@@ -196,23 +202,35 @@ class Callbacks(object):
         """A callback set."""
         return "<Callbacks {0!r}>".format(self.data)
         
-    def _with_removing_callback(self, item):
+    def _with_removing_callback(self, item, key):
         """Return a weak method with a removing callback"""
-        def _remove(wr, selfref=weakref.ref(self)):
+        def _remove(wr, selfref=weakref.ref(self), key=key):
             self = selfref()
             if self is not None:
+                if self._index.get(key) is wr:
+                    del self._index[key]
+                self._targets = None
                 if self._iterating:
                     self._pending.append(wr)
-                else:
+                elif wr in self.data:
                     self.data.remove(wr)
         return WeakMethod(item, _remove)
         
+    def _get(self, item):
+        """Get the live weak method for an item, or None."""
+        wm = self._index.get(_callback_key(item))
+        if wm is not None and wm.valid:
+            return wm
+        return None
+        
     @remove_pending
     def add(self, item):
         """Add a single item."""
-        wm = self._with_removing_callback(item)
-        if wm not in self.data:
+        if self._get(item) is None:
+            key = _callback_key(item)
+            wm = self._index[key] = self._with_removing_callback(item, key)
             self.data.append(wm)
+            self._targets = None
         
     def __iter__(self):
         """Iterate through the list."""
@@ -232,8 +250,12 @@ class Callbacks(object):
     @remove_pending
     def remove(self, item):
         """Remove an item."""
-        wm = WeakMethod(item)
+        wm = self._get(item)
+        if wm is None:
+            raise ValueError("{0!r} is not in {1!r}".format(item, self))
+        del self._index[_callback_key(item)]
         self.data.remove(wm)
+        self._targets = None
     
     def _remove_pending(self):
         """Remove pending items."""
@@ -252,17 +274,36 @@ class Callbacks(object):
     @remove_pending
     def prepend(self, item):
         """Insert an item into the beginning of the callback list."""
-        wm = self._with_removing_callback(item)
-        if wm in self.data:
+        wm = self._get(item)
+        if wm is None:
+            key = _callback_key(item)
+            wm = self._index[key] = self._with_removing_callback(item, key)
+        else:
             self.data.remove(wm)
         self.data.insert(0, wm)
+        self._targets = None
         
     def __contains__(self, item):
-        wm = WeakMethod(item)
-        return wm in self.data
+        return self._get(item) is not None
+        
+    def _dispatch_targets(self):
+        """Weak references to the function and instance of each callback, in order."""
+        return tuple((wm._func, wm._instance if wm.method else None) for wm in self.data if wm.valid)
         
     def __call__(self, *args, **kwargs):
         """Fire all callbacks. Return values are collected in a list."""
-        return [callback(*args, **kwargs) for callback in self]
-            
-        
\ No newline at end of file
+        targets = self._targets
+        if targets is None:
+            targets = self._targets = self._dispatch_targets()
+        results = []
+        for func, instance in targets:
+            func = func()
+            if func is None:
+                continue
+            if instance is None:
+                results.append(func(*args, **kwargs))
+            else:
+                instance = instance()
+                if instance is not None:
+                    results.append(func(instance, *args, **kwargs))
+        return results
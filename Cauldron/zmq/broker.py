@@ -11,11 +11,15 @@ import collections
 import multiprocessing
 import binascii
 import weakref
+import json
 
 from ..config import read_configuration
 from .protocol import ZMQCauldronMessage, ZMQCauldronErrorResponse, FRAMEBLANK, FRAMEFAIL, DIRECTIONS
 from .common import zmq_get_address, check_zmq, teardown, zmq_connect_socket, zmq_check_nonlocal_address
 from ..exc import DispatcherError
+from ..logger import MSG, TRACE
+from ..metrics import process as metrics, publish
+from .. import registry
 
 __all__ = ['ZMQBroker', 'NoResponseNecessary', 'NoDispatcherAvailable', 'MultipleDispatchersFound']
 
@@ -77,27 +81,27 @@ class FanMessage(object):
         self.pending.remove(dispatcher.id)
         if message.payload not in (FRAMEBLANK.decode('utf-8'), FRAMEFAIL.decode('utf-8')) and not DIRECTIONS.iserror(message.direction):
             self.responses[dispatcher.name] = message.payload
-            self.client.log.log(5, "{0!r}.add({1!r}) success".format(self, message))
+            self.client.log.lazy(MSG, "{0!r}.add({1!r}) success", self, message)
         else:
-            self.client.log.log(5, "{0!r}.add({1!r}) ignore".format(self, message))
+            self.client.log.lazy(MSG, "{0!r}.add({1!r}) ignore", self, message)
         
     def resolve(self):
         """Fan message responses."""
         if not self.valid:
             response = self.message.error_response("No dispatchers for '{0}'".format(self.message.service))
-            self.client.log.log(5, "{0!r}.resolve() no dispatcher".format(self))
+            self.client.log.lazy(MSG, "{0!r}.resolve() no dispatcher", self)
             return response
         elif len(self.responses) == 1:
             dispatcher, payload = next(iter(self.responses.items()))
             response = self.message.response(payload)
             response.dispatcher = dispatcher
-            self.client.log.log(5, "{0!r}.resolve() single response {1}".format(self, payload))
+            self.client.log.lazy(MSG, "{0!r}.resolve() single response {1}", self, payload)
             return response
         elif len(self.responses):
-            self.client.log.log(5, "{0!r}.resolve() multiple response {1!r}".format(self, self.responses))
+            self.client.log.lazy(MSG, "{0!r}.resolve() multiple response {1!r}", self, self.responses)
             return self.message.response(":".join(self.responses.values()))
         else:
-            self.client.log.log(5, "{0!r}.resolve() failure".format(self))
+            self.client.log.lazy(MSG, "{0!r}.resolve() failure", self)
             return self.message.response(FRAMEFAIL)
         
     def send(self, socket):
@@ -124,6 +128,9 @@ class Lifetime(object):
         super(Lifetime, self).__init__()
         self.service = weakref.proxy(service)
         self._message_pool = dict()
+        self.messages = 0
+        self.replies = 0
+        self.latency = 0.0
         self.beat()
         
     def beat(self):
@@ -154,11 +161,15 @@ class Lifetime(object):
     def activate(self, message):
         """Base-class method to record a message as sent."""
         self._message_pool[message.identifier] = MessageReciept(message)
+        self.messages += 1
     
     def deactivate(self, message):
         """Record a message reciept. Generally means the source was alive!"""
         value = self._message_pool.pop(message.identifier, None)
         self.beat()
+        if value is not None:
+            self.replies += 1
+            self.latency += time.time() - value.sent
         return value
         
     def expire(self):
@@ -171,6 +182,16 @@ class Lifetime(object):
         """Clear the message pool"""
         self._message_pool.clear()
     
+    def stats(self, now=None):
+        """Message counts and the message pool, for the broker ``stats`` command.
+        
+        ``messages``, ``replies`` and ``latency`` (the sum of the seconds each reply took) are totals, so that rates can be found from the difference between two calls.
+        """
+        now = now or time.time()
+        sent = [reciept.sent for reciept in self._message_pool.values()]
+        return {'pending' : len(sent), 'oldest' : (now - min(sent)) if sent else 0.0, 'lifetime' : self.lifetime,
+            'messages' : self.messages, 'replies' : self.replies, 'latency' : self.latency}
+    
     def __repr__(self):
         return "<{0} name='{1}' lifetime={2:.2f} open={3:d}>".format(self.__class__.__name__, self.name, self.lifetime, self.active)
 
@@ -185,7 +206,9 @@ class Client(Lifetime):
     def send(self, message, socket):
         """Send a message to this client."""
         message.prefix = [self.id, b""]
-        self.log.log(5, "{0!r}.send({1!r})".format(self, message))
+        if message.trace is not None:
+            message.trace.stamp('broker_reply_send')
+        self.log.lazy(MSG, "{0!r}.send({1!r})", self, message)
         socket.send_multipart(message.data)
         self.deactivate(message)
         
@@ -204,18 +227,29 @@ class Dispatcher(Lifetime):
     def send(self, message, socket):
         """Send a message to this dispatcher."""
         message.prefix = [self.id, b""] + message.prefix
-        self.log.log(5, "{0!r}.send({1!r})".format(self, message))
+        if message.trace is not None:
+            message.trace.stamp('broker_send')
+        self.log.lazy(MSG, "{0!r}.send({1!r})", self, message)
         socket.send_multipart(message.data)
         self.activate(message)
         
+    def stats(self, now=None):
+        """Message counts, the message pool and keywords, for the broker ``stats`` command."""
+        stats = super(Dispatcher, self).stats(now)
+        stats['keywords'] = len(self.keywords)
+        stats['ready'] = self.message is not None
+        return stats
+        
     def send_beat(self, socket):
         """Send a beat."""
         if self.message is not None:
+            if time.time() > self._expiration:
+                metrics.increment(("BROKER", self.service.name, "HEARTBEAT", "MISSES"))
             msg = ZMQCauldronMessage(command='heartbeat', direction="DBP",
                 service=self.service.name, dispatcher=self.name, payload="beat")
             msg.prefix = [self.id, b""]
             self._next_beat = time.time() + self.service.broker.timeout
-            self.log.log(5, "{0!r}.beat({1!r})".format(self, msg))
+            self.log.lazy(MSG, "{0!r}.beat({1!r})", self, msg)
             socket.send_multipart(msg.data)
             self.activate(msg)
         
@@ -244,11 +278,27 @@ class Service(object):
         self.broker = weakref.proxy(broker)
         self.log = logger_getChild(self.broker.log, "Service.{0}".format(self.name))
         self._fans = {}
+        metrics.gauge(self, ("BROKER", self.name, "FANS"), lambda service : len(service._fans))
+        metrics.gauge(self, ("BROKER", self.name, "PENDING"),
+            lambda service : sum(lifetime.active for lifetime in list(service.dispatchers.values()) + list(service.clients.values())))
         
     def __repr__(self):
         """Represent this object."""
         return "<{0} name={1} dispatchers={2:d} clients={3:d}>".format(self.__class__.__name__, self.name, len(self.dispatchers), len(self.clients))
         
+    def stats(self, now=None):
+        """The state of this service's dispatchers, clients and fan messages, for the broker ``stats`` command."""
+        now = now or time.time()
+        clients = [client.stats(now) for client in self.clients.values()]
+        stats = {'keywords' : len(self.keywords), 'clients' : len(clients),
+            'dispatchers' : dict((name, dispatcher.stats(now)) for name, dispatcher in self.dispatchers.items()),
+            'fans' : [{'pending' : len(fan.pending), 'responses' : len(fan.responses), 'expires' : fan.timeout - now}
+                for fan in self._fans.values()]}
+        for key in ('pending', 'messages', 'replies', 'latency'):
+            stats[key] = sum(client[key] for client in clients)
+        stats['oldest'] = max([client['oldest'] for client in clients] or [0.0])
+        return stats
+        
     def get_dispatcher(self, message, recv=True):
         """Get a dispatcher object from a message."""
         try:
@@ -263,8 +313,10 @@ class Service(object):
             except ValueError:
                 raise DispatcherError("No dispatcher available for {0}".format(message.dispatcher))
         if recv:
-            self.log.log(5, "{0!r}.recv({1})".format(dispatcher_object, message))
-            dispatcher_object.deactivate(message)
+            self.log.lazy(MSG, "{0!r}.recv({1})", dispatcher_object, message)
+            reciept = dispatcher_object.deactivate(message)
+            if reciept is not None:
+                metrics.observe(("BROKER", self.name, "LATENCY"), time.time() - reciept.sent)
         return dispatcher_object
         
     def get_client(self, message, recv=True):
@@ -274,7 +326,7 @@ class Service(object):
         except KeyError:
             client_object = self.clients[message.client_id] = Client(message.client_id, self)
         if recv:
-            self.log.log(5, "{0!r}.recv({1})".format(client_object, message))
+            self.log.lazy(MSG, "{0!r}.recv({1})", client_object, message)
         return client_object
         
     def scrape(self, message):
@@ -322,6 +374,7 @@ class Service(object):
             if dispatcher.alive:
                 continue
             self.log.debug("{0!r} expiring".format(dispatcher))
+            metrics.increment(("BROKER", self.name, "EXPIRED"))
             for reciept in dispatcher.expire():
                 response = reciept.message.error_response("Dispatcher Timed Out")
                 self.handle(response, socket)
@@ -336,6 +389,8 @@ class Service(object):
         
     def handle(self, message, socket):
         """Handle"""
+        if message.direction[2] == "Q":
+            metrics.increment(("BROKER", self.name, message.command))
         try:
             method = getattr(self, handlers[message.direction])
             method(message, socket)
@@ -351,7 +406,7 @@ class Service(object):
     @handler("DBE")
     def handle_dispatcher_broker_error(self, message, socket):
         """This is an unusual case which can happen during cleanup."""
-        self.log.log(5, "Discarding {0!r}".format(message))
+        self.log.lazy(MSG, "Discarding {0!r}", message)
         
     @handler("DBQ")
     def handle_dispatcher_broker_query(self, message, socket):
@@ -408,7 +463,8 @@ class Service(object):
         
             for dispatcher in self.dispatchers.values():
                 dispatcher.send(fmessage.generate_message(dispatcher), socket)
-            self.log.log(5, "{0!r}.fan()".format(fmessage))
+            metrics.increment(("BROKER", self.name, "FANOUT"), len(fmessage.pending))
+            self.log.lazy(MSG, "{0!r}.fan()", fmessage)
         else:
             response = message.response(ktl_type)
             response.dispatcher = dispatcher_name
@@ -463,7 +519,7 @@ class Service(object):
 
 class ZMQBroker(threading.Thread):
     """A broker object for handling ZMQ Messaging patterns"""
-    def __init__(self, name, address, pub_address, sub_address, mon_address, context=None, timeout=1.0, heartbeat=True):
+    def __init__(self, name, address, pub_address, sub_address, mon_address, context=None, timeout=1.0, heartbeat=True, config=None):
         super(ZMQBroker, self).__init__(name=name)
         import zmq
         self.context = context or zmq.Context.instance()
@@ -477,7 +533,9 @@ class ZMQBroker(threading.Thread):
         self._local = threading.local()
         self._error = None
         self._heartbeat = heartbeat
+        self._config = config
         self.services = dict()
+        self._started = time.time()
         self.log.trace("ZMQBroker.__init__")
         
     @classmethod
@@ -492,7 +550,7 @@ class ZMQBroker(threading.Thread):
         mon_address = zmq_get_address(config, "subscribe", bind=False)
         timeout = config.getfloat("zmq", "timeout")
         heartbeat = config.getboolean("zmq", "heartbeat")
-        return cls(name, address, pub_address, sub_address, mon_address, timeout=timeout, heartbeat=heartbeat)
+        return cls(name, address, pub_address, sub_address, mon_address, timeout=timeout, heartbeat=heartbeat, config=config)
         
     @classmethod
     def serve(cls, config=None, name="ServerBroker"):
@@ -601,6 +659,12 @@ class ZMQBroker(threading.Thread):
         return service_object
         
     
+    def stats(self):
+        """The state of every service, answered to the ``stats`` command. See :mod:`Cauldron.zmq.top`."""
+        now = time.time()
+        return {'name' : self.name, 'time' : now, 'uptime' : now - self._started, 'timeout' : self.timeout,
+            'services' : dict((name, service.stats(now)) for name, service in self.services.items())}
+    
     def respond_inquiry(self, message, socket):
         """Respond to an inquiry."""
         try:
@@ -608,6 +672,13 @@ class ZMQBroker(threading.Thread):
         except Exception as e:
             socket.send_multipart(message.error_response(repr(e)).data)
     
+    def respond_stats(self, message, socket):
+        """Respond to a ``stats`` query, without registering a service or a client for the query."""
+        try:
+            socket.send_multipart(message.response(json.dumps(self.stats())).data)
+        except Exception as e:
+            socket.send_multipart(message.error_response(repr(e)).data)
+    
     def cleanup(self, socket):
         """docstring for cleanup"""
         for service in self.services.values():
@@ -668,13 +739,18 @@ class ZMQBroker(threading.Thread):
                 request = socket.recv_multipart()
                 if len(request) > 3:
                     message = ZMQCauldronMessage.parse(request)
+                    if message.trace is not None:
+                        message.trace.stamp('broker_recv' if message.direction[2] == "Q" else 'broker_reply_recv')
                     if message.direction[0:2] == "UB":
                         self.respond_inquiry(message, socket)
+                    elif message.direction == "CBQ" and message.command == "stats":
+                        self.respond_stats(message, socket)
                     else:
                         service = self.get_service(message.service)
                         service.handle(message, socket)
                 else:
-                    self.log.log(5, "Malofrmed request: |{0}|".format("|".join(map(binascii.hexlify,request))))
+                    if self.log.isEnabledFor(MSG):
+                        self.log.msg("Malofrmed request: |{0}|".format("|".join(map(binascii.hexlify,request))))
         
             self.cleanup(socket)
         
@@ -699,7 +775,7 @@ class ZMQBroker(threading.Thread):
         if not self.isAlive():
             return
         
-        self.log.trace("stop(timeout={0!r}) Signalling to stop broker.".format(timeout))
+        self.log.lazy(TRACE, "stop(timeout={0!r}) Signalling to stop broker.", timeout)
         if self.running.is_set() and not self.context.closed:
             signal = self.context.socket(zmq.PUSH)
             signal.connect("inproc://{0:s}".format(hex(id(self))))
@@ -716,6 +792,15 @@ class ZMQBroker(threading.Thread):
         if self._error is not None:
             raise RuntimeError(self._error)
 
+    def publish_metrics(self):
+        """Publish broker metrics, when they are enabled in the configuration."""
+        if self._config is None or not self._config.getboolean("metrics", "enable"):
+            return
+        if registry.dispatcher.backend is None:
+            self.log.warning("Can't publish broker metrics, no dispatcher backend is in use.")
+            return
+        publish("BROKER", self._config)
+        
     def run(self):
         """Run method for threads."""
         try:
@@ -723,6 +808,7 @@ class ZMQBroker(threading.Thread):
         
             self.running.set()
             self.log.debug("Broker running. Timeout={0}".format(self.timeout))
+            self.publish_metrics()
             while self.running.is_set():
                 self.respond()
             
@@ -751,12 +837,21 @@ def main():
     parser.add_argument("-c", "--config", type=six.text_type, help="set the Cauldron-zmq configuration filename", default=None)
     parser.add_argument("-v", "--verbose", action="count", help="use verbose messaging.")
     parser.add_argument("-D", dest='debug', action='store_true', help="Debug - print keyboard interrupts.")
+    parser.add_argument("-k", "--backend", type=six.text_type, help="the Cauldron backend used to publish broker metrics (default: [init] backend)", default=None)
     opt = parser.parse_args()
     if opt.verbose:
         _setup_logging(opt.verbose)
+    config = read_configuration(opt.config)
+    if config.getboolean("metrics", "enable"):
+        backend = opt.backend or config.get("init", "backend")
+        if backend != "none":
+            from ..api import use
+            use(backend)
+        else:
+            print("Broker metrics are enabled, but won't be published without a backend, set with --backend or [init] backend.")
     print("^C to stop broker.")
     try:
-        ZMQBroker.serve(read_configuration(opt.config))
+        ZMQBroker.serve(config)
     except KeyboardInterrupt:
         if opt.debug:
             raise
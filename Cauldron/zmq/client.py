@@ -18,6 +18,7 @@ from .. import registry
 from ..config import get_configuration, get_timeout
 from ..logger import KeywordMessageFilter
 from ..compat import WeakSet
+from ..logger import LazyFormat, MSG, TRACE
 
 import atexit
 import json
@@ -82,7 +83,7 @@ class _ZMQMonitorThread(ZMQThread):
                 ready = dict(poller.poll(timeout=1e3))
                 if signal in ready:
                     _ = signal.recv()
-                    self.log.trace("Got a signal: .running = {0}".format(self.running.is_set()))
+                    self.log.lazy(TRACE, "Got a signal: .running = {0}", self.running.is_set())
                     continue
                 if socket in ready:
                     try:
@@ -94,15 +95,16 @@ class _ZMQMonitorThread(ZMQThread):
                         try:
                             if keyword.name in self.monitored:
                                 keyword._update(message.unwrap())
-                                self.log.trace("{0!r}.monitor({1}={2})".format(self, keyword.name, message.unwrap()))
+                                if self.log.isEnabledFor(TRACE):
+                                    self.log.trace("{0!r}.monitor({1}={2})".format(self, keyword.name, message.unwrap()))
                             else:
-                                self.log.trace("{0!r}.monitor({1}) ignored".format(self, keyword.name))
+                                self.log.lazy(TRACE, "{0!r}.monitor({1}) ignored", self, keyword.name)
                         except Exception as e:
                             self.log.exception("{0!r}._update() error: {1!r}".format(keyword, e))
                         finally:
                             self.log.removeFilter(f)
                     except PrefixMatchError as e:
-                        self.log.trace("{0!r}.monitor() ignored".format(self))
+                        self.log.lazy(TRACE, "{0!r}.monitor() ignored", self)
                     except ZMQCauldronErrorResponse as e:
                         self.log.error("Broadcast Message Error: {0!r}".format(e))
                     except (zmq.ContextTerminated, zmq.ZMQError):
@@ -110,7 +112,7 @@ class _ZMQMonitorThread(ZMQThread):
                     except Exception as e:
                         self.log.exception("Broadcast error: {0!r}".format(e))
         except (zmq.ContextTerminated, zmq.ZMQError) as e:
-            self.log.trace("Service shutdown and context terminated, closing broadcast thread. {0}".format(repr(e)))
+            self.log.lazy(TRACE, "Service shutdown and context terminated, closing broadcast thread. {0!r}", e)
         else:
             try:
                 socket.close(linger=0)
@@ -201,12 +203,17 @@ class Service(ClientService):
         
     def _handle_response(self, message):
         """Handle a response, and return the payload."""
-        self.log.msg("{0!r}.recv({1!s})".format(self, message))
+        self.log.lazy(MSG, "{0!r}.recv({1!s})", self, message)
         if message.iserror:
             raise DispatcherError("Dispatcher error on command: {0}".format(message.payload))
         message.verify(self)
         return message.unwrap()
     
+    @property
+    def latency(self):
+        """Latency breakdowns of traced requests, as a :class:`~Cauldron.zmq.trace.LatencyHistogram`."""
+        return self._tasker.latency
+    
     def _asynchronous_command(self, command, payload, keyword=None, direction="CDQ", timeout=None, callback=None):
         """Run an asynchronous command."""
         callback = callback or self._handle_response
@@ -223,9 +230,12 @@ class Keyword(ClientKeyword):
     # Client keyword object for use with ZMQ.
     
     def _prepare(self):
-        """Prepare this keyword for use."""
-        if self.KTL_TYPE == 'enumerated':
-            self._async_units()
+        """Prepare this keyword for use.
+        
+        Enumerated and mask keywords fetch their enumerators here, in the calling thread. Responses are handled by the task queue thread, which can't wait for enumerators that it must itself receive.
+        """
+        if self.KTL_TYPE in ('enumerated', 'mask'):
+            self._ktl_enumerators()
     
     def _ktl_reads(self):
         """Is this keyword readable?"""
@@ -240,34 +250,49 @@ class Keyword(ClientKeyword):
         return self.name in self.service._monitor.monitored
         
     def _ktl_units(self):
-        """Get KTL units."""
+        """Get KTL units.
+        
+        Waits at most the ``[zmq] timeout`` when no core timeout is configured, as enumerated keywords request their units when they are prepared.
+        """
         if getattr(self, '_units', None) is None:
             timeout = get_timeout(None)
-            if not hasattr(self, '_got_units'):
-                self._async_units(timeout)
-            self._got_units.wait(timeout)
-            if not self._got_units.is_set():
-                raise DispatcherError("Dispatcher error on command 'units'.")
+            if timeout is None:
+                timeout = get_configuration().getfloat("zmq", "timeout")
+            got_units = getattr(self, '_got_units', None)
+            if got_units is None or self._units_error is not None:
+                # Ask again after a failure, instead of failing forever.
+                got_units = self._async_units(timeout)
+            if not got_units.wait(timeout):
+                self._units_error = TimeoutError("Dispatcher timed out on command 'units'.")
+            if self._units_error is not None:
+                raise self._units_error
         return '' if self._units is None else self._units
         
     def _async_units(self, timeout=None):
-        """Asynchronously request units."""
-        self._got_units = threading.Event()
-        return self._asynchronous_command("units", "", timeout=timeout, callback=self._handle_units)
+        """Asynchronously request units, returning an event which is set once the response is handled."""
+        self._got_units = got_units = threading.Event()
+        self._units_error = None
+        self._asynchronous_command("units", "", timeout=timeout, callback=self._handle_units)
+        return got_units
         
     def _handle_units(self, message):
         """Handle a message response which has units.."""
-        self.log.msg("{0!r}.recv({1!s})".format(self, message))
-        if message.iserror:
-            raise DispatcherError("Dispatcher error on command: {0}".format(message.payload))
-        message.verify(self.service)
-        self._units = json.loads(message.unwrap())
-        self._got_units.set()
+        try:
+            self.log.lazy(MSG, "{0!r}.recv({1!s})", self, message)
+            if message.iserror:
+                raise DispatcherError("Dispatcher error on command: {0}".format(message.payload))
+            message.verify(self.service)
+            self._receive_units(json.loads(message.unwrap()))
+        except Exception as e:
+            self._units_error = e
+            raise
+        finally:
+            self._got_units.set()
         return self._units
     
     def _handle_response(self, message):
         """Handle a response, and return the payload."""
-        self.log.msg("{0!r}.recv({1!s})".format(self, message))
+        self.log.lazy(MSG, "{0!r}.recv({1!s})", self, message)
         if message.iserror:
             self.log.error("Dispatcher error: {0}".format(message))
             raise DispatcherError("Dispatcher error on command: {0}".format(message.payload))
@@ -299,19 +324,19 @@ class Keyword(ClientKeyword):
     def _await(self, task, timeout, _call_msg=None):
         """Await an asynchronous task."""
         if _call_msg is None:
-            _call_msg = lambda : "{0!r}_await(task={1!r}, timeout={2!r})".format(self, task, timeout)
+            _call_msg = LazyFormat("{0!r}_await(task={1!r}, timeout={2!r})", self, task, timeout)
         
-        self.service.log.trace("{0} waiting.".format(_call_msg()))
+        self.service.log.lazy(TRACE, "{0} waiting.", _call_msg)
         try:
             result = task.get(timeout=timeout)
         except TimeoutError:
-            raise TimeoutError("{0} timed out.".format(_call_msg()))
+            raise TimeoutError("{0} timed out.".format(_call_msg))
         else:
-            self.service.log.trace("{0} complete.".format(_call_msg()))
+            self.service.log.lazy(TRACE, "{0} complete.", _call_msg)
         return result
     
     def read(self, binary=False, both=False, wait=True, timeout=None):
-        _call_msg = lambda : "{0!r}.read(wait={1}, timeout={2})".format(self, wait, timeout)
+        _call_msg = LazyFormat("{0!r}.read(wait={1}, timeout={2})", self, wait, timeout)
         
         if not self['reads']:
             raise NotImplementedError("Keyword '{0}' does not support reads.".format(self.name))
@@ -324,7 +349,7 @@ class Keyword(ClientKeyword):
             return task
         
     def write(self, value, wait=True, binary=False, timeout=None):
-        _call_msg = lambda : "{0!r}.write(wait={1}, timeout={2})".format(self, wait, timeout)
+        _call_msg = LazyFormat("{0!r}.write(wait={1}, timeout={2})", self, wait, timeout)
         
         if not self['writes']:
             raise NotImplementedError("Keyword '{0}' does not support writes.".format(self.name))
@@ -334,7 +359,7 @@ class Keyword(ClientKeyword):
             value = self.cast(value)
         except (TypeError, ValueError):
             pass
-        self.service.log.trace("{0} = {1}".format(_call_msg(), value))
+        self.service.log.lazy(TRACE, "{0} = {1}", _call_msg, value)
         task = self._asynchronous_command("modify", value, timeout=timeout)
         if wait:
             return self._await(task, timeout, _call_msg)
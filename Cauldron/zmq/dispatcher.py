@@ -13,6 +13,8 @@ from .tasker import Task, TaskQueue
 from ..base import DispatcherService, DispatcherKeyword
 from .. import registry
 from ..exc import DispatcherError, WrongDispatcher, TimeoutError
+from ..logger import TRACE
+from ..metrics import process as metrics
 
 import threading
 import logging
@@ -77,6 +79,10 @@ class Service(DispatcherService):
         self._tasker = TaskQueue(self.log.name +".Tasks", ctx=self.ctx, 
                                  log=self.log, backend_address=self._worker_pool.internal_address)
         self._scheduler = ZMQScheduler(self.log.name + ".Scheduler", self.ctx)
+        self._scheduler.metrics_key = (self.name, self.dispatcher, "SCHEDULER", "LATENESS")
+        metrics.gauge(self._tasker, (self.name, self.dispatcher, "TASKS"), lambda tasker : len(tasker._pending))
+        metrics.gauge(self._worker_pool, (self.name, self.dispatcher, "WORKERS", "IDLE"), lambda pool : len(pool._worker_queue))
+        metrics.gauge(self._worker_pool, (self.name, self.dispatcher, "WORKERS", "BUSY"), lambda pool : len(pool._active_workers))
     
     def _begin(self):
         """Allow command responses to start."""
@@ -165,7 +171,7 @@ class Keyword(DispatcherKeyword):
     def _broadcast(self, value):
         """Broadcast this keyword value."""
         self.service._asynchronous_command("broadcast", value, self.name)
-        self.log.trace("{0!r}.broadcast() done.".format(self))
+        self.log.lazy(TRACE, "{0!r}.broadcast() done.", self)
     
     def schedule(self, appointment=None, cancel=False):
         """Schedule an update."""
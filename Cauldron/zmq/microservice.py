@@ -54,6 +54,8 @@ class ZMQMicroservice(ZMQThread):
             self.log.exception("Error handling '{0}': {1!r}".format(message.command, e))
             return message.error_response("{0!r}".format(e))
         else:
+            if message.trace is not None:
+                message.trace.stamp('handler_done')
             response = message.response(response_payload)
             return response
     
@@ -13,6 +13,7 @@ import collections
 import uuid
 
 from ..exc import DispatcherError
+from .trace import MessageTrace
 
 __all__ = ['MessageType', 'Directions', 'ZMQCauldronErrorResponse', 
     'ZMQCauldronParserError', 'ZMQCauldronMessage', 'PrefixMatchError', 'FrameFailureError']
@@ -204,7 +205,7 @@ class ZMQCauldronMessage(object):
     NPARTS = 7
     
     def __init__(self, command=FRAMEBLANK, service=FRAMEBLANK, dispatcher=FRAMEBLANK, 
-        keyword=FRAMEBLANK, payload=FRAMEBLANK, direction="CDQ", prefix=None, identifier=None):
+        keyword=FRAMEBLANK, payload=FRAMEBLANK, direction="CDQ", prefix=None, identifier=None, trace=None):
         super(ZMQCauldronMessage, self).__init__()
         self.command = _decode_handle_none(command)
         self.service = _decode_handle_none(service)
@@ -217,6 +218,7 @@ class ZMQCauldronMessage(object):
         self.direction = decode(direction)
         self.identifier =  six.binary_type(identifier) if identifier is not None else uuid.uuid4().bytes
         self.prefix = [six.binary_type(p) for p in (prefix or [])]
+        self.trace = trace
         
     def _parse_prefix(self):
         """Handle the prefix."""
@@ -288,7 +290,10 @@ class ZMQCauldronMessage(object):
     @property
     def data(self):
         """The full message data, to be sent over a ZMQ Socket.."""
-        return self.prefix + [ six.text_type(s).encode('utf-8') for s in self._message_parts] + [self.identifier]
+        data = self.prefix + [ six.text_type(s).encode('utf-8') for s in self._message_parts] + [self.identifier]
+        if self.trace is not None:
+            data.append(self.trace.encode())
+        return data
         
     def __iter__(self):
         """Allow us to send messages directly."""
@@ -309,6 +314,7 @@ class ZMQCauldronMessage(object):
             'direction' : self.direction,
             'identifier' : self.identifier,
             'prefix': self.prefix,
+            'trace' : self.trace,
         }
         
     def copy(self):
@@ -364,6 +370,11 @@ class ZMQCauldronMessage(object):
     def parse(cls, data):
         """Parse data. Errors are raised when appropriate."""
         
+        trace = None
+        if len(data) > cls.NPARTS and MessageTrace.is_frame(data[-1]):
+            trace = MessageTrace.decode(data[-1])
+            data = data[:-1]
+        
         if len(data) > cls.NPARTS:
             prefix = data[:-cls.NPARTS]
             data = data[-cls.NPARTS:]
@@ -382,4 +393,4 @@ class ZMQCauldronMessage(object):
             elif dispatcher != FRAMEBLANK:
                 raise ZMQCauldronParserError.with_message(
                     "Can't parser message '{0}' because message can't specify a dispatcher with no service.".format(data))
-        return cls(command, service, dispatcher, keyword, payload, direction, prefix, identifier)
\ No newline at end of file
+        return cls(command, service, dispatcher, keyword, payload, direction, prefix, identifier, trace)
\ No newline at end of file
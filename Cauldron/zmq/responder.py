@@ -6,9 +6,12 @@ Implements the ZMQ Dispatcher responder worker pool.
 from .common import zmq_get_address, check_zmq, zmq_connect_socket, zmq_check_nonlocal_address
 from .microservice import ZMQMicroservice, ZMQThread
 from .protocol import ZMQCauldronMessage, FRAMEFAIL, FRAMEBLANK
+from .trace import stamp_frames
 from .broker import ZMQBroker
 from ..exc import DispatcherError, WrongDispatcher, TimeoutError
 from ..config import get_timeout
+from ..logger import MSG, TRACE
+from ..metrics import process as metrics
 
 import json
 import collections
@@ -43,7 +46,7 @@ def register_dispatcher(service, socket, poller=None, log=None, timeout=None, ad
         service=service.name, dispatcher=service.dispatcher)
     socket.send(b"", flags=zmq.SNDMORE)
     socket.send_multipart(ready.data)
-    log.log(5, "Sent broker a ready message: {0!s}.".format(ready))
+    log.lazy(MSG, "Sent broker a ready message: {0!s}.", ready)
     return b
 
 def _auto_dispatcher(service, socket, poller=None, log=None, timeout=None):
@@ -73,7 +76,7 @@ def _register_dispatcher(service, socket, poller=None, log=None, timeout=None):
     
     socket.send(b"", flags=zmq.SNDMORE)
     socket.send_multipart(welcome.data)
-    log.log(5, "register.send({0!s})".format(welcome))
+    log.lazy(MSG, "register.send({0!s})", welcome)
     return _check_for_registration(service, socket, poller=poller, log=log, timeout=timeout)
     
 def _check_for_registration(service, socket, poller=None, log=None, timeout=None):
@@ -85,14 +88,14 @@ def _check_for_registration(service, socket, poller=None, log=None, timeout=None
     
     # Check that we got the welcome message.
     ready = dict(poller.poll(timeout=timeout * 1e3))
-    log.log(5, repr(ready) + repr(socket) + repr(zmq.POLLIN))
+    log.lazy(MSG, "{0!r}{1!r}{2!r}", ready, socket, zmq.POLLIN)
     if ready.get(socket) == zmq.POLLIN:
         message = ZMQCauldronMessage.parse(socket.recv_multipart())
         if message.payload != "confirmed":
             raise DispatcherError("Message confirming welcome was malformed! {0!s}".format(message))
         return True
     else:
-        log.log(5, "register.timeout after {0} seconds.".format(timeout))
+        log.lazy(MSG, "register.timeout after {0} seconds.", timeout)
         return False
     
 
@@ -135,13 +138,16 @@ class ZMQPooler(ZMQThread):
         self._active_workers.pop(identifier, None)
         fori = self._directory.pop(identifier, None)
         if len(msg) == 1 and msg[0] == b"ready":
-            self.log.trace("{0}.recv() worker {1} ready".format(self, binascii.hexlify(identifier)))
+            if self.log.isEnabledFor(TRACE):
+                self.log.trace("{0}.recv() worker {1} ready".format(self, binascii.hexlify(identifier)))
         elif fori == "F":
-            self.log.trace("{0}.broker() B2F {1}".format(self, binascii.hexlify(identifier)))
+            if self.log.isEnabledFor(TRACE):
+                self.log.trace("{0}.broker() B2F {1}".format(self, binascii.hexlify(identifier)))
             frontend.send(b"", flags=zmq.SNDMORE|zmq.NOBLOCK)
             frontend.send_multipart(msg, flags=zmq.NOBLOCK)
         elif fori == "I":
-            self.log.trace("{0}.broker() B2I {1}".format(self, binascii.hexlify(identifier)))
+            if self.log.isEnabledFor(TRACE):
+                self.log.trace("{0}.broker() B2I {1}".format(self, binascii.hexlify(identifier)))
             internal.send(b"", flags=zmq.SNDMORE|zmq.NOBLOCK)
             internal.send_multipart(msg, flags=zmq.NOBLOCK)
         self._worker_queue.append(identifier)
@@ -150,10 +156,11 @@ class ZMQPooler(ZMQThread):
         """Handle a frontend request."""
         zmq = check_zmq()
         _ = frontend.recv()
-        msg = frontend.recv_multipart()
+        msg = stamp_frames(frontend.recv_multipart(), 'pool_recv')
         if self.running.isSet():
             worker = self._worker_queue.popleft()
-            self.log.trace("{0}.broker() {2}2B {1}".format(self, binascii.hexlify(worker), code))
+            if self.log.isEnabledFor(TRACE):
+                self.log.trace("{0}.broker() {2}2B {1}".format(self, binascii.hexlify(worker), code))
             backend.send(worker, flags=zmq.SNDMORE|zmq.NOBLOCK)
             backend.send(b"", flags=zmq.SNDMORE|zmq.NOBLOCK)
             backend.send_multipart(msg, flags=zmq.NOBLOCK)
@@ -176,7 +183,7 @@ class ZMQPooler(ZMQThread):
             return False
         if signal in ready:
             _ = signal.recv()
-            self.log.trace("Got a signal: .running = {0}".format(self.running.is_set()))
+            self.log.lazy(TRACE, "Got a signal: .running = {0}", self.running.is_set())
             return True
         if backend in ready:
             self._handle_backend(frontend, internal, backend)
@@ -253,19 +260,26 @@ class ZMQPooler(ZMQThread):
         
 
 @contextlib.contextmanager
-def deadlock_context(lock, log, name):
-    """Attempt to detect and warn about deadlocks."""
+def deadlock_context(lock, log, name, trace=None):
+    """Attempt to detect and warn about deadlocks.
+    
+    When `trace` is given, the time spent waiting for the lock is stamped on it.
+    """
+    if trace is not None:
+        trace.stamp('lock_request')
     locked = lock.acquire(False)
     if not locked:
         log.warning("Deadlock warning for lock {0}".format(name))
         lock.acquire()
     else:
-        log.trace("Acquired lock {0}".format(name))
+        log.lazy(TRACE, "Acquired lock {0}", name)
+    if trace is not None:
+        trace.stamp('lock_acquired')
     try:
         yield lock
     finally:
         lock.release()
-        log.trace("Released lock {0}".format(name))
+        log.lazy(TRACE, "Released lock {0}", name)
 
 class ZMQWorker(ZMQMicroservice):
     """A ZMQ-based worker"""
@@ -282,7 +296,7 @@ class ZMQWorker(ZMQMicroservice):
         """Handle a modify command."""
         message.verify(self.service)
         keyword = self.service[message.keyword]
-        with deadlock_context(keyword._lock, self.log, keyword.full_name):
+        with deadlock_context(keyword._lock, self.log, keyword.full_name, message.trace):
             keyword.modify(message.payload)
         return keyword.value
     
@@ -290,7 +304,7 @@ class ZMQWorker(ZMQMicroservice):
         """Handle an update command."""
         message.verify(self.service)
         keyword = self.service[message.keyword]
-        with deadlock_context(keyword._lock, self.log, keyword.full_name):
+        with deadlock_context(keyword._lock, self.log, keyword.full_name, message.trace):
             value = keyword.update()
         return value
         
@@ -330,13 +344,13 @@ class ZMQWorker(ZMQMicroservice):
         """Handle the broadcast command."""
         message.verify(self.service)
         message = ZMQCauldronMessage(command="broadcast", service=self.service.name, dispatcher=self.service.dispatcher, keyword=message.keyword, payload=message.payload, direction="CDB")
-        self.log.trace("{0!r}.broadcast({1!s})".format(self, message))
+        self.log.lazy(TRACE, "{0!r}.broadcast({1!s})", self, message)
         self._broadcaster.send_multipart(message.data)
         return "success"
         
     def handle_heartbeat(self, message):
         """Heartbeat command does pretty much nothing."""
-        self.log.trace("{0!r}.beat({1!s})".format(self, message))
+        self.log.lazy(TRACE, "{0!r}.beat({1!s})", self, message)
         return "{0:.1f}".format(time.time())
         
     def respond(self):
@@ -366,17 +380,23 @@ class ZMQWorker(ZMQMicroservice):
                 continue
             if signal in ready:
                 _ = signal.recv()
-                self.log.log(5, "Got a signal: .running = {0}".format(self.running.is_set()))
+                self.log.lazy(MSG, "Got a signal: .running = {0}", self.running.is_set())
                 continue
             if backend in ready:
                 message = ZMQCauldronMessage.parse(backend.recv_multipart())
-                self.log.log(5, "{0!r}.recv({1})".format(self, message))
+                if message.trace is not None:
+                    message.trace.stamp('worker_recv')
+                self.log.lazy(MSG, "{0!r}.recv({1})", self, message)
+                started = time.time()
                 response = self.handle(message)
+                metrics.record((self.service.name, self.service.dispatcher, message.command), time.time() - started)
                 if self.running.is_set() and backend.poll(flags=zmq.POLLOUT):
+                    if response.trace is not None:
+                        response.trace.stamp('worker_send')
                     backend.send_multipart(response.data)
-                    self.log.log(5, "{0!r}.send({1})".format(self, response))
+                    self.log.lazy(MSG, "{0!r}.send({1})", self, response)
                 else:
-                    self.log.log(5, "{0!r}.drop({1})".format(self, response))
+                    self.log.lazy(MSG, "{0!r}.drop({1})", self, response)
 
         
         backend.close(linger=0)
@@ -10,6 +10,7 @@ import datetime
 from .common import check_zmq
 from .thread import ZMQThread
 from ..scheduler import Scheduler
+from ..logger import MSG
 
 __all__ = ['ZMQScheduler']
 
@@ -35,7 +36,7 @@ class ZMQScheduler(ZMQThread, Scheduler):
                 timeout = self.get_timeout()
                 if signal.poll(timeout=timeout * 1e3):
                     _ = signal.recv()
-                    self.log.log(5, "Got a signal: .running = {0}".format(self.running.is_set()))
+                    self.log.lazy(MSG, "Got a signal: .running = {0}", self.running.is_set())
                     continue
                 
                 thetime = now()
@@ -7,19 +7,27 @@ from six.moves import queue
 import threading
 import sys
 import time
+import random
 import zmq
 from .common import zmq_connect_socket, check_zmq
 from .protocol import ZMQCauldronMessage, FRAMEBLANK
+from .trace import MessageTrace, LatencyHistogram
 from .thread import ZMQThread
 from ..utils.callbacks import WeakMethod
 from ..exc import TimeoutError
 from ..config import get_configuration, get_timeout
 from ..base.core import Task as _BaseTask
-from ..logger import KeywordMessageFilter
+from ..logger import KeywordMessageFilter, TRACE
 
 class Task(_BaseTask):
     """A task container for the task queue."""
     
+    #: The latency breakdown of a traced task, see :meth:`~Cauldron.zmq.trace.MessageTrace.breakdown`.
+    trace = None
+    
+    #: The histogram which collects the latency breakdown of a traced task.
+    latency = None
+    
     def __call__(self, message):
         """Handle this message."""
         try:
@@ -28,6 +36,11 @@ class Task(_BaseTask):
             self.error = e
             self.exc_info = sys.exc_info()
         finally:
+            if message.trace is not None:
+                message.trace.stamp('client_done')
+                self.trace = message.trace.breakdown()
+                if self.latency is not None:
+                    self.latency.add(self.trace)
             self.event.set()
         
     
@@ -43,6 +56,8 @@ class TaskQueue(ZMQThread):
         self._backend_address = backend_address
         self._local = threading.local()
         self._frontend_sockets = set()
+        self._trace_rate = get_configuration().getfloat("zmq", "trace")
+        self.latency = LatencyHistogram()
         
     def _check_timeout(self):
         """Check timeouts for tasks."""
@@ -57,7 +72,7 @@ class TaskQueue(ZMQThread):
                 continue
             dur = starttime + task.timeout
             if dur < now:
-                self.log.trace("{0!r}.timeout({1}) after {2:f}".format(self, task.request, task.timeout))
+                self.log.lazy(TRACE, "{0!r}.timeout({1}) after {2:f}", self, task.request, task.timeout)
                 task.timedout()
                 self._pending.pop(task.request.identifier)
             elif (timeout > (task.timeout * 1e3)):
@@ -86,11 +101,11 @@ class TaskQueue(ZMQThread):
         """Add a task to the queue."""
         self._pending[task.request.identifier] = (time.time(), task)
         if self.frontend.poll(flags=zmq.POLLOUT, timeout=get_timeout(None, 100.0)) and self.running.is_set():
-            self.log.trace("{0!r}.put({1})".format(self, task.request))
+            self.log.lazy(TRACE, "{0!r}.put({1})", self, task.request)
             self.frontend.send(task.request.identifier, flags=zmq.NOBLOCK)
-            self.log.trace("{0!r}.put({1}) done.".format(self, task.request))
+            self.log.lazy(TRACE, "{0!r}.put({1}) done.", self, task.request)
         else:
-            self.log.trace("{0!r}.drop({1})".format(self, task.request))
+            self.log.lazy(TRACE, "{0!r}.drop({1})", self, task.request)
         
         
     def asynchronous_command(self, command, payload, service, keyword=None, direction="CDQ", timeout=None, callback=None, dispatcher=None):
@@ -100,6 +115,10 @@ class TaskQueue(ZMQThread):
             keyword=keyword if keyword is not None else FRAMEBLANK, 
             payload=payload if payload is not None else FRAMEBLANK)
         task = Task(request, callback, get_timeout(timeout))
+        if self._trace_rate and random.random() < self._trace_rate:
+            request.trace = MessageTrace()
+            request.trace.stamp('client_create')
+            task.latency = self.latency
         self.put(task)
         return task
         
@@ -146,7 +165,9 @@ class TaskQueue(ZMQThread):
             if backend in ready:
                 try:
                     message = ZMQCauldronMessage.parse(backend.recv_multipart())
-                    self.log.trace("{0!r}.recv({1})".format(self, message))
+                    if message.trace is not None:
+                        message.trace.stamp('client_recv')
+                    self.log.lazy(TRACE, "{0!r}.recv({1})", self, message)
                 except Exception as e:
                     # un-parseable message, discard it.
                     self.log.exception("Discarding {0}".format(str(e)))
@@ -163,7 +184,9 @@ class TaskQueue(ZMQThread):
             if frontend in ready:
                 identifier = frontend.recv()
                 starttime, task = self._pending[identifier]
-                self.log.trace("{0!r}.send({1})".format(self, task.request))
+                self.log.lazy(TRACE, "{0!r}.send({1})", self, task.request)
+                if task.request.trace is not None:
+                    task.request.trace.stamp('client_send')
                 backend.send(b"", flags=zmq.SNDMORE)
                 backend.send_multipart(task.request.data)
             
@@ -460,4 +460,75 @@ def test_dispatcher_expiration(broker_quick_expire, csocket, dsocket, servicenam
     assert cmessage.direction == "CDE"
     assert cmessage.command == "test"
     assert cmessage.payload == "Dispatcher Timed Out"
-    
\ No newline at end of file
+    
+def test_client_broker_stats(broker, csocket, dsocket, dispatcher, dispatcher_name, servicename, message, timeout):
+    """Test a client asking the broker for its stats, before and after a message."""
+    import json
+    from .top import format_stats
+    
+    stats = message.copy()
+    stats.direction = "CBQ"
+    stats.command = "stats"
+    
+    csocket.send_multipart(stats.data)
+    broker.respond()
+    assert csocket.poll(timeout) != 0, "No messages were ready!"
+    response = ZMQCauldronMessage.parse(csocket.recv_multipart())
+    assert response.direction == "CBP"
+    before = json.loads(response.payload)
+    assert before['name'] == "Test-Broker"
+    
+    request = message.copy()
+    request.direction = "CDQ"
+    request.command = "test"
+    request.payload = "data"
+    request.dispatcher = dispatcher_name
+    csocket.send_multipart(request.data)
+    broker.respond()
+    assert dsocket.poll(timeout) != 0, "No dispatcher messages were ready"
+    dmessage = ZMQCauldronMessage.parse(dsocket.recv_multipart())
+    dmessage.dispatcher = dispatcher_name
+    dsocket.send_multipart(dmessage.response("response").data)
+    broker.respond()
+    assert csocket.poll(timeout) != 0, "No client messages were ready"
+    csocket.recv_multipart()
+    
+    csocket.send_multipart(stats.data)
+    broker.respond()
+    assert csocket.poll(timeout) != 0, "No messages were ready!"
+    after = json.loads(ZMQCauldronMessage.parse(csocket.recv_multipart()).payload)
+    
+    service = after['services'][servicename.upper()]
+    assert service['clients'] == 1
+    assert service['fans'] == []
+    assert service['messages'] - before['services'][servicename.upper()]['messages'] == 1
+    assert service['pending'] == 0
+    dstats = service['dispatchers'][dispatcher_name]
+    dbefore = before['services'][servicename.upper()]['dispatchers'][dispatcher_name]
+    assert dstats['messages'] - dbefore['messages'] == 1
+    assert dstats['replies'] - dbefore['replies'] == 1
+    assert dstats['pending'] == 0
+    assert dstats['ready']
+    assert dstats['latency'] > 0.0
+    
+    table = format_stats(before, after)
+    assert servicename.upper() in table
+    assert "  {0}".format(dispatcher_name) in table
+    
+def test_client_broker_stats_phantom(broker, csocket, message, servicename, timeout):
+    """Test that stats queries don't register a service or a client."""
+    import json
+    stats = message.copy()
+    stats.direction = "CBQ"
+    stats.command = "stats"
+    stats.service = "cauldron"
+    
+    for i in range(2):
+        csocket.send_multipart(stats.data)
+        broker.respond()
+        assert csocket.poll(timeout) != 0, "No messages were ready!"
+        response = json.loads(ZMQCauldronMessage.parse(csocket.recv_multipart()).payload)
+    assert "CAULDRON" not in response['services']
+    assert "CAULDRON" not in broker.services
+    service = response['services'].get(servicename.upper())
+    assert service is None or service['clients'] == 0
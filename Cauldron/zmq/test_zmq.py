@@ -123,4 +123,80 @@ def test_thread_bad():
     assert str(excinfo.value).endswith("from ValueError('This thread is bad!',)")
     assert t.finished.is_set()
     with pytest.raises(ZMQThreadError):
-        t.check(timeout=0.1)
\ No newline at end of file
+        t.check(timeout=0.1)
+def test_trace_frame():
+    """Test that a trace frame survives parsing, and isn't mistaken for an identifier."""
+    from .protocol import ZMQCauldronMessage
+    from .trace import MessageTrace, stamp_frames
+    message = ZMQCauldronMessage("modify", service="SERVICE", keyword="KEYWORD", payload="1")
+    message.prefix = [b"\x00\x01", b""]
+    assert ZMQCauldronMessage.parse(message.data).trace is None
+    
+    message.trace = MessageTrace()
+    message.trace.stamp('client_create')
+    frames = stamp_frames(message.data, 'pool_recv')
+    parsed = ZMQCauldronMessage.parse(frames)
+    assert parsed.prefix == message.prefix
+    assert parsed.identifier == message.identifier
+    assert set(parsed.trace.stamps) == set(['client_create', 'pool_recv'])
+    assert not MessageTrace.is_frame(message.identifier)
+
+def test_latency_histogram():
+    """Test summarizing latency breakdowns."""
+    from .trace import LatencyHistogram
+    histogram = LatencyHistogram()
+    for i in range(1, 101):
+        histogram.add({'total' : i * 1e-3, 'handler' : 1e-3})
+    summary = histogram.summary()
+    assert histogram.traces == 100
+    assert set(summary) == set(['total', 'handler'])
+    assert summary['total']['count'] == 100
+    assert summary['total']['max'] == pytest.approx(0.1)
+    assert summary['total']['p50'] == pytest.approx(0.05, rel=0.15)
+    assert summary['total']['p99'] == pytest.approx(0.099, rel=0.15)
+    assert summary['handler']['p50'] == pytest.approx(1e-3)
+
+def test_trace(request, broker, backend, config, servicename):
+    """Test tracing requests through the broker and dispatcher."""
+    config.set("zmq", "trace", "1.0")
+    request.addfinalizer(lambda : config.set("zmq", "trace", "0.0"))
+    
+    from Cauldron import DFW, ktl
+    svc = DFW.Service(servicename, config=config)
+    request.addfinalizer(svc.shutdown)
+    svc["KEYWORD"].modify("1")
+    client = ktl.Service(servicename)
+    request.addfinalizer(client.shutdown)
+    
+    task = client["KEYWORD"].write("2", wait=False)
+    task.wait()
+    assert set(task.trace) == set(['client_queue', 'broker', 'pool_wait', 'lock_wait', 'handler', 'transit', 'callback', 'total'])
+    assert all(value >= 0.0 for key, value in task.trace.items() if key != 'transit')
+    assert task.trace['total'] >= task.trace['handler']
+    
+    client["KEYWORD"].read()
+    summary = client.latency.summary()
+    assert summary['total']['count'] >= 2
+    assert summary['lock_wait']['count'] >= 2
+
+def test_units_error(broker, backend, config, servicename):
+    """Test that an error fetching enumerators is raised, rather than waited on forever."""
+    from Cauldron import DFW, ktl
+    from Cauldron.exc import DispatcherError
+    
+    class BrokenEnumerated(DFW.Keyword.types['enumerated']):
+        def _get_units(self):
+            raise ValueError("No enumerators.")
+    
+    def setup(service):
+        """Setup function."""
+        BrokenEnumerated("KEYWORD", service)
+    
+    svc = DFW.Service(servicename, config=config, setup=setup)
+    client = ktl.Service(servicename)
+    try:
+        with pytest.raises(DispatcherError):
+            client["KEYWORD"]
+    finally:
+        client.shutdown()
+        svc.shutdown()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+A live, top-style view of a running ZMQ broker, installed as ``cauldron-broker-top``.
+
+The console polls the broker with the ``stats`` client-broker query, which the broker answers from the objects it already keeps for each service, dispatcher and client. The query doesn't register a service or a client, so polling doesn't show up in the stats. Rates and latencies are found from the difference between two polls, so the broker does no extra work between polls.
+"""
+from __future__ import absolute_import, division, print_function
+
+import sys
+import json
+import time
+import logging
+
+from ..config import read_configuration
+from ..exc import DispatcherError
+from .protocol import ZMQCauldronMessage
+from .common import zmq_connect_socket
+
+__all__ = ['BrokerStats', 'summarize', 'format_stats', 'main']
+
+CLEAR = "\x1b[H\x1b[2J"
+
+HEADER = "{0:<24s} {1:>6s} {2:>7s} {3:>9s} {4:>9s} {5:>8s} {6:>6s} {7:>8s} {8:>5s} {9:>8s} {10:>8s}".format(
+    "SERVICE/DISPATCHER", "KWDS", "CLIENTS", "REQ/s", "REP/s", "LAT ms", "PEND", "OLDEST", "FANS", "EXPIRES", "LIFE")
+
+class BrokerStats(object):
+    """Query a broker for its ``stats``."""
+
+    def __init__(self, config=None, service=None, timeout=2.0, ctx=None, address=None):
+        super(BrokerStats, self).__init__()
+        import zmq
+        self.config = read_configuration(config)
+        self.service = service or self.config.get("metrics", "service")
+        self.timeout = timeout
+        self.address = address
+        self.ctx = ctx or zmq.Context.instance()
+        self.log = logging.getLogger(__name__ + ".BrokerStats")
+        self.socket = None
+
+    def connect(self):
+        """Connect a new REQ socket to the broker."""
+        import zmq
+        self.socket = self.ctx.socket(zmq.REQ)
+        zmq_connect_socket(self.socket, self.config, "broker", log=self.log, label="broker-top", address=self.address)
+
+    def close(self):
+        """Close the socket."""
+        if self.socket is not None:
+            self.socket.close(linger=0)
+            self.socket = None
+
+    def __call__(self):
+        """Return the broker's stats, or None if the broker didn't respond in time."""
+        if self.socket is None:
+            self.connect()
+        message = ZMQCauldronMessage(command="stats", direction="CBQ", service=self.service)
+        self.socket.send_multipart(message.data)
+        if not self.socket.poll(self.timeout * 1e3):
+            # A REQ socket can't send again until it has a reply, so start over.
+            self.close()
+            return None
+        response = ZMQCauldronMessage.parse(self.socket.recv_multipart())
+        if response.iserror:
+            raise DispatcherError("Broker stats query failed: {0}".format(response.payload))
+        return json.loads(response.payload)
+
+
+def _delta(previous, current, key):
+    """The change in a counter, where a counter smaller than before has been reset."""
+    if previous is None or current[key] < previous.get(key, 0):
+        return current[key]
+    return current[key] - previous.get(key, 0)
+
+def _row(name, previous, current, elapsed):
+    """Rates and latency for one service or dispatcher."""
+    messages = _delta(previous, current, 'messages')
+    replies = _delta(previous, current, 'replies')
+    latency = _delta(previous, current, 'latency')
+    return {'name' : name, 'keywords' : current['keywords'],
+        'requests' : (messages / elapsed) if elapsed else None, 'replies' : (replies / elapsed) if elapsed else None,
+        'latency' : (1e3 * latency / replies) if replies else None,
+        'pending' : current['pending'], 'oldest' : current['oldest']}
+
+def summarize(previous, current):
+    """Rows of rates and latencies for each service and dispatcher, between two ``stats`` responses."""
+    elapsed = (current['time'] - previous['time']) if previous is not None else 0.0
+    previous_services = previous['services'] if previous is not None else {}
+    rows = []
+    for name, service in sorted(current['services'].items()):
+        row = _row(name, previous_services.get(name), service, elapsed)
+        row['clients'] = service['clients']
+        row['fans'] = len(service['fans'])
+        row['expires'] = min([fan['expires'] for fan in service['fans']] or [None])
+        row['dispatchers'] = []
+        previous_dispatchers = previous_services.get(name, {}).get('dispatchers', {})
+        for dname, dispatcher in sorted(service['dispatchers'].items()):
+            drow = _row(dname, previous_dispatchers.get(dname), dispatcher, elapsed)
+            drow['ready'] = dispatcher['ready']
+            drow['lifetime'] = dispatcher['lifetime']
+            row['dispatchers'].append(drow)
+        rows.append(row)
+    return rows
+
+def _number(value, spec):
+    """Format a value which may be missing."""
+    return "-" if value is None else format(value, spec)
+
+def _line(row, name, clients="", fans="", expires=None, lifetime=None):
+    """Format one row."""
+    return "{0:<24s} {1:>6d} {2:>7s} {3:>9s} {4:>9s} {5:>8s} {6:>6d} {7:>8s} {8:>5s} {9:>8s} {10:>8s}".format(
+        name[:24], row['keywords'], clients, _number(row['requests'], ".1f"), _number(row['replies'], ".1f"),
+        _number(row['latency'], ".2f"), row['pending'], _number(row['oldest'] or None, ".2f"),
+        fans, _number(expires, ".2f"), _number(lifetime, ".1f"))
+
+def format_stats(previous, current):
+    """Format a top-style table of the broker between two ``stats`` responses."""
+    rows = summarize(previous, current)
+    uptime = int(current['uptime'])
+    lines = ["Broker '{0}' up {1:d}:{2:02d}:{3:02d}, timeout {4:.1f}s, {5:d} service(s)".format(
+        current['name'], uptime // 3600, (uptime // 60) % 60, uptime % 60, current['timeout'], len(rows)), "", HEADER]
+    for row in rows:
+        lines.append(_line(row, row['name'], str(row['clients']), str(row['fans']), row['expires']))
+        for drow in row['dispatchers']:
+            name = "  {0}{1}".format(drow['name'], "" if drow['ready'] else "*")
+            lines.append(_line(drow, name, lifetime=drow['lifetime']))
+    return "\n".join(lines)
+
+def main():
+    """Watch a ZMQ broker from the command line."""
+    import argparse, six
+    parser = argparse.ArgumentParser(description="A live view of the services and dispatchers connected to a ZMQ broker.")
+    parser.add_argument("-c", "--config", type=six.text_type, help="set the Cauldron-zmq configuration filename", default=None)
+    parser.add_argument("-s", "--service", type=six.text_type, help="the service name used to query the broker (default: the metrics service)", default=None)
+    parser.add_argument("-i", "--interval", type=float, help="seconds between updates", default=1.0)
+    parser.add_argument("-t", "--timeout", type=float, help="seconds to wait for the broker", default=2.0)
+    parser.add_argument("-n", "--once", action="store_true", help="print the broker's state once and exit")
+    parser.add_argument("--json", action="store_true", help="print each summary as a line of JSON")
+    opt = parser.parse_args()
+
+    query = BrokerStats(opt.config, service=opt.service, timeout=opt.timeout)
+    previous = None
+    try:
+        while True:
+            current = query()
+            if current is None:
+                print("No response from the broker after {0:.1f}s.".format(opt.timeout), file=sys.stderr)
+                if opt.once:
+                    return 1
+            elif previous is None and opt.once:
+                # Rates need a second sample.
+                previous = current
+                time.sleep(opt.interval)
+                continue
+            elif opt.json:
+                print(json.dumps({'time' : current['time'], 'services' : summarize(previous, current)}, sort_keys=True))
+            else:
+                if not opt.once and sys.stdout.isatty():
+                    sys.stdout.write(CLEAR)
+                print(format_stats(previous, current))
+            sys.stdout.flush()
+            if opt.once:
+                return 0
+            previous = current or previous
+            time.sleep(opt.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        query.close()
+    return 0
+
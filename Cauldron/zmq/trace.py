@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Latency tracing for requests made through the ZMQ broker.
+
+A traced request carries an extra frame after the message identifier. Each hop (the client task queue, the broker, the dispatcher's worker pool and the worker itself) stamps the frame with the time at which it handled the message. When the response arrives, the client converts the stamps into a breakdown of where the request spent its time, and adds it to a :class:`LatencyHistogram`.
+
+Durations are only computed between stamps made in the same process, so the breakdown doesn't depend on clocks agreeing between hosts. Time spent on the wire and in socket queues is reported as ``transit``.
+"""
+from __future__ import absolute_import, division
+
+import time
+import struct
+import bisect
+import threading
+
+import six
+
+__all__ = ['MessageTrace', 'LatencyHistogram', 'STAMPS', 'SEGMENTS', 'stamp_frames']
+
+clock = getattr(time, 'monotonic', time.time)
+
+TRACEHEADER = six.binary_type(b"\x03TRC")
+
+_STAMP = struct.Struct("<Bd")
+
+STAMPS = ('client_create', 'client_send', 'broker_recv', 'broker_send', 'pool_recv', 'worker_recv',
+    'lock_request', 'lock_acquired', 'handler_done', 'worker_send', 'broker_reply_recv',
+    'broker_reply_send', 'client_recv', 'client_done')
+"""Names of the points at which a traced request is stamped, in the order they happen."""
+
+_CODES = dict((name, code) for code, name in enumerate(STAMPS))
+
+SEGMENTS = ('client_queue', 'broker', 'pool_wait', 'lock_wait', 'handler', 'transit', 'callback', 'total')
+"""Names of the segments of a latency breakdown."""
+
+def _is_trace_frame(frame):
+    """Is this frame a trace frame?
+
+    Message identifiers are 16 bytes long, which is never the length of a trace frame.
+    """
+    return frame[:len(TRACEHEADER)] == TRACEHEADER and (len(frame) - len(TRACEHEADER)) % _STAMP.size == 0
+
+def stamp_frames(frames, name):
+    """Stamp the trace frame of a message which hasn't been parsed, if it is traced."""
+    if frames and _is_trace_frame(frames[-1]):
+        frames[-1] += _STAMP.pack(_CODES[name], clock())
+    return frames
+
+class MessageTrace(object):
+    """The times at which a traced message was handled at each hop."""
+
+    __slots__ = ('stamps',)
+
+    def __init__(self, stamps=None):
+        super(MessageTrace, self).__init__()
+        self.stamps = dict(stamps or {})
+
+    def __repr__(self):
+        return "<{0} stamps={1:d}>".format(self.__class__.__name__, len(self.stamps))
+
+    def stamp(self, name):
+        """Record the current time for a stamp."""
+        self.stamps[name] = clock()
+
+    def encode(self):
+        """Encode this trace as a message frame."""
+        return TRACEHEADER + b"".join(_STAMP.pack(_CODES[name], value) for name, value in self.stamps.items())
+
+    @classmethod
+    def decode(cls, frame):
+        """Decode a trace from a message frame."""
+        stamps = {}
+        for offset in range(len(TRACEHEADER), len(frame), _STAMP.size):
+            code, value = _STAMP.unpack_from(frame, offset)
+            stamps[STAMPS[code]] = value
+        return cls(stamps)
+
+    @classmethod
+    def is_frame(cls, frame):
+        """Is this frame a trace frame?"""
+        return _is_trace_frame(frame)
+
+    def _interval(self, start, end):
+        """The time between two stamps, or None if either is missing."""
+        try:
+            return self.stamps[end] - self.stamps[start]
+        except KeyError:
+            return None
+
+    def breakdown(self):
+        """The time spent in each segment of the request, in seconds.
+
+        Segments which weren't stamped at both ends are left out.
+        """
+        segments = {}
+        segments['client_queue'] = self._interval('client_create', 'client_send')
+        outbound = self._interval('broker_recv', 'broker_send')
+        inbound = self._interval('broker_reply_recv', 'broker_reply_send')
+        if outbound is not None or inbound is not None:
+            segments['broker'] = (outbound or 0.0) + (inbound or 0.0)
+        segments['pool_wait'] = self._interval('pool_recv', 'worker_recv')
+        segments['lock_wait'] = self._interval('lock_request', 'lock_acquired')
+        handler = self._interval('worker_recv', 'handler_done')
+        if handler is not None:
+            segments['handler'] = handler - (segments['lock_wait'] or 0.0)
+        roundtrip = self._interval('client_send', 'client_recv')
+        dispatcher = self._interval('pool_recv', 'worker_send')
+        if roundtrip is not None and dispatcher is not None:
+            segments['transit'] = roundtrip - (segments.get('broker') or 0.0) - dispatcher
+        segments['callback'] = self._interval('client_recv', 'client_done')
+        segments['total'] = self._interval('client_create', 'client_done')
+        return dict((key, value) for key, value in segments.items() if value is not None)
+
+
+class LatencyHistogram(object):
+    """Log-spaced histograms of the latency breakdowns of traced requests.
+
+    Bins span 1 microsecond to 100 seconds, with 20 bins per decade, so percentiles are accurate to about 12%.
+    """
+
+    LOWEST = 1e-6
+    DECADES = 8
+    BINS_PER_DECADE = 20
+
+    def __init__(self):
+        super(LatencyHistogram, self).__init__()
+        self._edges = [self.LOWEST * 10 ** (i / self.BINS_PER_DECADE) for i in range(self.DECADES * self.BINS_PER_DECADE + 1)]
+        self._lock = threading.Lock()
+        self.clear()
+
+    def __repr__(self):
+        return "<{0} traces={1:d}>".format(self.__class__.__name__, self.traces)
+
+    def clear(self):
+        """Forget every breakdown."""
+        with self._lock:
+            self.traces = 0
+            self._counts = {}
+            self._totals = {}
+            self._maxima = {}
+
+    def add(self, breakdown):
+        """Add the breakdown of one request."""
+        with self._lock:
+            self.traces += 1
+            for segment, duration in breakdown.items():
+                try:
+                    counts = self._counts[segment]
+                except KeyError:
+                    counts = self._counts[segment] = [0] * (len(self._edges) + 1)
+                    self._totals[segment] = 0.0
+                    self._maxima[segment] = duration
+                counts[bisect.bisect_right(self._edges, duration)] += 1
+                self._totals[segment] += duration
+                self._maxima[segment] = max(self._maxima[segment], duration)
+
+    def count(self, segment):
+        """The number of breakdowns which included a segment."""
+        return sum(self._counts.get(segment, ()))
+
+    def percentile(self, segment, q):
+        """The `q`-th percentile of the time spent in a segment, in seconds.
+
+        The result is the upper edge of the bin holding the percentile, or the largest recorded time if that is smaller.
+        """
+        with self._lock:
+            counts = self._counts.get(segment)
+            if not counts:
+                return None
+            target = sum(counts) * q / 100.0
+            total = 0
+            for index, count in enumerate(counts):
+                total += count
+                if count and total >= target:
+                    break
+            edge = self._edges[index] if index < len(self._edges) else self._maxima[segment]
+            return min(edge, self._maxima[segment])
+
+    def summary(self):
+        """Summarize each segment, with its count, mean, maximum and 50th, 90th and 99th percentiles."""
+        summary = {}
+        for segment in SEGMENTS:
+            count = self.count(segment)
+            if not count:
+                continue
+            summary[segment] = {
+                'count' : count,
+                'mean' : self._totals[segment] / count,
+                'p50' : self.percentile(segment, 50),
+                'p90' : self.percentile(segment, 90),
+                'p99' : self.percentile(segment, 99),
+                'max' : self._maxima[segment],
+            }
+        return summary
+
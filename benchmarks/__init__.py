@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+"""
+Performance benchmarks for Cauldron, run with `asv <https://asv.readthedocs.io/>`_::
+
+    $ asv run
+
+The :mod:`roundtrip`, :mod:`broadcast`, :mod:`populate`, :mod:`startup` and :mod:`scheduler` benchmarks compare every backend listed in :data:`backends.BACKENDS`. Backends which aren't available (``zmq`` without pyzmq, or ``redis`` without a running redis-server) are skipped.
+
+asv stores results as JSON in ``.asv/results``, one file per commit and machine, so regressions can be tracked over time::
+
+    $ asv continuous master HEAD    # Benchmark two commits, and report changes of more than 10%.
+    $ asv compare master HEAD       # Compare stored results.
+    $ asv publish                   # Build an HTML history of the stored results.
+
+Each benchmark module can also be imported and run directly, which is useful when profiling.
+"""
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Backends which are compared by the cross-backend benchmarks, and how to start them.
+"""
+
+import socket
+
+from Cauldron.api import use, teardown
+from Cauldron.test_helpers import setup_entry_points_api
+
+BACKENDS = ['local', 'mock', 'shm', 'zmq-inproc', 'zmq-tcp', 'redis']
+"""Backends compared by the benchmarks. The ZMQ backend is run with its broker on inproc and TCP sockets."""
+
+def _free_port():
+    """A free TCP port on localhost."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+    finally:
+        s.close()
+
+class Deployment(object):
+    """A backend, with its broker where it needs one.
+
+    :meth:`start` raises :exc:`NotImplementedError` when the backend isn't available, which asv reports as a skipped benchmark.
+    """
+
+    def __init__(self, name):
+        super(Deployment, self).__init__()
+        self.name = name
+        self.backend = name.split("-")[0]
+        self.broker = None
+
+    def _check(self):
+        """Check that this backend is available."""
+        if self.backend == 'zmq':
+            try:
+                import zmq
+            except ImportError:
+                raise NotImplementedError("The ZMQ backend is not available.")
+        elif self.backend == 'redis':
+            try:
+                from Cauldron.redis.common import check_redis, get_global_connection_pool
+                check_redis().StrictRedis(connection_pool=get_global_connection_pool()).ping()
+            except Exception:
+                raise NotImplementedError("The REDIS backend is not available.")
+
+    def start(self):
+        """Use this backend, and start its broker."""
+        self._check()
+        setup_entry_points_api()
+        from Cauldron.config import get_configuration
+        config = get_configuration()
+        if self.name == 'zmq-tcp':
+            for name in ("broker", "publish", "subscribe"):
+                config.set("zmq", name, "tcp://127.0.0.1:{0:d}".format(_free_port()))
+        elif self.name == 'zmq-inproc':
+            for name in ("broker", "publish", "subscribe"):
+                config.set("zmq", name, "inproc://{0}".format(name))
+        use(self.backend)
+        if self.backend == 'zmq':
+            from Cauldron.zmq.broker import ZMQBroker
+            self.broker = ZMQBroker.thread(config)
+            self.broker.running.wait(2.0)
+        return config
+
+    def stop(self):
+        """Tear down this backend, and stop its broker."""
+        teardown()
+        if self.broker is not None:
+            self.broker.stop()
+            self.broker = None
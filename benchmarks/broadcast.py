@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for broadcasting keyword changes to many monitoring clients, on every backend.
+"""
+
+import threading
+
+from .backends import BACKENDS, Deployment
+
+class Monitors(object):
+    """Count the broadcasts received by many monitoring clients."""
+
+    def __init__(self, expected):
+        super(Monitors, self).__init__()
+        self.expected = expected
+        self.received = 0
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Wait for the next broadcast."""
+        with self._lock:
+            self.received = 0
+            self.done.clear()
+
+    def __call__(self, keyword):
+        with self._lock:
+            self.received += 1
+            if self.received >= self.expected:
+                self.done.set()
+
+class BroadcastFanout(object):
+    """Time from a dispatcher setting a keyword until every monitoring client has received it."""
+
+    params = (BACKENDS, [1, 10, 50])
+    param_names = ['backend', 'monitors']
+    timeout = 120
+
+    def setup(self, backend, monitors):
+        self.deployment = Deployment(backend)
+        self.deployment.start()
+        from Cauldron import DFW, ktl
+        self.dispatcher = DFW.Service("benchbroadcast", config=None)
+        self.keyword = self.dispatcher["KEYWORD"]
+        self.keyword.modify("0")
+        self.monitors = Monitors(monitors)
+        self.clients = [ktl.Service("benchbroadcast") for i in range(monitors)]
+        for client in self.clients:
+            client["KEYWORD"].monitor()
+            client["KEYWORD"].callback(self.monitors.__call__)
+        self.values = ["0", "1"]
+
+    def teardown(self, backend, monitors):
+        for client in self.clients:
+            client.shutdown()
+        self.dispatcher.shutdown()
+        self.deployment.stop()
+
+    def time_fanout(self, backend, monitors):
+        self.monitors.reset()
+        self.values.reverse()
+        self.keyword.set(self.values[0])
+        if not self.monitors.done.wait(10.0):
+            raise RuntimeError("Only {0:d} of {1:d} monitors received the broadcast.".format(self.monitors.received, monitors))
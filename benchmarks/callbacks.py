@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for dispatching keyword callbacks to many subscribers.
+"""
+
+import timeit
+
+from Cauldron.api import use, teardown
+from Cauldron.test_helpers import setup_entry_points_api
+
+class Subscriber(object):
+    """A callback target, like a GUI widget which watches a keyword."""
+
+    def __init__(self):
+        super(Subscriber, self).__init__()
+        self.count = 0
+
+    def __call__(self, keyword):
+        self.count += 1
+
+class KeywordCallbacks(object):
+    """Time callback dispatch on a dispatcher keyword with bound method subscribers."""
+
+    params = [1, 10, 50]
+    param_names = ['subscribers']
+    number = 1000
+
+    def setup(self, subscribers):
+        setup_entry_points_api()
+        use('local')
+        from Cauldron import DFW
+        self.dispatcher = DFW.Service("benchcallbacks", config=None)
+        self.keyword = self.dispatcher["KEYWORD"]
+        self.subscribers = [Subscriber() for i in range(subscribers)]
+        for subscriber in self.subscribers:
+            self.keyword.callback(subscriber.__call__)
+        self.values = ["0", "1"]
+
+    def teardown(self, subscribers):
+        self.dispatcher.shutdown()
+        teardown()
+
+    def time_propogate(self, subscribers):
+        self.keyword._propogate()
+
+    def time_set(self, subscribers):
+        self.values.reverse()
+        self.keyword.set(self.values[0])
+
+    def time_contains(self, subscribers):
+        self.subscribers[-1].__call__ in self.keyword._callbacks
+
+    def track_callbacks_per_second(self, subscribers):
+        duration = timeit.timeit(self.keyword._propogate, number=self.number)
+        return subscribers * self.number / duration
+    track_callbacks_per_second.unit = "callbacks/s"
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for recording and querying keyword history.
+"""
+
+from Cauldron.base.history import KeywordHistory
+
+class KeywordHistoryBuffer(object):
+    """Time appending to and summarizing a full numeric keyword history."""
+
+    params = [100, 1000, 10000]
+    param_names = ['size']
+
+    def setup(self, size):
+        self.history = KeywordHistory(size, 'double', name='KEYWORD')
+        for i in range(size):
+            self.history.append(1000.0 + i, str(float(i)), float(i))
+        self.start = 1000.0 + size // 4
+        self.end = 1000.0 + 3 * size // 4
+        self.now = 1000.0 + size
+
+    def time_append(self, size):
+        self.now += 1.0
+        self.history.append(self.now, "1.5", 1.5)
+
+    def time_append_ascii(self, size):
+        self.now += 1.0
+        self.history.append(self.now, "1.5")
+
+    def time_window_mean(self, size):
+        self.history.window(self.start, self.end).mean()
+
+    def time_downsample(self, size):
+        self.history.window().downsample(10.0, 'max')
+
+    def time_iterate(self, size):
+        for entry in self.history:
+            pass
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for loading KTL XML, for a service with many keywords split between several dispatchers.
+"""
+
+import os
+import shutil
+import tempfile
+import itertools
+
+from Cauldron.api import use, teardown
+from Cauldron.test_helpers import setup_entry_points_api
+
+def write_service_xml(directory, service, keywords, dispatchers, bundles):
+    """Write KTL XML for a service with `keywords` keywords, spread across `bundles` bundle files and `dispatchers` dispatchers."""
+    files = "".join("<file><location>bundle{0:d}.xml</location></file>".format(i) for i in range(bundles))
+    with open(os.path.join(directory, "index.xml"), 'w') as f:
+        f.write('<?xml version="1.0"?>\n<index service="{0}"><files>{1}</files></index>\n'.format(service, files))
+    names = iter(range(keywords))
+    for i in range(bundles):
+        with open(os.path.join(directory, "bundle{0:d}.xml".format(i)), 'w') as f:
+            f.write('<?xml version="1.0"?>\n<bundle name="BUNDLE{0:d}" service="{1}">\n'.format(i, service))
+            f.write('<dispatcher><name>dispatcher{0:d}</name></dispatcher>\n'.format(i % dispatchers))
+            for n in itertools.islice(names, keywords // bundles):
+                f.write('<keyword><name>KEYWORD{0:d}</name><type>enumerated</type><units>steps</units>'
+                        '<values><entry><key>0</key><value>Off</value></entry><entry><key>1</key><value>On</value></entry></values>'
+                        '<serverside><initialize><value>Off</value></initialize></serverside></keyword>\n'.format(n))
+            f.write('</bundle>\n')
+
+class _ServiceXML(object):
+    """A service with 10,000 keywords in 20 bundle files, split between 4 dispatchers."""
+
+    service = "benchxml"
+    keywords = 10000
+    dispatchers = 4
+    bundles = 20
+    timeout = 120
+
+    def setup(self, *args):
+        self.reldir = tempfile.mkdtemp()
+        self.directory = os.path.join(self.reldir, "data", self.service)
+        os.makedirs(self.directory)
+        write_service_xml(self.directory, self.service, self.keywords, self.dispatchers, self.bundles)
+        self._reldir = os.environ.get('RELDIR')
+        os.environ['RELDIR'] = self.reldir
+
+    def teardown(self, *args):
+        if self._reldir is None:
+            os.environ.pop('RELDIR', None)
+        else:
+            os.environ['RELDIR'] = self._reldir
+        shutil.rmtree(self.reldir)
+
+class IndexLoad(_ServiceXML):
+    """Time to load the KTL XML index."""
+
+    def setup(self):
+        super(IndexLoad, self).setup()
+        from Cauldron.base.xmlindex import load_index
+        load_index(self.service)
+
+    def time_compile(self):
+        from Cauldron.base.xmlindex import load_index
+        load_index(self.service, cache=False)
+
+    def time_cached(self):
+        from Cauldron.base.xmlindex import load_index
+        load_index(self.service)
+
+    def peakmem_compile(self):
+        from Cauldron.base.xmlindex import load_index
+        load_index(self.service, cache=False)
+
+class DispatcherStartup(_ServiceXML):
+    """Time to start one dispatcher, with every orphaned keyword in its share of the XML set up."""
+
+    params = ['yes', 'no']
+    param_names = ['xmlcache']
+
+    def setup(self, xmlcache):
+        super(DispatcherStartup, self).setup()
+        setup_entry_points_api()
+        use('local')
+        from Cauldron.config import get_configuration
+        get_configuration().set("core", "xmlcache", xmlcache)
+        from Cauldron.base.xmlindex import load_index
+        load_index(self.service)
+
+    def teardown(self, xmlcache):
+        teardown()
+        super(DispatcherStartup, self).teardown()
+
+    def time_start(self, xmlcache):
+        from Cauldron import DFW
+        service = DFW.Service(self.service, config=None, dispatcher="dispatcher0")
+        service.shutdown()
+
+class ParallelCompile(_ServiceXML):
+    """Time to compile the KTL XML index from 4 large bundle files, serially, with threads, or with threads and processes."""
+
+    keywords = 20000
+    bundles = 4
+    params = ['serial', 'threads', 'processes']
+    param_names = ['workers']
+    workers = {'serial' : (1, 0), 'threads' : (8, 0), 'processes' : (8, 4)}
+
+    def time_compile(self, workers):
+        from Cauldron.base.xmlindex import compile_index
+        threads, processes = self.workers[workers]
+        compile_index(self.service, threads=threads, processes=processes)
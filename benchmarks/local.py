@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for blocking client operations on the local backend, inline and queued.
+"""
+
+from Cauldron.api import use, teardown
+from Cauldron.test_helpers import setup_entry_points_api
+
+class ClientRoundTrip(object):
+    """Time blocking reads and writes from a local client."""
+    
+    params = ['yes', 'no']
+    param_names = ['inline']
+    number = 1000
+    
+    def setup(self, inline):
+        setup_entry_points_api()
+        use('local')
+        from Cauldron.config import get_configuration
+        get_configuration().set("local", "inline", inline)
+        from Cauldron import DFW, ktl
+        self.dispatcher = DFW.Service("benchlocal", config=None)
+        self.dispatcher["KEYWORD"].modify("0")
+        self.client = ktl.Service("benchlocal")
+        self.keyword = self.client["KEYWORD"]
+        self.values = ["0", "1"]
+        
+    def teardown(self, inline):
+        self.client.shutdown()
+        self.dispatcher.shutdown()
+        teardown()
+        
+    def time_read(self, inline):
+        self.keyword.read()
+        
+    def time_write(self, inline):
+        self.values.reverse()
+        self.keyword.write(self.values[0])
+        
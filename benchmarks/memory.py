@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the memory used by dispatcher keywords.
+
+Memory is the allocation made while keywords are created, traced with :mod:`tracemalloc` where it is available. Otherwise, it is the size of each keyword, its attributes, and the values they hold.
+"""
+
+import sys
+import gc
+import itertools
+
+from Cauldron.api import use, teardown
+from Cauldron.test_helpers import setup_entry_points_api
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+def _instance_dict(obj):
+    """An object's ``__dict__``, or None if it hasn't been created. Reading ``obj.__dict__`` would create it."""
+    slots = [ getattr(obj, name) for cls in type(obj).__mro__ for name in getattr(cls, '__slots__', ())
+        if name not in ('__dict__', '__weakref__') and hasattr(obj, name) ]
+    for ref in gc.get_referents(obj):
+        if type(ref) is dict and not any(ref is value for value in slots):
+            return ref
+    return None
+
+def _slot_values(obj):
+    """The values held in an object's ``__dict__`` and ``__slots__``."""
+    values = list((_instance_dict(obj) or {}).values())
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, '__slots__', ()):
+            if name not in ('__dict__', '__weakref__') and hasattr(obj, name):
+                values.append(getattr(obj, name))
+    return values
+
+def keyword_size(keyword):
+    """The size of a keyword, its attributes, and the values they hold, in bytes.
+    
+    Helpers which keep their own attributes in slots, like the keyword history, include the values they hold.
+    """
+    values = _slot_values(keyword)
+    size = sys.getsizeof(keyword) + sum(sys.getsizeof(value) for value in values)
+    instance_dict = _instance_dict(keyword)
+    if instance_dict is not None:
+        size += sys.getsizeof(instance_dict)
+    for value in values:
+        if getattr(type(value), '__slots__', None):
+            size += sum(sys.getsizeof(item) for item in _slot_values(value))
+    return size
+
+class KeywordMemory(object):
+    """Memory used by each dispatcher keyword, for a service with many keywords.
+    
+    Keywords are measured just after they are created, and again after their first value is set, which allocates their history buffers.
+    """
+    
+    params = ['local', 'mock']
+    param_names = ['backend']
+    keywords = 50000
+    timeout = 120
+    
+    def setup(self, backend):
+        setup_entry_points_api()
+        use(backend)
+        self.counter = itertools.count()
+        
+    def teardown(self, backend):
+        teardown()
+    
+    def _bytes_per_keyword(self, set_value):
+        """Create many keywords, optionally setting each one, and return the memory used by each keyword."""
+        from Cauldron import DFW
+        service = DFW.Service("benchmemory{0:d}".format(next(self.counter)), config=None)
+        gc.collect()
+        if tracemalloc is not None:
+            tracing = tracemalloc.is_tracing()
+            if not tracing:
+                tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+        keywords = [ DFW.Keyword.Integer("KEYWORD{0:d}".format(i), service, initial="0") for i in range(self.keywords) ]
+        if set_value:
+            for keyword in keywords:
+                keyword.set("1")
+        gc.collect()
+        if tracemalloc is not None:
+            # The list which holds the keywords here isn't part of their cost.
+            used = tracemalloc.get_traced_memory()[0] - before - sys.getsizeof(keywords)
+            if not tracing:
+                tracemalloc.stop()
+        else:
+            used = sum(keyword_size(keyword) for keyword in keywords)
+        service.shutdown()
+        return used / float(self.keywords)
+        
+    def track_bytes_per_keyword(self, backend):
+        return self._bytes_per_keyword(False)
+    track_bytes_per_keyword.unit = "bytes"
+    
+    def track_bytes_per_keyword_set(self, backend):
+        return self._bytes_per_keyword(True)
+    track_bytes_per_keyword_set.unit = "bytes"
+    
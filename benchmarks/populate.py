@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for enumerating and populating the keywords of a service from a client, on every backend.
+"""
+
+from .backends import BACKENDS, Deployment
+
+class ClientPopulate(object):
+    """Time to list a service's keywords, and to create a client with every keyword populated."""
+
+    params = (BACKENDS, [100, 1000])
+    param_names = ['backend', 'keywords']
+    timeout = 120
+
+    def setup(self, backend, keywords):
+        self.deployment = Deployment(backend)
+        self.deployment.start()
+        from Cauldron import DFW, ktl
+        def setup(service):
+            for i in range(keywords):
+                DFW.Keyword.Integer("KEYWORD{0:d}".format(i), service, initial="0")
+        self.dispatcher = DFW.Service("benchpopulate", config=None, setup=setup)
+        self.client = ktl.Service("benchpopulate")
+
+    def teardown(self, backend, keywords):
+        self.client.shutdown()
+        self.dispatcher.shutdown()
+        self.deployment.stop()
+
+    def time_keywords(self, backend, keywords):
+        self.client.keywords()
+
+    def time_populate(self, backend, keywords):
+        from Cauldron import ktl
+        client = ktl.Service("benchpopulate", populate=True)
+        client.shutdown()
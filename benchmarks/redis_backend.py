@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the REDIS backend, which lives in extras/ and requires a running redis-server.
+"""
+
+from Cauldron.api import use, teardown
+from Cauldron.test_helpers import setup_entry_points_api
+
+class KeywordSet(object):
+    """Time keyword sets in a REDIS dispatcher, which is how many keyword changes per second it can publish."""
+
+    number = 1000
+
+    def setup(self):
+        try:
+            from Cauldron.redis.common import check_redis, get_global_connection_pool
+            check_redis().StrictRedis(connection_pool=get_global_connection_pool()).ping()
+        except Exception:
+            raise NotImplementedError("The REDIS backend is not available.")
+        setup_entry_points_api()
+        use('redis')
+        from Cauldron import DFW
+        self.dispatcher = DFW.Service("benchredis", config=None)
+        self.keyword = self.dispatcher["KEYWORD"]
+        self.values = ["0", "1"]
+
+    def teardown(self):
+        self.dispatcher.shutdown()
+        teardown()
+
+    def time_set(self):
+        self.values.reverse()
+        self.keyword.set(self.values[0])
+
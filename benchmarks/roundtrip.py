@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for client reads and writes, on every backend.
+"""
+
+import time
+
+from .backends import BACKENDS, Deployment
+
+class KeywordRoundTrip(object):
+    """Time blocking reads and writes, and count how many pipelined reads and writes complete each second."""
+
+    params = BACKENDS
+    param_names = ['backend']
+    requests = 200
+    timeout = 120
+
+    def setup(self, backend):
+        self.deployment = Deployment(backend)
+        self.deployment.start()
+        from Cauldron import DFW, ktl
+        self.dispatcher = DFW.Service("benchroundtrip", config=None)
+        self.dispatcher["KEYWORD"].modify("0")
+        self.client = ktl.Service("benchroundtrip")
+        self.keyword = self.client["KEYWORD"]
+        self.values = ["0", "1"]
+
+    def teardown(self, backend):
+        self.client.shutdown()
+        self.dispatcher.shutdown()
+        self.deployment.stop()
+
+    def time_read(self, backend):
+        self.keyword.read()
+
+    def time_write(self, backend):
+        self.values.reverse()
+        self.keyword.write(self.values[0])
+
+    def _pipeline(self, request):
+        """Start many requests without waiting, then wait for all of them, returning requests per second."""
+        start = time.time()
+        tasks = [request(i, False) for i in range(self.requests - 1)]
+        request(self.requests, True)
+        for task in tasks:
+            if task is not None:
+                task.wait()
+        return self.requests / (time.time() - start)
+
+    def track_read_throughput(self, backend):
+        return self._pipeline(lambda i, wait : self.keyword.read(wait=wait))
+    track_read_throughput.unit = "reads/s"
+
+    def track_write_throughput(self, backend):
+        return self._pipeline(lambda i, wait : self.keyword.write(str(i), wait=wait))
+    track_write_throughput.unit = "writes/s"
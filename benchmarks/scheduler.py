@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the accuracy of periodic keyword updates, on backends with a scheduler.
+"""
+
+import time
+
+from .backends import Deployment
+
+class PeriodicUpdates(object):
+    """Measure how far the intervals between periodic keyword updates stray from the requested period."""
+
+    params = (['local', 'shm', 'zmq-inproc'], [0.1, 1.0])
+    param_names = ['backend', 'period']
+    updates = 5
+    timeout = 120
+
+    def setup(self, backend, period):
+        self.deployment = Deployment(backend)
+        self.deployment.start()
+        from Cauldron import DFW
+        times = self.times = []
+        class Timed(DFW.Keyword.Integer):
+            def read(self):
+                times.append(time.time())
+                return "0"
+        self.dispatcher = DFW.Service("benchscheduler", config=None, setup=lambda service : Timed("KEYWORD", service))
+
+    def teardown(self, backend, period):
+        self.dispatcher.shutdown()
+        self.deployment.stop()
+
+    def track_period_error(self, backend, period):
+        del self.times[:]
+        self.dispatcher["KEYWORD"].period(period)
+        deadline = time.time() + period * (self.updates + 5) + 2.0
+        while len(self.times) <= self.updates and time.time() < deadline:
+            time.sleep(period / 10.0)
+        if len(self.times) < 2:
+            raise RuntimeError("Only {0:d} periodic updates ran.".format(len(self.times)))
+        intervals = [b - a for a, b in zip(self.times[:-1], self.times[1:])]
+        return 1e3 * sum(abs(interval - period) for interval in intervals) / len(intervals)
+    track_period_error.unit = "ms"
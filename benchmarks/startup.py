@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for selecting a backend and starting dispatcher services.
+"""
+
+import itertools
+
+from Cauldron.api import use, teardown
+from Cauldron.test_helpers import setup_entry_points_api
+
+from .backends import BACKENDS, Deployment
+
+class UseBackend(object):
+    """Time to activate and tear down a backend."""
+    
+    params = ['local', 'mock']
+    param_names = ['backend']
+    
+    def setup(self, backend):
+        setup_entry_points_api()
+        
+    def time_use(self, backend):
+        use(backend)
+        teardown()
+
+class ServiceStartup(object):
+    """Time to start a dispatcher service with many keywords."""
+    
+    params = (BACKENDS, [1000, 10000])
+    param_names = ['backend', 'keywords']
+    timeout = 120
+    
+    def setup(self, backend, keywords):
+        self.deployment = Deployment(backend)
+        self.deployment.start()
+        self.names = ["KEYWORD{0:d}".format(i) for i in range(keywords)]
+        self.counter = itertools.count()
+        
+    def teardown(self, backend, keywords):
+        self.deployment.stop()
+        
+    def _start(self, keyword_cls):
+        """Start a service with every keyword instantiated from `keyword_cls`."""
+        from Cauldron import DFW
+        def setup(service):
+            for name in self.names:
+                keyword_cls(name, service)
+        service = DFW.Service("bench{0:d}".format(next(self.counter)), config=None, setup=setup)
+        service.shutdown()
+        
+    def time_registered_keywords(self, backend, keywords):
+        from Cauldron import DFW
+        self._start(DFW.Keyword.String)
+        
+    def time_generic_keywords(self, backend, keywords):
+        from Cauldron.types import String
+        self._start(String)
+        
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the cost of disabled logging on the ZMQ messaging hot paths, with logging at WARNING.
+"""
+
+import logging
+
+from Cauldron.api import use, teardown
+from Cauldron.test_helpers import setup_entry_points_api
+
+LOGGERS = ["DFW", "ktl", "Cauldron"]
+
+class _Warning(object):
+    """Log at WARNING, for the duration of a benchmark."""
+
+    def setup(self, *args):
+        self._levels = [(logger, logger.level) for logger in map(logging.getLogger, LOGGERS)]
+        for logger, _ in self._levels:
+            logger.setLevel(logging.WARNING)
+
+    def teardown(self, *args):
+        for logger, level in self._levels:
+            logger.setLevel(level)
+
+class MessageLogging(_Warning):
+    """Time the broker's per-message log line, formatted eagerly or lazily, when it is disabled."""
+
+    params = ['eager', 'lazy']
+    param_names = ['formatting']
+    number = 10000
+
+    def setup(self, formatting):
+        super(MessageLogging, self).setup()
+        from Cauldron.zmq.protocol import ZMQCauldronMessage
+        self.log = logging.getLogger("DFW.Broker.bench.Service.BENCH.Client")
+        self.message = ZMQCauldronMessage(command="update", service="bench", dispatcher="dispatcher",
+            keyword="KEYWORD", payload="1", direction="CDP")
+        self.message.prefix = [b"\x00\x01\x02\x03\x04", b""]
+
+    def time_send(self, formatting):
+        if formatting == 'eager':
+            self.log.log(5, "{0!r}.send({1!r})".format(self, self.message))
+        else:
+            self.log.lazy(5, "{0!r}.send({1!r})", self, self.message)
+
+class ZMQRoundTrip(_Warning):
+    """Time blocking reads and writes through the ZMQ broker, with logging at WARNING."""
+
+    number = 100
+    timeout = 120
+
+    def setup(self):
+        super(ZMQRoundTrip, self).setup()
+        try:
+            import zmq
+        except ImportError:
+            raise NotImplementedError("The ZMQ backend is not available.")
+        setup_entry_points_api()
+        use('zmq')
+        from Cauldron.config import get_configuration
+        config = get_configuration()
+        config.set("zmq", "broker", "inproc://broker")
+        config.set("zmq", "publish", "inproc://publish")
+        config.set("zmq", "subscribe", "inproc://subscribe")
+        from Cauldron.zmq.broker import ZMQBroker
+        self.broker = ZMQBroker.setup(config=config, timeout=0.01)
+        from Cauldron import DFW, ktl
+        self.dispatcher = DFW.Service("benchzmq", config=None)
+        self.dispatcher["KEYWORD"].modify("0")
+        self.client = ktl.Service("benchzmq")
+        self.keyword = self.client["KEYWORD"]
+        self.values = ["0", "1"]
+
+    def teardown(self):
+        self.client.shutdown()
+        self.dispatcher.shutdown()
+        if self.broker:
+            self.broker.stop()
+        teardown()
+        super(ZMQRoundTrip, self).teardown()
+
+    def time_read(self):
+        self.keyword.read()
+
+    def time_write(self):
+        self.values.reverse()
+        self.keyword.write(self.values[0])
@@ -6,9 +6,11 @@ from __future__ import absolute_import
 
 import weakref
 import time
+import threading
 from ..base import ClientService, ClientKeyword
 from ..exc import CauldronAPINotImplementedWarning, CauldronAPINotImplemented
-from .common import REDIS_SERVICES_REGISTRY, redis_key_name, check_redis, get_connection_pool, redis_status_key, REDISKeywordBase, REDISPubsubBase, teardown
+from .common import (REDIS_SERVICES_REGISTRY, redis_key_name, redis_broadcast_channel, redis_index_key, redis_types_key, check_redis, get_connection_pool,
+    REDISKeywordBase, PubSub, REDISPubsubBase, teardown)
 from .. import registry
 
 __all__ = ['Service', 'Keyword']
@@ -27,38 +29,66 @@ class Keyword(ClientKeyword, REDISKeywordBase):
         """Is this keyword writable?"""
         return True
         
+    _cached = False
+    _monitored = False
+    
     def _redis_callback(self, message):
-        """A redis callback function."""
+        """A redis callback function, which receives new values broadcast by the dispatcher."""
         if message is None:
             return
-        if message['channel'].endswith(redis_key_name(self)) and message['data'] == "set":
-            self.read()
+        if message['channel'] == redis_broadcast_channel(self):
+            self._cached = True
+            self._update(message['data'])
             return
         
         return message
         
     def monitor(self, start=True, prime=True, wait=True):
+        """Monitor this keyword. While a keyword is monitored, its value is kept up to date from dispatcher broadcasts, and reads are served locally."""
         if start:
-            if prime:
-                self.read(wait=wait)
+            self._monitored = True
             with self.service.pubsub() as pubsub:
-                pubsub.psubscribe(**{"__keyspace@*__:"+redis_key_name(self):self._redis_callback})
+                pubsub.subscribe(**{redis_broadcast_channel(self):self._redis_callback})
             self.service._run_thread()
+            if prime:
+                self.read(wait=wait)
+                if wait:
+                    self._cached = True
         else:
+            self._monitored = self._cached = False
             with self.service.pubsub() as pubsub:
-                pubsub.punsubscribe("__keyspace@*__:"+redis_key_name(self))
+                pubsub.unsubscribe(redis_broadcast_channel(self))
             
+    def _fresh(self):
+        """Whether this keyword's cached value is kept up to date by a running broadcast listener.
+        
+        A listener which loses its connection stops, and cached values are then read from REDIS again.
+        """
+        if self._cached and not self.service._listening:
+            self._cached = False
+        return self._cached
+        
+    def _ktl_units(self):
+        """Units for this keyword."""
+        return '' if self._units is None else self._units
+        
     def _ktl_monitored(self):
         """Determine if this keyword is monitored."""
-        with self.service.pubsub() as pubsub:
-            mon = redis_key_name(self) in pubsub.channels
-        return mon
+        return self._monitored
         
     def _update_from_redis(self):
         """Update this keyword from REDIS."""
-        self._update(self.service.redis.get(redis_key_name(self)))
+        self._update(self.service.redis.hget(redis_key_name(self), 'value'))
         
         
+    def _read_from_redis(self, value, status, timeout=None):
+        """Update this keyword from a value and status fetched together, waiting only if a modify is in progress."""
+        if status == 'modify':
+            self._wait_for_status('ready', timeout, initial_status='modify')
+            self._update_from_redis()
+        else:
+            self._update(value)
+        
     def read(self, binary=False, both=False, wait=True, timeout=None):
         """Read a value, possibly asynchronously."""
         
@@ -66,8 +96,10 @@ class Keyword(ClientKeyword, REDISKeywordBase):
             raise NotImplementedError("Keyword '{0}' does not support reads.".format(self.name))
         
         if wait or timeout is not None:
-            self._wait_for_status('ready', timeout, initial_status='modify')
-            self._update_from_redis()
+            if not self._fresh():
+                resubscribed = self._monitored and self.service._resubscribe()
+                self._read_from_redis(*self.service.redis.hmget(redis_key_name(self), 'value', 'status'), timeout=timeout)
+                self._cached = resubscribed
             return self._current_value(binary=binary, both=both)
         else:
             self._trigger_on_status('ready', self._update_from_redis)
@@ -99,24 +131,69 @@ class Service(REDISPubsubBase, ClientService):
         redis = check_redis()
         connection_pool = get_connection_pool(connection_pool)
         self.redis = redis.StrictRedis(connection_pool=connection_pool)
-        self._pubsub = redis.StrictRedis(connection_pool=connection_pool).pubsub()
+        self._pubsub = PubSub(connection_pool)
+        self._resubscribe_lock = threading.Lock()
+        self._types = {}
         super(Service, self).__init__(name, populate)
         
     def _ktl_type(self, key):
         """Get the KTL type of a keyword."""
-        if self.redis.exists(redis_key_name(self.name, key)+':type'):
-            return self.redis.get(redis_key_name(self.name, key)+':type')
-        else:
-            return 'basic'
-        
+        if key in self._types:
+            return self._types[key]
+        return self.redis.hget(redis_types_key(self.name), key) or 'basic'
+        
+    def _populate(self):
+        """Populate all keywords, fetching their types at once."""
+        self._types = self.redis.hgetall(redis_types_key(self.name))
+        super(Service, self)._populate()
     
-    def has_keyword(self, name):
+    def read_many(self, keywords, binary=False, timeout=None):
+        """Read several keywords, fetching every value and status in a single pipelined round trip.
+        
+        Returns a list of values in the same order as `keywords`.
+        """
+        keywords = [ self[keyword] for keyword in keywords ]
+        for keyword in keywords:
+            if not keyword['reads']:
+                raise NotImplementedError("Keyword '{0}' does not support reads.".format(keyword.name))
+        uncached = [ keyword for keyword in keywords if not keyword._fresh() ]
+        if uncached:
+            resubscribed = any(keyword._monitored for keyword in uncached) and self._resubscribe()
+            pipeline = self.redis.pipeline(transaction=False)
+            for keyword in uncached:
+                pipeline.hmget(redis_key_name(keyword), 'value', 'status')
+            for keyword, (value, status) in zip(uncached, pipeline.execute()):
+                keyword._read_from_redis(value, status, timeout=timeout)
+                keyword._cached = resubscribed and keyword._monitored
+        return [ keyword._current_value(binary=binary) for keyword in keywords ]
+    
+    @property
+    def _listening(self):
+        """Whether the broadcast listener thread is running."""
+        return self._thread is not None and self._thread.listening
+        
+    def _resubscribe(self):
+        """Subscribe again to every broadcast channel, and restart the listener, after it lost its connection.
+        
+        Returns whether the listener is running.
+        """
+        redis = check_redis()
+        with self._resubscribe_lock:
+            if self._listening:
+                return True
+            try:
+                if self._pubsub.channels:
+                    self._pubsub.subscribe(**dict(self._pubsub.channels))
+                self._run_thread()
+            except redis.ConnectionError as e:
+                self.log.warning("Can't subscribe to broadcasts for '{0}', reading from REDIS: {1!s}".format(self.name, e))
+                return False
+            return self._listening
+        
+    def _has_keyword(self, name):
         """Check for the existence of a keyword."""
-        return self.redis.exists(redis_key_name(self.name, name))
+        return self.redis.zscore(redis_index_key(self.name), name) is not None
         
     def keywords(self):
         """Return the list of all available keywords in this service instance."""
-        prefix = len(redis_key_name(self.name, ""))
-        return [ key[prefix:] for key in sorted(self.redis.keys(redis_key_name(self.name, "*"))) ]
-        
-    
\ No newline at end of file
+        return self.redis.zrange(redis_index_key(self.name), 0, -1)
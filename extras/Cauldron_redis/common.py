@@ -2,11 +2,16 @@
 
 from __future__ import absolute_import
 
+import os
+import errno
+import itertools
+import collections
+import fcntl
+import select
 import threading
 import logging
 import weakref
 import contextlib
-import time
 
 from pkg_resources import parse_version
 
@@ -17,15 +22,20 @@ from .. import registry
 
 __all__ = ['REDIS_AVAILALBE', 'REDIS_DOMAIN', 'REDIS_SERVICES_REGISTRY',
     'check_redis', 'check_redis_connection',
-    'redis_key_name', 'redis_status_key', 
-    'REDISPubsubBase', 'REDISKeywordBase', 
+    'redis_key_name', 'redis_broadcast_channel', 'redis_index_key', 'redis_types_key', 'migrate_service',
+    'redis_zadd', 'redis_hset',
+    'PubSub', 'REDISPubsubBase', 'REDISKeywordBase', 
     'get_connection_pool', 'get_global_connection_pool']
 
 REDIS_AVAILALBE = APISetting("REDIS_AVAILALBE", False)
+#: Whether redis-py takes mappings for ZADD (3.0) and HSET (3.5) rather than positional pairs.
+_REDIS_ZADD_MAPPING = _REDIS_HSET_MAPPING = False
 try:
     import redis
     if parse_version(redis.__version__) >= parse_version("2.10.5"):
         REDIS_AVAILALBE.on()
+        _REDIS_ZADD_MAPPING = parse_version(redis.__version__) >= parse_version("3.0")
+        _REDIS_HSET_MAPPING = parse_version(redis.__version__) >= parse_version("3.5")
 except ImportError:
     REDIS_AVAILALBE.off()
 finally:
@@ -42,6 +52,18 @@ def check_redis():
         raise RuntimeError("You must have redis.py installed to use the REDIS backend")
     return redis
 
+def redis_zadd(client, key, member, score):
+    """Add `member` to the sorted set `key` with `score`, on any supported version of redis-py."""
+    if _REDIS_ZADD_MAPPING:
+        return client.zadd(key, {member : score})
+    return client.zadd(key, score, member)
+    
+def redis_hset(client, key, fields):
+    """Set many `fields` of the hash `key`, on any supported version of redis-py."""
+    if _REDIS_HSET_MAPPING:
+        return client.hset(key, mapping=fields)
+    return client.hmset(key, fields)
+    
 def redis_key_name(service, keyword=None):
     """Return the REDIS key name for a given keyword."""
     if keyword is None:
@@ -52,65 +74,273 @@ def redis_key_name(service, keyword=None):
         _service, _keyword = str(service).lower(), str(keyword).upper()
     return "{0}.{1}.{2}".format(REDIS_DOMAIN, _service, _keyword)
     
-def redis_status_key(service, keyword=None):
-    """Return the REDIS status key name for a given keyword."""
-    return "{0}:status".format(redis_key_name(service, keyword))
+def redis_broadcast_channel(keyword):
+    """Return the channel on which a dispatcher publishes new values for a keyword."""
+    return "{0}:broadcast".format(redis_key_name(keyword))
+    
+def _redis_service_key(service, suffix):
+    """Return the REDIS key name for a service-wide structure."""
+    return "{0}.{1}:{2}".format(REDIS_DOMAIN, str(getattr(service, 'name', service)).lower(), suffix)
+    
+def redis_index_key(service):
+    """Return the REDIS key name of the sorted set which indexes the keywords in a service."""
+    return _redis_service_key(service, "keywords")
+    
+def redis_types_key(service):
+    """Return the REDIS key name of the hash of keyword types in a service."""
+    return _redis_service_key(service, "types")
+    
+def migrate_service(redis, service):
+    """Move a service from the old layout, with separate string keys for each keyword's value, status, type and error, to a hash per keyword and a keyword index.
+    
+    Returns the names of the migrated keywords.
+    """
+    prefix = redis_key_name(service, "")
+    names = set()
+    for key in redis.scan_iter(match=redis_key_name(service, "*")):
+        name = key[len(prefix):].split(":", 1)[0]
+        if name and redis.type(redis_key_name(service, name)) == "string":
+            names.add(name)
+    for name in sorted(names):
+        key = redis_key_name(service, name)
+        value, status, ktl_type, error = redis.mget(key, key+":status", key+":type", key+":error")
+        pipeline = redis.pipeline()
+        pipeline.delete(key, key+":status", key+":type", key+":error")
+        fields = {'value' : value or '', 'status' : status or 'init'}
+        if error is not None:
+            fields['error'] = error
+        redis_hset(pipeline, key, fields)
+        redis_zadd(pipeline, redis_index_key(service), name, 0)
+        if ktl_type is not None:
+            pipeline.hset(redis_types_key(service), name, ktl_type)
+        pipeline.execute()
+    return sorted(names)
+    
+if REDIS_AVAILALBE:
+    class PubSub(redis.client.PubSub):
+        """A pubsub object which keeps the handler for a channel or pattern that is subscribed again before an earlier unsubscribe has been acknowledged.
+        
+        redis-py forgets a subscription when the unsubscribe reply arrives, which would otherwise drop the newer subscription.
+        """
+        
+        def __init__(self, *args, **kwargs):
+            super(PubSub, self).__init__(*args, **kwargs)
+            self._unsubscribing = collections.Counter()
+            self._resubscribed = set()
+        
+        def _subscribing(self, args, kwargs):
+            """Note names subscribed while an unsubscribe is in flight."""
+            names = redis.client.list_or_args(args[0], args[1:]) if args else []
+            for name in itertools.chain(names, kwargs):
+                if self._unsubscribing[name]:
+                    self._resubscribed.add(name)
+        
+        def _unsubscribed(self, args):
+            """Note names with an unsubscribe in flight."""
+            names = redis.client.list_or_args(args[0], args[1:]) if args else []
+            for name in names:
+                self._unsubscribing[name] += 1
+                self._resubscribed.discard(name)
+        
+        def subscribe(self, *args, **kwargs):
+            self._subscribing(args, kwargs)
+            return super(PubSub, self).subscribe(*args, **kwargs)
+        
+        def psubscribe(self, *args, **kwargs):
+            self._subscribing(args, kwargs)
+            return super(PubSub, self).psubscribe(*args, **kwargs)
+        
+        def unsubscribe(self, *args):
+            self._unsubscribed(args)
+            return super(PubSub, self).unsubscribe(*args)
+        
+        def punsubscribe(self, *args):
+            self._unsubscribed(args)
+            return super(PubSub, self).punsubscribe(*args)
+        
+        def handle_message(self, response, ignore_subscribe_messages=False):
+            if redis.client.nativestr(response[0]) in self.UNSUBSCRIBE_MESSAGE_TYPES:
+                name = response[1]
+                if self._unsubscribing[name]:
+                    self._unsubscribing[name] -= 1
+                if name in self._resubscribed:
+                    if not self._unsubscribing[name]:
+                        self._resubscribed.discard(name)
+                    return None
+            return super(PubSub, self).handle_message(response, ignore_subscribe_messages)
+    
+def _batched(method):
+    """Make a method which records a pubsub call in a batch."""
+    def record(self, *args, **kwargs):
+        self.operations.append((method, args, kwargs))
+    record.__name__ = method
+    record.__doc__ = "Record a call to {0}() in this batch.".format(method)
+    return record
+    
+class PubSubBatch(object):
+    """A batch of subscription changes, sent to REDIS together by the listener thread.
+    
+    Any other attribute access is passed through to the underlying pubsub object.
+    """
+    
+    def __init__(self, pubsub):
+        self._pubsub = pubsub
+        self.operations = []
+        self.done = threading.Event()
+        
+    def __getattr__(self, attr):
+        return getattr(self._pubsub, attr)
+        
+    subscribe = _batched("subscribe")
+    psubscribe = _batched("psubscribe")
+    unsubscribe = _batched("unsubscribe")
+    punsubscribe = _batched("punsubscribe")
+    
     
 class PubSubWorkerThread(threading.Thread):
-    def __init__(self, pubsub, sleep_time):
+    """Listen for pubsub messages, blocking on the REDIS socket.
+    
+    Subscription changes are queued as batches, and the thread is woken through
+    a self-pipe to send them, so no lock is held while waiting for messages.
+    """
+    def __init__(self, pubsub):
         super(PubSubWorkerThread, self).__init__()
         self._pubsub = pubsub
-        self.sleep_time = sleep_time
         self._running = False
-        self._adjust_lock = threading.RLock()
+        self._stopping = False
+        self._pending = []
+        self._adjust_lock = threading.Lock()
+        self._wake_r, self._wake_w = os.pipe()
+        for fd in (self._wake_r, self._wake_w):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self._accepting = True
+    
+    @property
+    def listening(self):
+        """Whether this thread is accepting subscription changes and delivering messages."""
+        return self._accepting and self.is_alive()
     
     @contextlib.contextmanager
     def pubsub(self):
-        """Yield the pubsub object."""
-        with self._adjust_lock:
+        """Yield a batch of subscription changes, and wait for the listener to send them."""
+        if threading.current_thread() is self:
             yield self._pubsub
+            return
+        batch = PubSubBatch(self._pubsub)
+        yield batch
+        if batch.operations and self._submit(batch):
+            batch.done.wait()
+        
+    def _submit(self, batch):
+        """Queue a batch for the listener thread. If the thread has finished, send the batch directly."""
+        with self._adjust_lock:
+            if self._accepting:
+                self._pending.append(batch)
+                self._wake()
+                return True
+        self._send(batch.operations)
+        return False
+        
+    def _wake(self):
+        """Wake the listener thread. Called with the adjustment lock held."""
+        try:
+            os.write(self._wake_w, b"x")
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+        
+    def _send(self, operations):
+        """Send subscription changes, combining consecutive calls to the same method."""
+        merged = []
+        for method, args, kwargs in operations:
+            if merged and merged[-1][0] == method and (args or kwargs) and (merged[-1][1] or merged[-1][2]):
+                merged[-1][1].extend(args)
+                merged[-1][2].update(kwargs)
+            else:
+                merged.append((method, list(args), dict(kwargs)))
+        for method, args, kwargs in merged:
+            getattr(self._pubsub, method)(*args, **kwargs)
+        
+    def _apply(self):
+        """Send every queued batch, and release its waiters."""
+        with self._adjust_lock:
+            try:
+                while True:
+                    os.read(self._wake_r, 1024)
+            except OSError as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise
+            batches, self._pending = self._pending, []
+        try:
+            self._send([ operation for batch in batches for operation in batch.operations ])
+        finally:
+            for batch in batches:
+                batch.done.set()
+        
+    def _listen(self):
+        """Handle every message which is ready, then block until a message arrives or the thread is woken."""
+        readers = [self._wake_r]
+        connection = self._pubsub.connection
+        if connection is not None:
+            while connection.can_read(timeout=0):
+                self._pubsub.get_message(ignore_subscribe_messages=True)
+            readers.append(connection._sock)
+        with self._adjust_lock:
+            if self._stopping or not (self._pubsub.subscribed or self._pending):
+                # Later changes are sent directly, until a new listener is started.
+                self._accepting = False
+                return False
+        select.select(readers, [], [])
+        return True
         
-    
     def run(self):
         if self._running:
             return
         self._running = True
         try:
-            pubsub = self._pubsub
-            lock = self._adjust_lock
-            sleep_time = self.sleep_time
-            while pubsub.subscribed:
-                with lock:
-                    pubsub.get_message(ignore_subscribe_messages=True,
-                                       timeout=sleep_time)
-                time.sleep(sleep_time)
+            self._apply()
+            while self._listen():
+                self._apply()
         except weakref.ReferenceError as e:
             # This is a good enough reason to shutdown.
             pass
         except redis.ConnectionError as e:
             pass
         finally:
+            with self._adjust_lock:
+                self._accepting = False
+                batches, self._pending = self._pending, []
+                os.close(self._wake_r)
+                os.close(self._wake_w)
+            for batch in batches:
+                try:
+                    self._send(batch.operations)
+                except (weakref.ReferenceError, redis.ConnectionError):
+                    pass
+                finally:
+                    batch.done.set()
             self._running = False
 
     def stop(self):
-        # stopping simply unsubscribes from all channels and patterns.
-        # the unsubscribe responses that are generated will short circuit
-        # the loop in run(), calling pubsub.close() to clean up the connection
-        with self._adjust_lock:
-            self._pubsub.unsubscribe()
-            self._pubsub.punsubscribe()
+        """Unsubscribe from all channels and patterns, and stop the listener thread."""
+        self._stopping = True
+        batch = PubSubBatch(self._pubsub)
+        batch.unsubscribe()
+        batch.punsubscribe()
+        self._submit(batch)
+        if threading.current_thread() is not self:
+            self.join()
     
 class REDISPubsubBase(object):
     """A base class for handling the REDIS pubsub interface in background threads."""
     
     _thread = None
-    THREAD_SLEEP_TIME = 0.001
     THREAD_DAEMON = False
     
     @contextlib.contextmanager
     def pubsub(self):
         """Get the pubsub object from the thread."""
-        if self._thread is None or not self._thread.is_alive():
+        if self._thread is None or not self._thread.listening:
             yield self._pubsub
         else:
             with self._thread.pubsub() as pubsub:
@@ -119,7 +349,7 @@ class REDISPubsubBase(object):
     def _start_thread(self):
         """Create and start a new thread."""
         import redis.client
-        self._thread = PubSubWorkerThread(weakref.proxy(self._pubsub), sleep_time=self.THREAD_SLEEP_TIME)
+        self._thread = PubSubWorkerThread(weakref.proxy(self._pubsub))
         self._thread.daemon = self.THREAD_DAEMON
         self._thread.name = "PubSubWorkerThread-{0}".format(self.name)
         self._thread.start()
@@ -130,7 +360,7 @@ class REDISPubsubBase(object):
             if self._thread is None:
                 self.log.debug("Starting monitor thread for '{0}'".format(self.name))
                 self._start_thread()
-            elif not self._thread.is_alive():
+            elif not self._thread.listening:
                 self.log.debug("Re-starting monitor thread for '{0}'".format(self.name))
                 self._start_thread()
         except weakref.ReferenceError:
@@ -140,7 +370,7 @@ class REDISPubsubBase(object):
     def _stop_thread(self):
         """Stop the underlying thread."""
         try:
-            if self._thread is not None and self._thread.is_alive():
+            if self._thread is not None and self._thread.listening:
                 self.log.debug("Stopping monitor thread for '{0}'".format(self.name))
                 self._thread.stop()
         except weakref.ReferenceError:
@@ -166,7 +396,7 @@ class REDISKeywordBase(object):
         event = threading.Event()
         log = self.service.log
         redis = self.service.redis
-        initial_status = initial_status or redis.get(redis_status_key(self))
+        initial_status = initial_status or redis.hget(redis_key_name(self), "status")
         log.log(5, "Waiting for '{0}' to become '{1}' from '{2}'".format(self.name, status, initial_status))
         
         def _handle_status(recieved_status):
@@ -180,8 +410,8 @@ class REDISKeywordBase(object):
                 if callback is not None:
                     callback()
             elif initial_status != recieved_status:
-                _handle_status._error = redis.get(redis_key_name(self)+":error")
-                redis.delete(redis_key_name(self)+":error")
+                _handle_status._error = redis.hget(redis_key_name(self), "error")
+                redis.hdel(redis_key_name(self), "error")
                 log.log(5, "Received a '{0}' notification for '{1}': {2}".format(recieved_status, self.name, _handle_status._error))
                 event.set()
             else:
@@ -189,49 +419,49 @@ class REDISKeywordBase(object):
                 
             if event.is_set():
                 with self.service.pubsub() as pubsub:
-                    pubsub.punsubscribe("__keyspace@*__:"+redis_status_key(self))
+                    pubsub.punsubscribe("__keyspace@*__:"+redis_key_name(self))
         
         def _message_responder(message):
             if message is None:
                 return # pragma: no cover
-            if message['channel'].endswith(redis_status_key(self)) and message['data'] == "set":
-                recieved_status = redis.get(redis_status_key(self))
+            if message['channel'].endswith(redis_key_name(self)) and message['data'] == "hset":
+                recieved_status = redis.hget(redis_key_name(self), "status")
                 _handle_status(recieved_status)
                 
         with self.service.pubsub() as pubsub:
-            pubsub.psubscribe(**{"__keyspace@*__:"+redis_status_key(self):_message_responder})
+            pubsub.psubscribe(**{"__keyspace@*__:"+redis_key_name(self):_message_responder})
         self.service._run_thread()
-        _handle_status(redis.get(redis_status_key(self)))
+        _handle_status(redis.hget(redis_key_name(self), "status"))
         
         # Process Timeout
         if not event.is_set():
             log.debug("Keyword '{0}' is waiting {1} on status == '{2}', currently '{3}'".format(
                 self.name, "for {0:d}s".format(timeout) if timeout else 'indefinitely', status,
-                redis.get(redis_status_key(self))
+                redis.hget(redis_key_name(self), "status")
             ))
-            _handle_status(redis.get(redis_status_key(self)))
+            _handle_status(redis.hget(redis_key_name(self), "status"))
             event.wait(timeout)
         
         # Handle the case where the system actually timed out.
         if event.is_set():
             log.debug("Keyword '{0}' waited {1} on status == '{2}', finished with status '{3}'".format(
                 self.name, "at most {0:d}s".format(timeout) if timeout else 'some time', status,
-                redis.get(redis_status_key(self))
+                redis.hget(redis_key_name(self), "status")
             ))
         else:
             log.debug("After Keyword '{0}' waiting {1} on status == '{2}', ended, currently, status '{3}'".format(
                 self.name, "for {0:d}s".format(timeout) if timeout else 'indefinitely', status,
-                redis.get(redis_status_key(self))
+                redis.hget(redis_key_name(self), "status")
             ))
             
-        log.log(5, "Unsubscribing '{0}'".format(self.name))
-        with self.service.pubsub() as pubsub:
-            pubsub.punsubscribe("__keyspace@*__:"+redis_status_key(self))
-        
+            # Once the event is set, _handle_status has already unsubscribed.
+            log.log(5, "Unsubscribing '{0}'".format(self.name))
+            with self.service.pubsub() as pubsub:
+                pubsub.punsubscribe("__keyspace@*__:"+redis_key_name(self))
         
         if getattr(_handle_status, '_error', None) is not None:
             # We set this back here to ensure that we are consistent when this function ends.
-            redis.set(redis_status_key(self), status)
+            redis.hset(redis_key_name(self), "status", status)
             log.log(5, "Raising an error from '{0}': {1}".format(self.name, _handle_status._error))
             raise DispatcherError(_handle_status._error)
             
@@ -243,24 +473,24 @@ class REDISKeywordBase(object):
         def _message_responder(message):
             if message is None:
                 return # pragma: no cover
-            if message['channel'].endswith(redis_status_key(self)) and message['data'] == "set":
-                _status = self.service.redis.get(redis_status_key(self))
+            if message['channel'].endswith(redis_key_name(self)) and message['data'] == "hset":
+                _status = self.service.redis.hget(redis_key_name(self), "status")
                 if _status == status:
                     triggered.set()
                     if callback is not None:
                         callback()
                 if _status == "error":
-                    error = self.service.redis.get(redis_key_name(self)+":error")
+                    error = self.service.redis.hget(redis_key_name(self), "error")
                     self.service.log.error(str(DispatcherError(error)))
                 if _status in ["error", status]:
                     with self.service.pubsub() as pubsub:
-                        pubsub.unsubscribe("__keyspace@*__:"+redis_status_key(self))
+                        pubsub.unsubscribe("__keyspace@*__:"+redis_key_name(self))
         
         with self.service.pubsub() as pubsub:
-            pubsub.subscribe(**{"__keyspace@*__:"+redis_status_key(self):_message_responder})
+            pubsub.subscribe(**{"__keyspace@*__:"+redis_key_name(self):_message_responder})
         self.service._run_thread()
         # Immediately call the message responder with a fake message to ensure that the initial state is checked.
-        _message_responder({'channel':redis_status_key(self), 'data':'set'})
+        _message_responder({'channel':redis_key_name(self), 'data':'hset'})
         
     
 def get_connection_pool(connection_pool):
@@ -9,7 +9,8 @@ import weakref
 
 from ..base import DispatcherService, DispatcherKeyword
 from ..compat import WeakOrderedSet
-from .common import REDIS_SERVICES_REGISTRY, redis_key_name, get_connection_pool, check_redis, REDISPubsubBase, teardown
+from .common import (REDIS_SERVICES_REGISTRY, redis_key_name, redis_broadcast_channel, redis_index_key, redis_types_key, migrate_service,
+    redis_zadd, redis_hset, get_connection_pool, check_redis, PubSub, REDISPubsubBase, teardown)
 from .. import registry
 
 __all__ = ['Service', 'Keyword']
@@ -28,11 +29,14 @@ class Service(REDISPubsubBase, DispatcherService):
         self.connection_pool = get_connection_pool(None)
         self.redis = redis.StrictRedis(connection_pool=self.connection_pool)
         self.redis.config_set("notify-keyspace-events", "KA")
-        self._pubsub = redis.StrictRedis(connection_pool=self.connection_pool).pubsub()
+        self._pubsub = PubSub(self.connection_pool)
         
         if self.redis.sismember(REDIS_SERVICES_REGISTRY, name.lower()):
             raise ValueError("Service {0} cannot have multiple instances. Found {1!r}".format(name.lower(), self.redis.smembers(REDIS_SERVICES_REGISTRY)))
         
+        if not self.redis.exists(redis_index_key(name)):
+            migrate_service(self.redis, name)
+        
         super(Service, self).__init__(name, config, setup, dispatcher)
         
     def _begin(self):
@@ -56,30 +60,55 @@ class Service(REDISPubsubBase, DispatcherService):
 class Keyword(DispatcherKeyword):
     """A keyword"""
     
+    __slots__ = ('_redis_pending',)
+    
     def __init__(self, name, service, initial=None, period=None):
         """Set the initial value for this keyword."""
+        self._redis_pending = None
         super(Keyword, self).__init__(name, service, initial, period)
         with self.service.pubsub() as pubsub:
             pubsub.subscribe(**{redis_key_name(self):self._redis_callback})
         self.service._run_thread()
-        if not self.service.redis.exists(redis_key_name(self)):
-            self.service.redis.set(redis_key_name(self), '')
-            self.service.redis.set(redis_key_name(self)+':status', 'init')
-            self.service.redis.set(redis_key_name(self)+':type', self.KTL_TYPE)
+        pipeline = self.service.redis.pipeline()
+        pipeline.hsetnx(redis_key_name(self), 'value', '')
+        pipeline.hsetnx(redis_key_name(self), 'status', 'init')
+        pipeline.hset(redis_types_key(self.service), self.name, self.KTL_TYPE)
+        redis_zadd(pipeline, redis_index_key(self.service), self.name, 0)
+        pipeline.execute()
     
-    def _redis_set_status(self, status):
-        """Set REDIS status for a keyword."""
-        self.service.log.log(5, "Setting '{0}' status = '{1}' from '{2}'".format(self.name, status, 
-            self.service.redis.get(redis_key_name(self)+':status')))
-        self.service.redis.set(redis_key_name(self)+':status', status)
-        if status != "error":
-            if self.service.redis.exists(redis_key_name(self)+':error'):
-                self.service.log.log(5, "Clearing error for '{0}'".format(self.name))
-                self.service.redis.delete(redis_key_name(self)+':error')
+    def _redis_set_status(self, status, value=None, error=None):
+        """Set REDIS status for a keyword in a single transaction.
+        
+        The keyword value (if `value` is not None) and the error message are
+        updated along with the status, so clients never see a status which
+        doesn't match the value or error. New values are published before the
+        status changes, so a client's cached value is current by the time it
+        sees the status notification.
+        """
+        self.service.log.log(5, "Setting '{0}' status = '{1}'".format(self.name, status))
+        fields = {'status' : status}
+        if value is not None:
+            fields['value'] = value
+        pipeline = self.service.redis.pipeline()
+        if value is not None:
+            pipeline.publish(redis_broadcast_channel(self), value)
+        if error is not None:
+            fields['error'] = error
+        else:
+            pipeline.hdel(redis_key_name(self), 'error')
+        redis_hset(pipeline, redis_key_name(self), fields)
+        pipeline.execute()
     
     def _broadcast(self, value):
         """Broadcast that a value has changed in this keyword."""
-        self.service.redis.set(redis_key_name(self), value)
+        if self._redis_pending is not None:
+            # Deferred until the status changes at the end of set()
+            self._redis_pending.append(value)
+        else:
+            pipeline = self.service.redis.pipeline()
+            pipeline.publish(redis_broadcast_channel(self), value)
+            pipeline.hset(redis_key_name(self), 'value', value)
+            pipeline.execute()
     
     def _redis_callback(self, msg):
         """Take a message."""
@@ -89,20 +118,21 @@ class Keyword(DispatcherKeyword):
                 self.modify(msg["data"])
             except Exception as e:
                 self.service.log.error("Error in the REDIS responder thread for set({0!s}): {1!s}".format(msg["data"], e))
-                self.service.redis.set(redis_key_name(self)+':error', str(e))
-                self._redis_set_status('error')
+                self._redis_set_status('error', error=str(e))
             
     def set(self, value, force=False):
-        """During set, lock status."""
-        self._redis_set_status('modify')
-        try:
-            super(Keyword, self).set(value, force)
-        except Exception as e:
-            self.service.redis.set(redis_key_name(self)+':error', str(e))
-            self._redis_set_status('error')
-            raise
-        else:
-            self.service.log.log(5, "Setting 'ready' from set({0}) which raised no errors.".format(value))
-            self._redis_set_status('ready')
+        """During set, lock status. The new value is written along with the 'ready' status."""
+        with self._lock:
+            self._redis_set_status('modify')
+            self._redis_pending = pending = []
+            try:
+                super(Keyword, self).set(value, force)
+            except Exception as e:
+                self._redis_set_status('error', error=str(e))
+                raise
+            else:
+                self.service.log.log(5, "Setting 'ready' from set({0}) which raised no errors.".format(value))
+                self._redis_set_status('ready', value=pending[-1] if pending else None)
+            finally:
+                self._redis_pending = None
     
-
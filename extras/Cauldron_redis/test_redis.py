@@ -13,6 +13,7 @@ def useredis(request):
     """Use the local backend."""
     from Cauldron.api import use
     use('redis')
+    request.addfinalizer(fail_if_not_teardown)
 
 @pytest.fixture
 def redis_service(request, useredis, servicename, config):
@@ -25,10 +26,12 @@ def redis_service(request, useredis, servicename, config):
     return svc
     
 @pytest.fixture
-def redis_client(redis_service, servicename):
+def redis_client(request, redis_service, servicename):
     """Test a client."""
     from Cauldron import ktl
-    return ktl.Service(servicename)
+    svc = ktl.Service(servicename)
+    request.addfinalizer(svc.shutdown)
+    return svc
 
 def test_redis_available():
     """Test that REDIS is or isn't available."""
@@ -58,3 +61,219 @@ def test_wait(redis_client):
         redis_client["KEYWORD"].wait()
         
     
+def test_set_status(redis_service):
+    """Test that a keyword set leaves the value, status and error consistent."""
+    from Cauldron.redis.common import redis_key_name
+    keyword = redis_service["KEYWORD"]
+    redis = redis_service.redis
+    key = redis_key_name(keyword)
+    keyword.set("MYVALUE")
+    assert redis.hmget(key, "value", "status") == ["MYVALUE", "ready"]
+    
+    def check(value):
+        raise ValueError("Bad value {0}".format(value))
+    keyword.check = check
+    with pytest.raises(ValueError):
+        keyword.set("OTHERVALUE")
+    assert redis.hmget(key, "value", "status", "error") == ["MYVALUE", "error", "Bad value OTHERVALUE"]
+    
+    del keyword.check
+    keyword.set("OTHERVALUE")
+    assert redis.hmget(key, "value", "status") == ["OTHERVALUE", "ready"]
+    assert not redis.hexists(key, "error")
+    
+def test_keyword_index(redis_client):
+    """Test keyword enumeration and types from the keyword index."""
+    assert "KEYWORD" in redis_client.keywords()
+    assert redis_client.keywords() == sorted(redis_client.keywords())
+    assert "KEYWORD" in redis_client
+    assert "NOTAKEYWORD" not in redis_client
+    assert redis_client._ktl_type("KEYWORD") == "basic"
+    redis_client._populate()
+    assert set(redis_client.populated()) == set(redis_client.keywords())
+    
+def test_dispatcher_keyword(redis_service):
+    """Test that creating a dispatcher keyword adds it to the keyword hash, index and types."""
+    from Cauldron.DFW import Keyword
+    from Cauldron.redis.common import redis_key_name, redis_index_key, redis_types_key
+    keyword = Keyword.Integer("NEWKEYWORD", redis_service, initial="3")
+    redis = redis_service.redis
+    assert redis.hget(redis_key_name(keyword), "status") is not None
+    assert redis.zscore(redis_index_key(redis_service), "NEWKEYWORD") == 0
+    assert redis.hget(redis_types_key(redis_service), "NEWKEYWORD") == "integer"
+    keyword.set("4")
+    assert redis.hmget(redis_key_name(keyword), "value", "status") == ["4", "ready"]
+    
+def test_migrate(useredis, config):
+    """Test migrating keywords from separate string keys to the hash layout."""
+    servicename = "migratesvc"
+    from Cauldron.redis.common import redis_key_name, redis_index_key, get_global_connection_pool
+    from Cauldron.DFW import Service
+    import redis
+    r = redis.StrictRedis(connection_pool=get_global_connection_pool())
+    key = redis_key_name(servicename, "OLDKEYWORD")
+    r.set(key, "10")
+    r.set(key+":status", "ready")
+    r.set(key+":type", "integer")
+    
+    svc = Service(servicename, config=config)
+    try:
+        assert r.type(key) == "hash"
+        assert not r.exists(key+":status")
+        assert r.hmget(key, "value", "status") == ["10", "ready"]
+        assert r.zscore(redis_index_key(servicename), "OLDKEYWORD") is not None
+        
+        from Cauldron import ktl
+        client = ktl.Service(servicename)
+        assert client["OLDKEYWORD"].KTL_TYPE == "integer"
+    finally:
+        svc.shutdown()
+    
+def test_pubsub_batch(redis_service):
+    """Test batched subscription changes in the pubsub listener."""
+    received = []
+    def callback(message):
+        received.append(message['data'])
+    
+    thread = redis_service._thread
+    assert thread.listening
+    with redis_service.pubsub() as pubsub:
+        pubsub.subscribe(**{"testchannel1":callback})
+        pubsub.subscribe(**{"testchannel2":callback})
+        assert len(pubsub.operations) == 2
+    assert "testchannel1" in redis_service._pubsub.channels
+    assert "testchannel2" in redis_service._pubsub.channels
+    
+    redis_service.redis.publish("testchannel1", "a")
+    redis_service.redis.publish("testchannel2", "b")
+    for i in range(100):
+        if len(received) == 2:
+            break
+        time.sleep(0.01)
+    assert received == ["a", "b"]
+    
+    with redis_service.pubsub() as pubsub:
+        pubsub.unsubscribe("testchannel1", "testchannel2")
+    assert thread.listening
+    
+    redis_service.shutdown()
+    assert not thread.is_alive()
+    
+def test_read_direct(redis_service, redis_client):
+    """Test that reads of an idle keyword don't wait on keyspace notifications, and that reads during a modify do."""
+    from Cauldron.redis.common import redis_key_name, redis_hset
+    redis_service["KEYWORD"].modify("MYVALUE")
+    assert redis_client["KEYWORD"].read() == "MYVALUE"
+    assert not redis_client._pubsub.patterns
+    
+    key = redis_key_name(redis_service["KEYWORD"])
+    redis_service.redis.hset(key, "status", "modify")
+    def finish():
+        time.sleep(0.05)
+        redis_hset(redis_service.redis, key, {"value" : "OTHERVALUE", "status" : "ready"})
+    thread = threading.Thread(target=finish)
+    thread.start()
+    try:
+        assert redis_client["KEYWORD"].read(timeout=1) == "OTHERVALUE"
+    finally:
+        thread.join()
+    
+def test_read_many(redis_service, redis_client):
+    """Test reading several keywords at once."""
+    redis_service["KEYWORD"].modify("MYVALUE")
+    redis_service["OTHERKEYWORD"].modify("OTHERVALUE")
+    assert redis_client.read_many(["KEYWORD", "OTHERKEYWORD"]) == ["MYVALUE", "OTHERVALUE"]
+    assert redis_client["OTHERKEYWORD"]['ascii'] == "OTHERVALUE"
+    with pytest.raises(KeyError):
+        redis_client.read_many(["KEYWORD", "NOTAKEYWORD"])
+    
+def test_pubsub_resubscribe(useredis):
+    """Test subscribing again to a channel before an unsubscribe is acknowledged."""
+    from Cauldron.redis.common import PubSub, get_global_connection_pool
+    received = []
+    def callback(message):
+        received.append(message['data'])
+    
+    pubsub = PubSub(get_global_connection_pool())
+    try:
+        pubsub.subscribe(**{"testchannel":callback})
+        pubsub.unsubscribe("testchannel")
+        pubsub.subscribe(**{"testchannel":callback})
+        for i in range(3):
+            pubsub.get_message(timeout=1.0)
+        assert "testchannel" in pubsub.channels
+        
+        import redis
+        redis.StrictRedis(connection_pool=get_global_connection_pool()).publish("testchannel", "a")
+        pubsub.get_message(timeout=1.0)
+        assert received == ["a"]
+    finally:
+        pubsub.close()
+    
+def test_monitor_cache(redis_service, redis_client):
+    """Test that monitored keywords take values from dispatcher broadcasts, and read them locally."""
+    from Cauldron.redis.common import redis_key_name
+    redis_service["KEYWORD"].modify("MYVALUE")
+    keyword = redis_client["KEYWORD"]
+    keyword.monitor()
+    assert keyword['monitored']
+    assert keyword.read() == "MYVALUE"
+    
+    def callback(keyword):
+        callback.values.append(keyword['ascii'])
+    callback.values = []
+    keyword.callback(callback)
+    redis_service["KEYWORD"].modify("OTHERVALUE")
+    for i in range(100):
+        if callback.values:
+            break
+        time.sleep(0.01)
+    assert callback.values == ["OTHERVALUE"]
+    
+    def hmget(*args):
+        raise AssertionError("Read a cached keyword from REDIS.")
+    redis = redis_client.redis
+    redis_client.redis = type("NoReads", (object,), {'hmget' : staticmethod(hmget)})()
+    try:
+        assert keyword.read() == "OTHERVALUE"
+        assert redis_client.read_many(["KEYWORD"]) == ["OTHERVALUE"]
+    finally:
+        redis_client.redis = redis
+    
+    keyword.monitor(start=False)
+    assert not keyword['monitored']
+    redis_service.redis.hset(redis_key_name(redis_service["KEYWORD"]), "value", "REDISVALUE")
+    assert keyword.read() == "REDISVALUE"
+    
+def test_monitor_connection_lost(redis_service, redis_client):
+    """Test that monitored keywords are read from REDIS after the broadcast listener loses its connection, and subscribed again."""
+    import redis
+    from Cauldron.redis.common import redis_key_name
+    redis_service["KEYWORD"].modify("MYVALUE")
+    keyword = redis_client["KEYWORD"]
+    keyword.monitor()
+    thread = redis_client._thread
+    assert thread.listening
+    
+    def get_message(*args, **kwargs):
+        raise redis.ConnectionError("Lost the connection.")
+    redis_client._pubsub.get_message = get_message
+    try:
+        redis_service["KEYWORD"].modify("OTHERVALUE")
+        thread.join(timeout=1.0)
+        assert not thread.is_alive()
+    finally:
+        del redis_client._pubsub.get_message
+    
+    redis_service.redis.hset(redis_key_name(redis_service["KEYWORD"]), "value", "REDISVALUE")
+    assert keyword.read() == "REDISVALUE"
+    assert redis_client._thread.listening
+    assert keyword._cached
+    
+    redis_service["KEYWORD"].modify("LASTVALUE")
+    for i in range(100):
+        if keyword['ascii'] == "LASTVALUE":
+            break
+        time.sleep(0.01)
+    assert keyword.read() == "LASTVALUE"
+    